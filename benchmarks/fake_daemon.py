@@ -0,0 +1,1389 @@
+#!/usr/bin/python3
+"""
+Fake docker daemon serving a subset of docker engine API on a unix socket, used
+to benchmark nturt_docker without a real docker daemon.
+
+It serves a configurable number of containers and images, and sleeps for a
+configurable latency on every request to mimic a loaded daemon. nturt images
+can be pulled from a fake registry at a configurable bandwidth, with layers
+shared between images downloaded once like docker daemon does.
+
+Usage:
+    python3 benchmarks/fake_daemon.py SOCKET [-c CONTAINERS] [-i IMAGES]
+        [-l LATENCY] [-b BANDWIDTH]
+
+then point nturt_docker to it with DOCKER_HOST=unix://SOCKET.
+"""
+
+import argparse
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler
+import hashlib
+import io
+import json
+import os
+import queue
+import random
+import re
+import socketserver
+import tarfile
+import threading
+import time
+from typing import Callable
+from urllib.parse import parse_qs, urlparse
+
+API_VERSION = "1.43"
+
+NTURT_IMAGE_TAGS = [
+    "host-base", "host-devel", "host-driverless", "host-fake_data", "rpi-base",
+    "rpi-devel", "rpi-deploy", "jetson-base", "jetson-devel", "jetson-deploy"
+]
+
+
+def fake_id(seed: str) -> str:
+    """
+    Generate a deterministic 64 hex digits id
+
+    Parameters
+    ----------
+    seed (str): seed of the id
+
+    Returns
+    -------
+    str: id
+    """
+    return hashlib.sha256(seed.encode()).hexdigest()
+
+
+def registry_layers(tag: str) -> list[tuple[str, int]]:
+    """
+    Layers of a nturt image in the fake registry, images built from others
+    share their layers, e.g. host-devel has the layers of host-base
+
+    Parameters
+    ----------
+    tag (str): tag of nturacing/nturt_ros image
+
+    Returns
+    -------
+    list: list of (layer id, size in bytes)
+    """
+    target, distro = tag.split("-", 1)
+    names = ["ros-0", "ros-1", "ros-2", f"{target}-base"]
+    if distro != "base":
+        names.append(f"{target}-devel")
+    if distro not in ["base", "devel"]:
+        names.append(tag)
+    return [(fake_id(name), 5_000_000 + int(fake_id(name)[:4], 16) * 400)
+            for name in names]
+
+
+def iso_time(time_: datetime) -> str:
+    """
+    Format time like docker daemon does, with nanoseconds
+
+    Parameters
+    ----------
+    time_ (datetime): time
+
+    Returns
+    -------
+    str: formatted time
+    """
+    return time_.strftime("%Y-%m-%dT%H:%M:%S.%f") + "123Z"
+
+
+class FakeDocker:
+    """
+    State of the fake docker daemon
+    """
+
+    def __init__(self,
+                 num_containers: int,
+                 num_images: int,
+                 latency: float,
+                 stop_delay: float = 0.0,
+                 bandwidth: float = 100_000_000,
+                 stats_interval: float = 1.0):
+        """
+        Constructor
+
+        Parameters
+        ----------
+        num_containers (int): number of containers to serve
+        num_images (int): number of images to serve, the first ones are nturt
+            images
+        latency (float): seconds to sleep on every request
+        stop_delay (float): seconds a container takes to stop
+        bandwidth (float): bytes per second of every layer download
+        stats_interval (float): seconds between samples of stats streams
+        """
+        self.latency = latency
+        self.stop_delay = stop_delay
+        self.bandwidth = bandwidth
+        self.stats_interval = stats_interval
+        self.lock = threading.Lock()
+        self.requests = 0
+        # queues of events of every events subscription
+        self.subscribers = []
+        # exec id -> exec instance
+        self.execs = {}
+
+        # ids of downloaded layers, and events of layers being downloaded
+        self.layers = set()
+        self.downloads = {}
+        self.downloaded_bytes = 0
+
+        now = datetime.now(timezone.utc)
+
+        self.images = {}
+        for i in range(num_images):
+            if i < len(NTURT_IMAGE_TAGS):
+                tag = f"nturacing/nturt_ros:{NTURT_IMAGE_TAGS[i]}"
+                layers = registry_layers(NTURT_IMAGE_TAGS[i])
+            else:
+                tag = f"library/image{i}:latest"
+                layers = [(fake_id(tag), 1_000_000_000 + i * 1_000_000)]
+            image_id = "sha256:" + fake_id(tag)
+            self.images[image_id] = {
+                "Id": image_id,
+                "RepoTags": [tag],
+                "RepoDigests": [],
+                "Created": now - timedelta(days=i % 90),
+                "Size": sum(size for _, size in layers),
+                "Labels": {},
+                "Layers": layers,
+            }
+        image_ids = list(self.images)
+
+        self.build_cache = [{
+            "ID": fake_id(f"cache{i}")[:25],
+            "Type": "regular",
+            "Size": 100_000_000,
+            "InUse": False,
+            "Shared": False,
+            "LastUsedAt": iso_time(now - timedelta(days=i)),
+        } for i in range(5)]
+
+        self.containers = {}
+        for i in range(num_containers):
+            container_id = fake_id(f"container{i}")
+            image_id = image_ids[i % len(image_ids)] if image_ids else ""
+            created = now - timedelta(hours=i % 1000 + 1)
+            running = i % 3 == 0
+            image = self.images[image_id]["RepoTags"][0] if image_id else ""
+            finished = None if running else created + timedelta(minutes=30)
+            self.containers[container_id] = {
+                "Id": container_id,
+                "Name": f"container{i}",
+                "ImageID": image_id,
+                "Image": image,
+                "Created": created,
+                "Running": running,
+                "StartedAt": created + timedelta(minutes=1),
+                "FinishedAt": finished,
+                "Labels": {},
+                "Config": {},
+                "HostConfig": {},
+            }
+
+    def find_container(self, name_or_id: str) -> dict | None:
+        """
+        Find container by name or id prefix
+
+        Parameters
+        ----------
+        name_or_id (str): container name or id prefix
+
+        Returns
+        -------
+        dict | None: container, None if not found
+        """
+        # exact matches first so that lookups of large daemons stay cheap
+        container = self.containers.get(name_or_id)
+        if container is not None:
+            return container
+        for container in self.containers.values():
+            if container["Name"] == name_or_id:
+                return container
+        for container in self.containers.values():
+            if container["Id"].startswith(name_or_id):
+                return container
+        return None
+
+    def find_image(self, name_or_id: str) -> dict | None:
+        """
+        Find image by tag or id prefix
+
+        Parameters
+        ----------
+        name_or_id (str): image tag or id prefix
+
+        Returns
+        -------
+        dict | None: image, None if not found
+        """
+        image = self.images.get(name_or_id)
+        if image is not None:
+            return image
+        tagged = name_or_id if ":" in name_or_id else name_or_id + ":latest"
+        for image in self.images.values():
+            if tagged in image["RepoTags"]:
+                return image
+        prefix = name_or_id.removeprefix("sha256:")
+        for image in self.images.values():
+            if image["Id"].removeprefix("sha256:").startswith(prefix):
+                return image
+        return None
+
+    @staticmethod
+    def container_state(container: dict) -> str:
+        if container["Running"]:
+            return "running"
+        return "created" if container["StartedAt"] is None else "exited"
+
+    @staticmethod
+    def container_status(container: dict) -> str:
+        if container["Running"]:
+            return "Up 1 hour"
+        if container["StartedAt"] is None:
+            return "Created"
+        return "Exited (0) 2 hours ago"
+
+    def container_summary(self, container: dict) -> dict:
+        return {
+            "Id": container["Id"],
+            "Names": ["/" + container["Name"]],
+            "Image": container["Image"],
+            "ImageID": container["ImageID"],
+            "Command": "/nturt_ros_entrypoint.sh bash",
+            "Created": int(container["Created"].timestamp()),
+            "Ports": [],
+            "Labels": container["Labels"],
+            "State": self.container_state(container),
+            "Status": self.container_status(container),
+            "HostConfig": {
+                "NetworkMode": "default"
+            },
+            "NetworkSettings": {
+                "Networks": {}
+            },
+            "Mounts": [],
+        }
+
+    def container_inspect(self, container: dict) -> dict:
+        if container["FinishedAt"]:
+            finished = iso_time(container["FinishedAt"])
+        else:
+            finished = "0001-01-01T00:00:00Z"
+        if container["StartedAt"]:
+            started = iso_time(container["StartedAt"])
+        else:
+            started = "0001-01-01T00:00:00Z"
+        return {
+            "Id":
+            container["Id"],
+            "Name":
+            "/" + container["Name"],
+            "Created":
+            iso_time(container["Created"]),
+            "Path":
+            "/nturt_ros_entrypoint.sh",
+            "Args": ["bash"],
+            "State": {
+                "Status": self.container_state(container),
+                "Running": container["Running"],
+                "Paused": False,
+                "Restarting": False,
+                "ExitCode": 0,
+                "StartedAt": started,
+                "FinishedAt": finished,
+            },
+            "Image":
+            container["ImageID"],
+            "RestartCount":
+            0,
+            "HostConfig":
+            container["HostConfig"],
+            "Config": {
+                "Hostname": container["Name"],
+                **container["Config"],
+                "Image": container["Image"],
+                "Labels": container["Labels"],
+            },
+            "Mounts": [
+                self.mount(bind)
+                for bind in container["HostConfig"].get("Binds") or []
+            ],
+            "NetworkSettings": {
+                "Networks": {}
+            },
+        }
+
+    @staticmethod
+    def mount(bind: str) -> dict:
+        """
+        Mount of a container from a bind in SOURCE:DESTINATION[:MODE] format
+
+        Parameters
+        ----------
+        bind (str): bind of the container
+
+        Returns
+        -------
+        dict: mount of the container
+        """
+        source, destination = bind.split(":")[:2]
+        if source.startswith("/"):
+            return {
+                "Type": "bind",
+                "Source": source,
+                "Destination": destination
+            }
+        return {"Type": "volume", "Name": source, "Destination": destination}
+
+    @staticmethod
+    def container_stats(container: dict, sample: int, interval: float) -> dict:
+        """
+        Fake stats sample of a container, where every running container uses
+        a quarter of a cpu and does steady network and block io
+
+        Parameters
+        ----------
+        container (dict): container
+        sample (int): index of the sample in the stream
+        interval (float): seconds between samples
+
+        Returns
+        -------
+        dict: stats sample
+        """
+        if not container["Running"]:
+            return {
+                "read": "0001-01-01T00:00:00Z",
+                "cpu_stats": {
+                    "cpu_usage": {
+                        "total_usage": 0
+                    }
+                },
+                "precpu_stats": {
+                    "cpu_usage": {
+                        "total_usage": 0
+                    }
+                },
+                "memory_stats": {},
+            }
+
+        def cpu_stats(sample):
+            elapsed = int(sample * interval * 1e9) + 1_000_000_000
+            return {
+                "cpu_usage": {
+                    "total_usage": elapsed // 4
+                },
+                "system_cpu_usage": elapsed * 4,
+                "online_cpus": 4,
+            }
+
+        elapsed = sample * interval + 1
+        return {
+            "read": iso_time(datetime.now(timezone.utc)),
+            "cpu_stats": cpu_stats(sample),
+            "precpu_stats": cpu_stats(sample - 1) if sample else {
+                "cpu_usage": {
+                    "total_usage": 0
+                }
+            },
+            "memory_stats": {
+                "usage": 300_000_000,
+                "limit": 8_000_000_000,
+                "stats": {
+                    "inactive_file": 100_000_000
+                },
+            },
+            "networks": {
+                "eth0": {
+                    "rx_bytes": int(elapsed * 1_000_000),
+                    "tx_bytes": int(elapsed * 200_000),
+                }
+            },
+            "blkio_stats": {
+                "io_service_bytes_recursive": [
+                    {
+                        "op": "read",
+                        "value": int(elapsed * 50_000)
+                    },
+                    {
+                        "op": "write",
+                        "value": int(elapsed * 10_000)
+                    },
+                ]
+            },
+            "pids_stats": {
+                "current": 12
+            },
+        }
+
+    def image_summary(self, image: dict) -> dict:
+        return {
+            "Id": image["Id"],
+            "ParentId": "",
+            "RepoTags": image["RepoTags"],
+            "RepoDigests": image["RepoDigests"],
+            "Created": int(image["Created"].timestamp()),
+            "Size": image["Size"],
+            "SharedSize": -1,
+            "VirtualSize": image["Size"],
+            "Labels": image["Labels"],
+            "Containers": -1,
+        }
+
+    def download_layer(self, layer_id: str, size: int,
+                       report: Callable[[dict], None]) -> None:
+        """
+        Download a layer from the fake registry unless it is already
+        downloaded or being downloaded by another pull, which is waited for
+
+        Parameters
+        ----------
+        layer_id (str): layer id
+        size (int): layer size in bytes
+        report (Callable): function to report progress events
+        """
+        short_id = layer_id[:12]
+        with self.lock:
+            exists = layer_id in self.layers
+            download = self.downloads.get(layer_id)
+            owner = not exists and download is None
+            if owner:
+                download = self.downloads[layer_id] = threading.Event()
+
+        if exists:
+            report({"status": "Already exists", "id": short_id})
+            return
+        if not owner:
+            report({"status": "Waiting", "id": short_id})
+            download.wait()
+            report({"status": "Download complete", "id": short_id})
+            report({"status": "Pull complete", "id": short_id})
+            return
+
+        chunk = max(1, int(self.bandwidth * 0.05))
+        current = 0
+        while current < size:
+            time.sleep(min(chunk, size - current) / self.bandwidth)
+            current = min(size, current + chunk)
+            report({
+                "status": "Downloading",
+                "progressDetail": {
+                    "current": current,
+                    "total": size
+                },
+                "id": short_id
+            })
+        report({"status": "Download complete", "id": short_id})
+        report({"status": "Pull complete", "id": short_id})
+
+        with self.lock:
+            self.layers.add(layer_id)
+            self.downloaded_bytes += size
+            del self.downloads[layer_id]
+        download.set()
+
+    def publish(self, type_: str, action: str, actor_id: str,
+                attributes: dict) -> None:
+        """
+        Publish an event to every events subscription
+
+        Parameters
+        ----------
+        type_ (str): type of the object, e.g. "container" or "image"
+        action (str): action on the object, e.g. "start"
+        actor_id (str): id of the object
+        attributes (dict): attributes of the object, e.g. name and image
+        """
+        now = time.time_ns()
+        event = {
+            "Type": type_,
+            "Action": action,
+            "Actor": {
+                "ID": actor_id,
+                "Attributes": attributes
+            },
+            "scope": "local",
+            "time": now // 1_000_000_000,
+            "timeNano": now,
+        }
+        if type_ == "container":
+            event.update(status=action,
+                         id=actor_id,
+                         **{"from": attributes.get("image", "")})
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for subscriber in subscribers:
+            subscriber.put(event)
+
+    def disconnect_events(self) -> None:
+        """
+        End every events subscription like docker daemon does when it
+        restarts
+        """
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for subscriber in subscribers:
+            subscriber.put(None)
+
+    def publish_container(self, container: dict, *actions: str) -> None:
+        """
+        Publish events of a container
+
+        Parameters
+        ----------
+        container (dict): container
+        actions (str): actions on the container
+        """
+        for action in actions:
+            self.publish(
+                "container", action, container["Id"],
+                dict(container["Labels"],
+                     name=container["Name"],
+                     image=container["Image"]))
+
+    def add_image(self, tag: str, layers: list[tuple[str, int]]) -> None:
+        """
+        Add or replace a pulled image
+
+        Parameters
+        ----------
+        tag (str): image tag
+        layers (list): list of (layer id, size in bytes)
+        """
+        image_id = "sha256:" + fake_id("".join(layer for layer, _ in layers))
+        with self.lock:
+            self.untag(tag)
+            image = self.images.setdefault(
+                image_id, {
+                    "Id": image_id,
+                    "RepoTags": [],
+                    "RepoDigests": [],
+                    "Created": datetime.now(timezone.utc),
+                    "Size": sum(size for _, size in layers),
+                    "Labels": {},
+                    "Layers": layers,
+                })
+            image["RepoTags"].append(tag)
+        self.publish("image", "pull", tag, {"name": tag})
+
+    def untag(self, tag: str) -> None:
+        """
+        Remove a tag from the image having it, called with lock held
+
+        Parameters
+        ----------
+        tag (str): image tag
+        """
+        for image in self.images.values():
+            if tag in image["RepoTags"]:
+                image["RepoTags"].remove(tag)
+
+    def disk_usage(self) -> dict:
+        layer_images = {}
+        for image in self.images.values():
+            for layer in image["Layers"]:
+                layer_images.setdefault(layer, []).append(image["Id"])
+        containers = {}
+        for container in self.containers.values():
+            containers[container["ImageID"]] = containers.get(
+                container["ImageID"], 0) + 1
+
+        images = []
+        for image in self.images.values():
+            summary = self.image_summary(image)
+            summary["SharedSize"] = sum(size for layer, size in image["Layers"]
+                                        if len(layer_images[(layer,
+                                                             size)]) > 1)
+            summary["Containers"] = containers.get(image["Id"], 0)
+            images.append(summary)
+
+        return {
+            "LayersSize":
+            sum(size for _, size in layer_images),
+            "Images":
+            images,
+            "Containers": [
+                dict(self.container_summary(container),
+                     SizeRw=self.container_size(container))
+                for container in self.containers.values()
+            ],
+            "Volumes": [],
+            "BuildCache":
+            self.build_cache,
+        }
+
+    @staticmethod
+    def container_size(container: dict) -> int:
+        return int(container["Id"][:2], 16) * 100_000
+
+    def image_history(self, image: dict) -> list[dict]:
+        history = []
+        for layer_id, size in image["Layers"]:
+            history.append({
+                "Id":
+                "<missing>",
+                "Created":
+                int(image["Created"].timestamp()),
+                "CreatedBy":
+                f"RUN /bin/sh -c install {layer_id[:12]} "
+                "# buildkit",
+                "Size":
+                size,
+                "Comment":
+                "buildkit.dockerfile.v0",
+            })
+            # instructions without a layer are listed with zero size
+            history.append({
+                "Id": "<missing>",
+                "Created": int(image["Created"].timestamp()),
+                "CreatedBy": f"ENV LAYER={layer_id[:12]}",
+                "Size": 0,
+                "Comment": "buildkit.dockerfile.v0",
+            })
+        history[-1]["Id"] = image["Id"]
+        return list(reversed(history))
+
+    def save_images(self, images: list[dict]) -> bytes:
+        """
+        Save images in oci layout like docker 25 or newer does, where layers
+        are blobs of 1/100 of their sizes named by their diff ids
+
+        Parameters
+        ----------
+        images (list): images to save
+
+        Returns
+        -------
+        bytes: tar archive
+        """
+        output = io.BytesIO()
+        with tarfile.open(fileobj=output, mode="w") as archive:
+
+            def add(name, data):
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                archive.addfile(info, io.BytesIO(data))
+
+            manifest, repositories, saved = [], {}, set()
+            for image in images:
+                for layer, size in image["Layers"]:
+                    if layer not in saved:
+                        saved.add(layer)
+                        add(f"blobs/sha256/{layer}",
+                            random.Random(layer).randbytes(size // 100))
+                config = json.dumps({
+                    "rootfs": {
+                        "type":
+                        "layers",
+                        "diff_ids":
+                        ["sha256:" + layer for layer, _ in image["Layers"]]
+                    }
+                }).encode()
+                add(f"blobs/sha256/{image['Id'].removeprefix('sha256:')}",
+                    config)
+                manifest.append({
+                    "Config":
+                    f"blobs/sha256/{image['Id'].removeprefix('sha256:')}",
+                    "RepoTags":
+                    image["RepoTags"],
+                    "Layers":
+                    [f"blobs/sha256/{layer}" for layer, _ in image["Layers"]],
+                })
+                for tag in image["RepoTags"]:
+                    repository, _, name = tag.rpartition(":")
+                    repositories.setdefault(
+                        repository,
+                        {})[name] = (image["Id"].removeprefix("sha256:"))
+            add("manifest.json", json.dumps(manifest).encode())
+            add("oci-layout", b'{"imageLayoutVersion": "1.0.0"}')
+            add("repositories", json.dumps(repositories).encode())
+        return output.getvalue()
+
+    def load_images(self, archive: bytes) -> list[str]:
+        """
+        Load images saved in oci layout, where layers the daemon already has
+        may be left out like docker load allows
+
+        Parameters
+        ----------
+        archive (bytes): tar archive
+
+        Returns
+        -------
+        list: tags of loaded images
+        """
+        with tarfile.open(fileobj=io.BytesIO(archive), mode="r") as tar:
+            names = set(tar.getnames())
+            manifest = json.load(tar.extractfile("manifest.json"))
+            repositories = (json.load(tar.extractfile("repositories"))
+                            if "repositories" in names else {})
+            blob_sizes = {
+                member.name.rpartition("/")[2]: member.size
+                for member in tar.getmembers()
+            }
+
+        with self.lock:
+            sizes = {
+                layer: size
+                for image in self.images.values()
+                for layer, size in image["Layers"]
+            }
+        # tags are loaded from manifest.json, but tools reading repositories
+        # like older docker see only the tags listed there
+        for entry in manifest:
+            for tag in entry["RepoTags"]:
+                repository, _, name = tag.rpartition(":")
+                if repositories and name not in repositories.get(
+                        repository, {}):
+                    raise KeyError(f"{tag} is not in repositories")
+
+        loaded = []
+        for entry in manifest:
+            layers = []
+            for path in entry["Layers"]:
+                layer = path.rpartition("/")[2]
+                if path not in names and layer not in sizes:
+                    raise FileNotFoundError(f"open {path}: no such file")
+                layers.append(
+                    (layer, sizes.get(layer,
+                                      blob_sizes.get(layer, 0) * 100)))
+            for tag in entry["RepoTags"]:
+                self.add_image(tag, layers)
+                loaded.append(tag)
+        return loaded
+
+    def image_inspect(self, image: dict) -> dict:
+        return {
+            "Id": image["Id"],
+            "RepoTags": image["RepoTags"],
+            "RepoDigests": image["RepoDigests"],
+            "Created": iso_time(image["Created"]),
+            "Size": image["Size"],
+            "VirtualSize": image["Size"],
+            "Architecture": "amd64",
+            "Os": "linux",
+            "Config": {
+                "Labels": image["Labels"]
+            },
+            "RootFS": {
+                "Type": "layers",
+                "Layers": ["sha256:" + layer for layer, _ in image["Layers"]]
+            },
+        }
+
+
+class FakeDockerHandler(BaseHTTPRequestHandler):
+    """
+    Request handler of the fake docker daemon
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    # (method, path regex, handler method name), path without version prefix
+    ROUTES = [
+        ("GET", r"/_ping", "ping"),
+        ("GET", r"/version", "version"),
+        ("GET", r"/containers/json", "list_containers"),
+        ("GET", r"/containers/(?P<id>[^/]+)/json", "inspect_container"),
+        ("POST", r"/containers/create", "create_container"),
+        ("POST", r"/containers/(?P<id>[^/]+)/start", "start_container"),
+        ("POST", r"/containers/(?P<id>[^/]+)/stop", "stop_container"),
+        ("POST", r"/containers/(?P<id>[^/]+)/restart", "restart_container"),
+        ("GET", r"/containers/(?P<id>[^/]+)/stats", "container_stats"),
+        ("POST", r"/containers/(?P<id>[^/]+)/exec", "create_exec"),
+        ("POST", r"/exec/(?P<id>[^/]+)/start", "start_exec"),
+        ("GET", r"/exec/(?P<id>[^/]+)/json", "inspect_exec"),
+        ("DELETE", r"/containers/(?P<id>[^/]+)", "remove_container"),
+        ("GET", r"/images/json", "list_images"),
+        ("GET", r"/images/(?P<id>.+)/json", "inspect_image"),
+        ("GET", r"/images/(?P<id>.+)/history", "image_history"),
+        ("GET", r"/images/(?P<id>.+)/get", "save_image"),
+        ("POST", r"/images/create", "pull_image"),
+        ("GET", r"/images/get", "save_images"),
+        ("POST", r"/images/load", "load_images"),
+        ("POST", r"/images/(?P<id>.+)/tag", "tag_image"),
+        ("DELETE", r"/images/(?P<id>.+)", "remove_image"),
+        ("GET", r"/system/df", "disk_usage"),
+        ("GET", r"/events", "events"),
+        ("POST", r"/build/prune", "prune_builds"),
+    ]
+
+    @property
+    def docker(self) -> FakeDocker:
+        return self.server.docker
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, data, status: int = 200) -> None:
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def start_chunked(self) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+    def send_chunk(self, data: dict | None) -> None:
+        # None ends the response
+        body = json.dumps(data).encode() + b"\r\n" if data else b""
+        self.wfile.write(f"{len(body):x}\r\n".encode() + body + b"\r\n")
+        self.wfile.flush()
+
+    def send_not_found(self, what: str) -> None:
+        self.send_json({"message": f"No such {what}"}, 404)
+
+    def dispatch(self, method: str) -> None:
+        url = urlparse(self.path)
+        path = re.sub(r"^/v\d+\.\d+", "", url.path)
+        self.query = {
+            key: values[-1]
+            for key, values in parse_qs(url.query).items()
+        }
+        length = int(self.headers.get("Content-Length", 0))
+        self.body = self.rfile.read(length) if length else b""
+
+        with self.docker.lock:
+            self.docker.requests += 1
+        time.sleep(self.docker.latency)
+
+        for route_method, pattern, handler in self.ROUTES:
+            match = re.fullmatch(pattern, path)
+            if route_method == method and match:
+                getattr(self, handler)(**match.groupdict())
+                return
+        self.send_json({"message": f"page not found: {path}"}, 404)
+
+    def do_GET(self):
+        self.dispatch("GET")
+
+    def do_POST(self):
+        self.dispatch("POST")
+
+    def do_DELETE(self):
+        self.dispatch("DELETE")
+
+    def ping(self):
+        body = b"OK"
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain")
+        self.send_header("Api-Version", API_VERSION)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def version(self):
+        self.send_json({
+            "Version": "24.0.0",
+            "ApiVersion": API_VERSION,
+            "MinAPIVersion": "1.12",
+            "Os": "linux",
+            "Arch": "amd64",
+        })
+
+    def list_containers(self):
+        containers = self.docker.containers.values()
+        if self.query.get("all") not in ["1", "true", "True"]:
+            containers = [c for c in containers if c["Running"]]
+        self.send_json([self.docker.container_summary(c) for c in containers])
+
+    def inspect_container(self, id):
+        container = self.docker.find_container(id)
+        if container is None:
+            return self.send_not_found(f"container: {id}")
+        self.send_json(self.docker.container_inspect(container))
+
+    def container_stats(self, id):
+        container = self.docker.find_container(id)
+        if container is None:
+            return self.send_not_found(f"container: {id}")
+        interval = self.docker.stats_interval
+        if self.query.get("stream") in ["0", "false", "False"]:
+            # the daemon waits for a second sample to compute cpu usage
+            if self.query.get("one-shot") not in ["1", "true", "True"]:
+                time.sleep(interval)
+            return self.send_json(
+                self.docker.container_stats(container, 1, interval))
+
+        self.start_chunked()
+        sample = 0
+        try:
+            # streams end when the container stops or is removed
+            while container["Running"] and container["Id"] in (
+                    self.docker.containers):
+                self.send_chunk(
+                    self.docker.container_stats(container, sample, interval))
+                sample += 1
+                time.sleep(interval)
+            self.send_chunk(None)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def events(self):
+        filters = json.loads(self.query.get("filters", "{}"))
+
+        def matches(event):
+            # filter values are lists, or dicts of value to true in old clients
+            for key, field in [("type", "Type"), ("event", "Action")]:
+                if key in filters and event[field] not in filters[key]:
+                    return False
+            return True
+
+        subscriber = queue.Queue()
+        with self.docker.lock:
+            self.docker.subscribers.append(subscriber)
+        self.start_chunked()
+        try:
+            while True:
+                event = subscriber.get()
+                if event is None:
+                    self.send_chunk(None)
+                    return
+                if matches(event):
+                    self.send_chunk(event)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            with self.docker.lock:
+                self.docker.subscribers.remove(subscriber)
+
+    def create_exec(self, id):
+        container = self.docker.find_container(id)
+        if container is None:
+            return self.send_not_found(f"container: {id}")
+        if not container["Running"]:
+            return self.send_json(
+                {"message": f"container {id} is not running"}, 409)
+        exec_id = fake_id(f"exec{id}{time.time()}")
+        with self.docker.lock:
+            self.docker.execs[exec_id] = {
+                "ID": exec_id,
+                "ContainerID": container["Id"],
+                "Name": container["Name"],
+                "Cmd": json.loads(self.body)["Cmd"],
+                "ExitCode": None,
+            }
+        self.send_json({"Id": exec_id}, 201)
+
+    def start_exec(self, id):
+        instance = self.docker.execs.get(id)
+        if instance is None:
+            return self.send_not_found(f"exec instance: {id}")
+
+        # commands understood by the fake daemon, anything else is not found
+        command, *arguments = instance["Cmd"]
+        stdout = stderr = b""
+        exit_code = 0
+        if command == "echo":
+            stdout = " ".join(arguments).encode() + b"\n"
+        elif command == "hostname":
+            stdout = instance["Name"].encode() + b"\n"
+        elif command == "sleep":
+            time.sleep(float(arguments[0]))
+        elif command == "false":
+            exit_code = 1
+        elif command == "chown":
+            pass
+        elif command == "ccache":
+            # every build hits the cache for 3 of 4 compilations
+            if arguments == ["--print-stats"]:
+                stdout = (b"direct_cache_hit\t30\npreprocessed_cache_hit\t0\n"
+                          b"cache_miss\t10\n")
+        elif command == "bash" and "colcon build" in arguments[-1]:
+            time.sleep(0.05)
+            stdout = (b"Starting >>> nturt_example\n"
+                      b"Finished <<< nturt_example [0.05s]\n\n"
+                      b"Summary: 1 package finished [0.05s]\n")
+        else:
+            stderr = f"{command}: command not found\n".encode()
+            exit_code = 127
+
+        # raw stream multiplexing stdout and stderr by 8 byte headers, ended
+        # by closing the connection
+        self.send_response(200)
+        self.send_header("Content-Type", "application/vnd.docker.raw-stream")
+        self.end_headers()
+        self.wfile.flush()
+        # clients read the stream from the socket under buffered http response,
+        # so output sent with headers would be buffered and lost
+        time.sleep(0.01)
+        for stream, data in [(1, stdout), (2, stderr)]:
+            if data:
+                self.wfile.write(
+                    bytes([stream, 0, 0, 0]) + len(data).to_bytes(4, "big") +
+                    data)
+        self.wfile.flush()
+        instance["ExitCode"] = exit_code
+        self.close_connection = True
+
+    def inspect_exec(self, id):
+        instance = self.docker.execs.get(id)
+        if instance is None:
+            return self.send_not_found(f"exec instance: {id}")
+        self.send_json({
+            "ID": instance["ID"],
+            "ContainerID": instance["ContainerID"],
+            "Running": instance["ExitCode"] is None,
+            "ExitCode": instance["ExitCode"],
+        })
+
+    def send_no_content(self, status: int = 204) -> None:
+        self.send_response(status)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def create_container(self):
+        config = json.loads(self.body)
+        name = self.query.get("name")
+        image = self.docker.find_image(config["Image"])
+        if image is None:
+            return self.send_not_found(f"image: {config['Image']}")
+        container_id = fake_id(f"{name}{time.time()}")
+        with self.docker.lock:
+            if name and any(container["Name"] == name
+                            for container in self.docker.containers.values()):
+                return self.send_json(
+                    {
+                        "message":
+                        f'Conflict. The container name "/{name}" '
+                        "is already in use"
+                    }, 409)
+            self.docker.containers[container_id] = {
+                "Id": container_id,
+                "Name": name or container_id[:12],
+                "ImageID": image["Id"],
+                "Image": config["Image"],
+                "Created": datetime.now(timezone.utc),
+                "Running": False,
+                "StartedAt": None,
+                "FinishedAt": None,
+                "Labels": config.get("Labels") or {},
+                "Config": {
+                    key: value
+                    for key, value in config.items() if key != "HostConfig"
+                },
+                "HostConfig": config.get("HostConfig") or {},
+            }
+        self.docker.publish_container(self.docker.containers[container_id],
+                                      "create")
+        self.send_json({"Id": container_id, "Warnings": []}, 201)
+
+    def start_container(self, id):
+        container = self.docker.find_container(id)
+        if container is None:
+            return self.send_not_found(f"container: {id}")
+        if container["Running"]:
+            return self.send_no_content(304)
+        container["Running"] = True
+        container["StartedAt"] = datetime.now(timezone.utc)
+        self.docker.publish_container(container, "start")
+        self.send_no_content()
+
+    def stop_container(self, id):
+        container = self.docker.find_container(id)
+        if container is None:
+            return self.send_not_found(f"container: {id}")
+        if not container["Running"]:
+            return self.send_no_content(304)
+        time.sleep(self.docker.stop_delay)
+        container["Running"] = False
+        container["FinishedAt"] = datetime.now(timezone.utc)
+        self.docker.publish_container(container, "die", "stop")
+        self.send_no_content()
+
+    def restart_container(self, id):
+        container = self.docker.find_container(id)
+        if container is None:
+            return self.send_not_found(f"container: {id}")
+        if container["Running"]:
+            time.sleep(self.docker.stop_delay)
+            self.docker.publish_container(container, "die")
+        container["Running"] = True
+        container["StartedAt"] = datetime.now(timezone.utc)
+        self.docker.publish_container(container, "start", "restart")
+        self.send_no_content()
+
+    def remove_container(self, id):
+        container = self.docker.find_container(id)
+        if container is None:
+            return self.send_not_found(f"container: {id}")
+        force = self.query.get("force") in ["1", "true", "True"]
+        if container["Running"] and not force:
+            return self.send_json(
+                {"message": "cannot remove container: container is running"},
+                409)
+        with self.docker.lock:
+            del self.docker.containers[container["Id"]]
+        if container["Running"]:
+            self.docker.publish_container(container, "kill", "die")
+        self.docker.publish_container(container, "destroy")
+        self.send_no_content()
+
+    def list_images(self):
+        self.send_json([
+            self.docker.image_summary(i) for i in self.docker.images.values()
+        ])
+
+    def inspect_image(self, id):
+        image = self.docker.find_image(id)
+        if image is None:
+            return self.send_not_found(f"image: {id}")
+        self.send_json(self.docker.image_inspect(image))
+
+    def disk_usage(self):
+        with self.docker.lock:
+            self.send_json(self.docker.disk_usage())
+
+    def prune_builds(self):
+        keep_storage = int(self.query.get("keep-storage", 0))
+        deleted = []
+        reclaimed = 0
+        with self.docker.lock:
+            cache = sorted(self.docker.build_cache,
+                           key=lambda record: record["LastUsedAt"])
+            total = sum(record["Size"] for record in cache)
+            while cache and total > keep_storage:
+                record = cache.pop(0)
+                self.docker.build_cache.remove(record)
+                deleted.append(record["ID"])
+                reclaimed += record["Size"]
+                total -= record["Size"]
+        self.send_json({"CachesDeleted": deleted, "SpaceReclaimed": reclaimed})
+
+    def image_history(self, id):
+        image = self.docker.find_image(id)
+        if image is None:
+            return self.send_not_found(f"image: {id}")
+        self.send_json(self.docker.image_history(image))
+
+    def save_image(self, id):
+        self.save_images([id])
+
+    def save_images(self, names: list[str] | None = None):
+        if names is None:
+            names = parse_qs(urlparse(self.path).query).get("names", [])
+        images = []
+        for name in names:
+            image = self.docker.find_image(name)
+            if image is None:
+                return self.send_not_found(f"image: {name}")
+            images.append(image)
+
+        archive = self.docker.save_images(images)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-tar")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for offset in range(0, len(archive), 65536):
+            block = archive[offset:offset + 65536]
+            self.wfile.write(f"{len(block):x}\r\n".encode() + block + b"\r\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def read_chunked_body(self) -> bytes:
+        """
+        Read request body sent with chunked transfer encoding, e.g. by
+        streaming uploads
+
+        Returns
+        -------
+        bytes: request body
+        """
+        body = b""
+        while True:
+            size = int(self.rfile.readline().strip(), 16)
+            body += self.rfile.read(size)
+            self.rfile.readline()
+            if size == 0:
+                return body
+
+    def load_images(self):
+        if self.headers.get("Transfer-Encoding") == "chunked":
+            self.body = self.read_chunked_body()
+        self.start_chunked()
+        try:
+            for tag in self.docker.load_images(self.body):
+                self.send_chunk({"stream": f"Loaded image: {tag}\n"})
+        except (FileNotFoundError, tarfile.TarError, KeyError) as error:
+            self.send_chunk({
+                "errorDetail": {
+                    "message": str(error)
+                },
+                "error": str(error)
+            })
+        self.send_chunk(None)
+
+    def pull_image(self):
+        repository = self.query.get("fromImage", "")
+        tag = self.query.get("tag", "latest")
+        # any registry serves nturt images, e.g. a local mirror
+        name = repository
+        if "/" in name and any(c in name.split("/")[0] for c in ".:"):
+            name = name.split("/", 1)[1]
+        if name != "nturacing/nturt_ros" or tag not in NTURT_IMAGE_TAGS:
+            return self.send_not_found(
+                f"manifest for {repository}:{tag}, manifest unknown")
+
+        layers = registry_layers(tag)
+        self.start_chunked()
+        self.send_chunk({"status": f"Pulling from {name}", "id": tag})
+        for layer_id, _ in layers:
+            self.send_chunk({
+                "status": "Pulling fs layer",
+                "id": layer_id[:12]
+            })
+        for layer_id, size in layers:
+            self.docker.download_layer(layer_id, size, self.send_chunk)
+        self.docker.add_image(f"{repository}:{tag}", layers)
+        self.send_chunk({"status": "Digest: sha256:" + fake_id(tag)})
+        self.send_chunk({
+            "status":
+            f"Status: Downloaded newer image for {repository}:{tag}"
+        })
+        self.send_chunk(None)
+
+    def tag_image(self, id):
+        image = self.docker.find_image(id)
+        if image is None:
+            return self.send_not_found(f"image: {id}")
+        tag = f"{self.query['repo']}:{self.query.get('tag', 'latest')}"
+        with self.docker.lock:
+            self.docker.untag(tag)
+            image["RepoTags"].append(tag)
+        self.docker.publish("image", "tag", image["Id"], {"name": tag})
+        self.send_no_content(201)
+
+    def remove_image(self, id):
+        image = self.docker.find_image(id)
+        if image is None:
+            return self.send_not_found(f"image: {id}")
+        with self.docker.lock:
+            if id in image["RepoTags"] and len(image["RepoTags"]) > 1:
+                image["RepoTags"].remove(id)
+                untagged = True
+            else:
+                del self.docker.images[image["Id"]]
+                untagged = False
+        if untagged:
+            self.docker.publish("image", "untag", image["Id"], {"name": id})
+            return self.send_json([{"Untagged": id}])
+        self.docker.publish("image", "delete", image["Id"], {"name": id})
+        self.send_json([{"Deleted": image["Id"]}])
+
+
+class FakeDockerServer(socketserver.ThreadingMixIn,
+                       socketserver.UnixStreamServer):
+    """
+    Fake docker daemon server
+    """
+
+    daemon_threads = True
+    # concurrent jobs and processes connect at once, like to docker daemon
+    request_queue_size = 128
+
+    def __init__(self, socket_path: str, docker: FakeDocker):
+        """
+        Constructor
+
+        Parameters
+        ----------
+        socket_path (str): path to unix socket to listen on
+        docker (FakeDocker): state of the fake docker daemon
+        """
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        super().__init__(socket_path, FakeDockerHandler)
+        self.docker = docker
+
+    def get_request(self):
+        # unix sockets have no client address, which http.server expects
+        request, _ = super().get_request()
+        return request, ("fake", 0)
+
+
+def start_fake_daemon(socket_path: str,
+                      num_containers: int = 100,
+                      num_images: int = 20,
+                      latency: float = 0.0005,
+                      stop_delay: float = 0.0,
+                      bandwidth: float = 100_000_000) -> FakeDockerServer:
+    """
+    Start fake docker daemon in a background thread
+
+    Parameters
+    ----------
+    socket_path (str): path to unix socket to listen on
+    num_containers (int): number of containers to serve
+    num_images (int): number of images to serve
+    latency (float): seconds to sleep on every request
+    stop_delay (float): seconds a container takes to stop
+    bandwidth (float): bytes per second of every layer download
+
+    Returns
+    -------
+    FakeDockerServer: running server, call shutdown() to stop it
+    """
+    server = FakeDockerServer(
+        socket_path,
+        FakeDocker(num_containers, num_images, latency, stop_delay, bandwidth))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("socket", help="unix socket to listen on")
+    parser.add_argument("-c",
+                        "--containers",
+                        help="number of containers, default to 100",
+                        type=int,
+                        default=100)
+    parser.add_argument("-i",
+                        "--images",
+                        help="number of images, default to 20",
+                        type=int,
+                        default=20)
+    parser.add_argument(
+        "-l",
+        "--latency",
+        help="latency of every request in seconds, default to 0.0005",
+        type=float,
+        default=0.0005)
+    parser.add_argument("-s",
+                        "--stop-delay",
+                        help="seconds a container takes to stop, default to 0",
+                        type=float,
+                        default=0.0)
+    parser.add_argument(
+        "-b",
+        "--bandwidth",
+        help="bytes per second of every layer download, default to 100000000",
+        type=float,
+        default=100_000_000)
+    args = parser.parse_args()
+
+    server = FakeDockerServer(
+        args.socket,
+        FakeDocker(args.containers, args.images, args.latency, args.stop_delay,
+                   args.bandwidth))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        os.remove(args.socket)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,583 @@
+#!/usr/bin/python3
+"""
+Benchmark suite of nturt_docker of a target checkout against fake docker
+daemons, with results written as JSON so that they can be compared between
+commits.
+
+nturt_docker.py of the target is only run as a command line tool in new
+processes, from a temporary copy so that bind mount directories of created
+containers do not end up in the target, hence the suite of one checkout can
+measure any revision checked out as a git worktree. Benchmarks a revision does
+not support fail and are reported so, without stopping the suite.
+
+The following are measured:
+
+- startup: commands that do not need docker daemon, with docker daemon
+  unreachable
+- for every size, against a fake docker daemon serving that many containers and
+  images:
+  - cold start: "container list" and "image list"
+  - completion: completing arguments of commands, with and without completion
+    cache
+  - bulk lifecycle: creating and removing up to --bulk containers one by one
+    and concurrently, stopping, starting and restarting every container
+  - served: cold start and completion with "nturt_docker serve" running
+- image pull: pulling all nturt images from the fake registry one by one and
+  concurrently
+- image archive: exporting all nturt images to an archive and importing it,
+  which fails if the archive lacks tags of any image
+
+Usage:
+    python3 benchmarks/suite.py [-t TARGET] [-s SIZES] [-n RUNS] [-l LATENCY]
+        [-b BULK] [-j JOBS] [--bandwidth BANDWIDTH] [--skip-pull]
+        [-o OUTPUT] [--compare BASELINE] [--threshold PERCENT]
+"""
+
+import argparse
+from datetime import datetime, timezone
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable
+
+sys.path.insert(0, os.path.dirname(os.path.realpath(__file__)))
+
+from fake_daemon import start_fake_daemon
+
+NTURT_DOCKER_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+RESULTS_DIR = os.path.join(NTURT_DOCKER_DIR, "benchmarks", "results")
+
+# commands that do not need docker daemon
+STARTUP = [
+    ["pwd"],
+    ["--version"],
+    ["--help"],
+    ["container", "--help"],
+    ["image", "build", "--help"],
+]
+
+# command lines to complete, the last argument is completed
+COMPLETIONS = [
+    "container start ",
+    "container stop ",
+    "container remove ",
+    "container shell ",
+    "container create bench ",
+    "image build ",
+]
+
+# command lines of bulk lifecycle operations, and command lines run before them
+# so that they operate on every container
+LIFECYCLE = [
+    (["container", "stop", "--all"], ["container", "start", "--all"]),
+    (["container", "start", "--all"], ["container", "stop", "--all"]),
+    (["container", "restart", "--all"], ["container", "start", "--all"]),
+]
+
+
+def install(target: str, tmp_dir: str) -> str:
+    """
+    Copy nturt_docker.py of the target to a temporary directory, with its
+    Dockerfile and docker-compose directories linked beside it
+
+    Parameters
+    ----------
+    target (str): directory of the checkout to benchmark
+    tmp_dir (str): directory to copy to
+
+    Returns
+    -------
+    str: path to the copied nturt_docker.py
+    """
+    install_dir = os.path.join(tmp_dir, "nturt_docker")
+    os.makedirs(install_dir)
+    script = os.path.join(install_dir, "nturt_docker.py")
+    shutil.copy(os.path.join(target, "nturt_docker.py"), script)
+    for name in ["Dockerfile", "docker-compose"]:
+        os.symlink(os.path.join(target, name), os.path.join(install_dir, name))
+    return script
+
+
+class Suite:
+    """
+    Benchmarks running nturt_docker in new processes, optionally against a fake
+    docker daemon
+    """
+
+    def __init__(self, script: str, tmp_dir: str, runs: int):
+        """
+        Constructor
+
+        Parameters
+        ----------
+        script (str): path to nturt_docker.py to run
+        tmp_dir (str): directory of sockets and caches
+        runs (int): number of runs of every measurement
+        """
+        self.script = script
+        self.tmp_dir = tmp_dir
+        self.runs = runs
+        self.server = None
+        self.socket_path = os.path.join(tmp_dir, "docker.sock")
+        self.cache_dir = os.path.join(tmp_dir, "cache")
+
+        # caches and the socket of "serve" are isolated from the user's ones,
+        # docker daemon is unreachable until started
+        self.env = dict(os.environ,
+                        DOCKER_HOST="unix://" + self.socket_path,
+                        XDG_CACHE_HOME=self.cache_dir,
+                        XDG_RUNTIME_DIR=tmp_dir)
+
+    def start(self, **kwargs) -> None:
+        """
+        Start a fake docker daemon, replacing the running one
+
+        Parameters
+        ----------
+        **kwargs: arguments of start_fake_daemon
+        """
+        self.stop()
+        self.server = start_fake_daemon(self.socket_path, **kwargs)
+
+    def stop(self) -> None:
+        """
+        Stop the fake docker daemon if running
+        """
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def measure(self,
+                function: Callable[[], None],
+                setup: Callable[[], None] | None = None) -> dict:
+        """
+        Measure wall time and docker daemon requests of a function
+
+        Parameters
+        ----------
+        function (Callable): function to measure
+        setup (Callable): function called before every run, not measured
+
+        Returns
+        -------
+        dict: median and min wall time in milliseconds, and median number of
+            requests to docker daemon if running, or the error if failed
+        """
+        times = []
+        requests = []
+        try:
+            for _ in range(self.runs):
+                if setup is not None:
+                    setup()
+                count = self.server.docker.requests if self.server else 0
+                start = time.perf_counter()
+                function()
+                times.append((time.perf_counter() - start) * 1000)
+                if self.server is not None:
+                    requests.append(self.server.docker.requests - count)
+        except RuntimeError as error:
+            return {"error": str(error)}
+
+        result = {"median_ms": statistics.median(times), "min_ms": min(times)}
+        if requests:
+            result["requests"] = statistics.median(requests)
+        return result
+
+    def cli(self, argv: list[str], env: dict | None = None) -> None:
+        """
+        Run nturt_docker in a new process, output is only kept on failure
+
+        Parameters
+        ----------
+        argv (list): command line arguments
+        env (dict): extra environment variables
+        """
+        result = subprocess.run([sys.executable, self.script] + argv,
+                                env=dict(self.env, **(env or {})),
+                                capture_output=True,
+                                text=True)
+        if result.returncode != 0:
+            # errors are printed to stdout, and usage errors to stderr
+            error = (result.stderr + result.stdout).strip().splitlines()
+            raise RuntimeError(f"\"{' '.join(argv[:3])}\" failed"
+                               f"{': ' + error[-1] if error else ''}")
+
+    def complete(self, line: str) -> None:
+        """
+        Complete the last argument of a command line in a new process, like
+        shell completion does
+
+        Parameters
+        ----------
+        line (str): command line without "nturt_docker"
+        """
+        line = "nturt_docker " + line
+        output = os.path.join(self.tmp_dir, "completion.out")
+        self.cli(
+            [], {
+                "_ARGCOMPLETE": "1",
+                "COMP_LINE": line,
+                "COMP_POINT": str(len(line)),
+                "_ARGCOMPLETE_STDOUT_FILENAME": output
+            })
+        with open(output, "r") as f:
+            if not f.read():
+                raise RuntimeError(f"nothing completed for \"{line}\"")
+
+    def remove_cache(self) -> None:
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def run_startup(self) -> dict:
+        """
+        Run startup benchmarks with docker daemon unreachable
+
+        Returns
+        -------
+        dict: benchmark name -> result
+        """
+        self.stop()
+        return {
+            " ".join(argv): self.measure(lambda: self.cli(argv))
+            for argv in STARTUP
+        }
+
+    def run_size(self, size: int, latency: float, bulk: int,
+                 jobs: int) -> dict:
+        """
+        Run benchmarks against a fake docker daemon serving a number of
+        containers and images
+
+        Parameters
+        ----------
+        size (int): number of containers and images served
+        latency (float): seconds the fake daemon sleeps on every request
+        bulk (int): maximum number of containers created and removed
+        jobs (int): number of containers created and removed concurrently
+
+        Returns
+        -------
+        dict: benchmark name -> result
+        """
+        # nturt images are the first 10 images of the fake daemon
+        self.start(num_containers=size,
+                   num_images=max(size, 10),
+                   latency=latency)
+        self.remove_cache()
+        results = {}
+
+        for argv in [["container", "list"], ["image", "list"]]:
+            results[f"cold start: {' '.join(argv)}"] = self.measure(
+                lambda: self.cli(argv))
+
+        for line in COMPLETIONS:
+            results[f"completion: {line.strip()}"] = self.measure(
+                lambda: self.complete(line), self.remove_cache)
+            results[f"completion cached: {line.strip()}"] = self.measure(
+                lambda: self.complete(line))
+
+        # created containers are removed again, so that other benchmarks see
+        # the same containers
+        names = [f"bench{i}" for i in range(min(size, bulk))]
+        create = ["container", "create"
+                  ] + names + ["nturacing/nturt_ros:host-base", "host"]
+        remove = ["container", "remove", "--force"] + names
+
+        def created() -> bool:
+            return self.server.docker.find_container(names[0]) is not None
+
+        for label, argv in [("one by one", ["-j", "1"]),
+                            (f"-j {jobs}", ["-j", str(jobs)])]:
+            results[f"container create x{len(names)} {label}"] = self.measure(
+                lambda: self.cli(create + argv),
+                lambda: created() and self.cli(remove))
+            results[f"container remove x{len(names)} {label}"] = self.measure(
+                lambda: self.cli(remove + argv),
+                lambda: created() or self.cli(create))
+        if created():
+            self.cli(remove)
+
+        for argv, setup in LIFECYCLE:
+            results[" ".join(argv)] = self.measure(lambda: self.cli(argv),
+                                                   lambda: self.cli(setup))
+
+        server = subprocess.Popen([sys.executable, self.script, "serve"],
+                                  env=self.env,
+                                  stdout=subprocess.PIPE,
+                                  stderr=subprocess.DEVNULL,
+                                  text=True)
+        try:
+            # the server prints a line once serving, and exits if the target
+            # has no "serve" command
+            served = server.stdout.readline()
+            for argv in [["container", "list"], ["image", "list"]]:
+                results[f"served cold start: {' '.join(argv)}"] = (
+                    self.measure(lambda: self.cli(argv)) if served else {
+                        "error": "\"serve\" failed"
+                    })
+            for line in COMPLETIONS:
+                results[f"served completion: {line.strip()}"] = (
+                    self.measure(lambda: self.complete(line),
+                                 self.remove_cache) if served else {
+                                     "error": "\"serve\" failed"
+                                 })
+        finally:
+            server.terminate()
+            server.wait()
+
+        self.stop()
+        return results
+
+    def run_pull(self, bandwidth: float, jobs: int) -> dict:
+        """
+        Run benchmarks of pulling all nturt images from the fake registry of a
+        fake docker daemon without any image
+
+        Parameters
+        ----------
+        bandwidth (float): bytes per second of every layer download
+        jobs (int): number of images pulled concurrently
+
+        Returns
+        -------
+        dict: benchmark name -> result
+        """
+        results = {}
+        for label, argv in [("one by one", ["-j", "1"]),
+                            (f"-j {jobs}", ["-j", str(jobs)])]:
+            results[f"image pull --all {label}"] = self.measure(
+                lambda: self.cli(["image", "pull", "--all"] + argv),
+                lambda: self.start(
+                    num_containers=0, num_images=0, bandwidth=bandwidth))
+        self.stop()
+        return results
+
+    def run_archive(self) -> dict:
+        """
+        Run benchmarks of exporting all nturt images to an archive and importing
+        it back, where the fake daemon fails importing an archive whose
+        repositories file lacks tags of its images
+
+        Returns
+        -------
+        dict: benchmark name -> result
+        """
+        self.start(num_containers=0, num_images=10)
+        archive = os.path.join(self.tmp_dir, "images.tar.zst")
+        export = ["image", "export", "--all", "-o", archive]
+        results = {
+            "image export --all":
+            self.measure(lambda: self.cli(export)),
+            "image import":
+            self.measure(lambda: self.cli(["image", "import", archive]),
+                         lambda: os.path.exists(archive) or self.cli(export)),
+        }
+        self.stop()
+        return results
+
+
+def git_revision(target: str) -> dict:
+    """
+    Get git revision of the target checkout
+
+    Parameters
+    ----------
+    target (str): directory of the checkout
+
+    Returns
+    -------
+    dict: commit and whether nturt_docker.py has uncommitted changes
+    """
+
+    def git(*args) -> str:
+        return subprocess.run(["git", "-C", target] + list(args),
+                              capture_output=True,
+                              text=True).stdout.strip()
+
+    return {
+        "commit": git("rev-parse", "HEAD") or None,
+        "dirty": bool(git("status", "--porcelain", "nturt_docker.py")),
+    }
+
+
+def format_result(result: dict) -> str:
+    if "error" in result:
+        # the full error is kept in the results
+        error = result["error"]
+        return f"FAILED: {error[:77] + '...' if len(error) > 80 else error}"
+    requests = (f" {result['requests']:8g} requests"
+                if "requests" in result else "")
+    return f"{result['median_ms']:10.1f}ms{requests}"
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> bool:
+    """
+    Print changes of the fastest wall time from a baseline, which is the least
+    disturbed by other load of the machine
+
+    Parameters
+    ----------
+    baseline (dict): results of the baseline
+    current (dict): results to compare
+    threshold (float): percentage of slowdown reported as regression
+
+    Returns
+    -------
+    bool: True if any benchmark regressed
+    """
+    regressed = False
+    print(f"compared to {baseline['revision']['commit']}:")
+    for group, results in current["results"].items():
+        for name, result in results.items():
+            base = baseline["results"].get(group, {}).get(name)
+            if base is None:
+                continue
+            # benchmarks failing on either revision are not comparable
+            if "error" in base or "error" in result:
+                print(f"  {group:>7} {name:<42} "
+                      f"{'FAILED' if 'error' in base else 'ok':>12} -> "
+                      f"{'FAILED' if 'error' in result else 'ok':>12}")
+                continue
+            change = (result["min_ms"] / base["min_ms"] - 1) * 100
+            # differences within 1ms are noise of process startup
+            regression = (change > threshold
+                          and result["min_ms"] - base["min_ms"] > 1)
+            regressed = regressed or regression
+            print(f"  {group:>7} {name:<42} {base['min_ms']:10.1f}ms -> "
+                  f"{result['min_ms']:10.1f}ms {change:+7.1f}%"
+                  f"{'  REGRESSION' if regression else ''}")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "-t",
+        "--target",
+        help=
+        "checkout to benchmark, e.g. a git worktree of another revision, default to this checkout",
+        default=NTURT_DOCKER_DIR)
+    parser.add_argument(
+        "-s",
+        "--sizes",
+        help=
+        "comma separated numbers of containers and images, default to 10,100,1000",
+        type=lambda sizes: [int(size) for size in sizes.split(",")],
+        default=[10, 100, 1000])
+    parser.add_argument("-n",
+                        "--runs",
+                        help="number of runs of every benchmark, default to 5",
+                        type=int,
+                        default=5)
+    parser.add_argument(
+        "-l",
+        "--latency",
+        help="latency of every request in seconds, default to 0.001",
+        type=float,
+        default=0.001)
+    parser.add_argument(
+        "-b",
+        "--bulk",
+        help="maximum number of containers created and removed, default to 50",
+        type=int,
+        default=50)
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        help=
+        "number of containers created and images pulled concurrently, default to 8",
+        type=int,
+        default=8)
+    parser.add_argument(
+        "--bandwidth",
+        help="bytes per second of every layer download, default to 100000000",
+        type=float,
+        default=100_000_000)
+    parser.add_argument("--skip-pull",
+                        help="do not benchmark pulling images",
+                        action="store_true")
+    parser.add_argument(
+        "-o",
+        "--output",
+        help=
+        "file to write results to, default to benchmarks/results/COMMIT.json")
+    parser.add_argument("--compare",
+                        help="results of another commit to compare against",
+                        metavar="BASELINE")
+    parser.add_argument(
+        "--threshold",
+        help="percentage of slowdown reported as regression, default to 10",
+        type=float,
+        default=10)
+    args = parser.parse_args()
+
+    target = os.path.realpath(args.target)
+    if not os.path.isfile(os.path.join(target, "nturt_docker.py")):
+        print(f"ERROR: \"{args.target}\" is not a checkout of nturt_docker")
+        exit(1)
+
+    revision = git_revision(target)
+    output = {
+        "revision": revision,
+        "date": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "config": {
+            "sizes": args.sizes,
+            "runs": args.runs,
+            "latency": args.latency,
+            "bulk": args.bulk,
+            "jobs": args.jobs,
+            "bandwidth": args.bandwidth
+        },
+        "results": {},
+    }
+
+    groups = [("startup", lambda suite: suite.run_startup())]
+    groups += [(str(size), lambda suite, size=size: suite.run_size(
+        size, args.latency, args.bulk, args.jobs)) for size in args.sizes]
+    if not args.skip_pull:
+        groups.append(
+            ("pull", lambda suite: suite.run_pull(args.bandwidth, args.jobs)))
+    groups.append(("archive", lambda suite: suite.run_archive()))
+
+    print(f"benchmarking {target} at {revision['commit']}"
+          f"{' with uncommitted changes' if revision['dirty'] else ''}")
+    for group, run in groups:
+        print(f"{group}:")
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            suite = Suite(install(target, tmp_dir), tmp_dir, args.runs)
+            try:
+                results = run(suite)
+            finally:
+                suite.stop()
+        output["results"][group] = results
+        for name, result in results.items():
+            print(f"  {name:<42} {format_result(result)}")
+
+    if args.output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        name = (revision["commit"] or "unknown")[:12]
+        if revision["dirty"]:
+            name += "-dirty"
+        args.output = os.path.join(RESULTS_DIR, name + ".json")
+    with open(args.output, "w") as f:
+        json.dump(output, f, indent=2)
+    print(f"results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, "r") as f:
+            baseline = json.load(f)
+        if compare(baseline, output, args.threshold):
+            exit(1)
+
+
+if __name__ == "__main__":
+    main()
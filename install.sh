@@ -5,12 +5,13 @@ set -x
 NTURT_DOCKER_DIR=$(dirname $(realpath $0))
 INSTALL_DIR=/usr/local/bin
 
-# install python modules
+# install python modules and zstd for image export and import
 sudo apt install python3 \
     python3-argcomplete \
     python3-docker \
     python3-prettytable \
-    python3-yaml
+    python3-yaml \
+    zstd
 
 # install nturt_docker
 if [[ -s ${INSTALL_DIR}/nturt_docker ]]; then
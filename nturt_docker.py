@@ -2,18 +2,23 @@
 # PYTHON_ARGCOMPLETE_OK
 
 from abc import ABC, abstractmethod
-import argcomplete
 import argparse
 from datetime import datetime, timedelta, timezone
-import docker
 from functools import lru_cache
+import json
+import math
 import os
-import prettytable
-import re
 import subprocess
 import sys
 import tempfile
-import yaml
+import threading
+import time
+from typing import TYPE_CHECKING, Callable, Iterable, Iterator
+
+# heavy modules are imported where they are used so that commands not talking
+# to docker daemon (e.g. pwd, --version, --help) start instantly
+if TYPE_CHECKING:
+    import docker
 
 
 # command abstract class #######################################################
@@ -78,6 +83,83 @@ class Command(ABC):
         parser.print_help()
 
 
+class LazySubParsersAction(argparse._SubParsersAction):
+    """
+    Subparsers action that only builds the parser of a subcommand when it is
+    selected, so that building the parser of a meta command costs the same
+    regardless of the number and complexity of its subcommands
+    """
+
+    class ParserMap(dict):
+        """
+        Map from subcommand names to parsers that builds a parser when it is
+        looked up for the first time
+        """
+
+        def __init__(self):
+            """
+            Constructor
+            """
+            super().__init__()
+            self.builders = {}
+
+        def _build(self, parser: argparse.ArgumentParser) -> None:
+            builder = self.builders.pop(id(parser), None)
+            if builder is not None:
+                builder(parser)
+
+        def __getitem__(self, name):
+            parser = super().__getitem__(name)
+            self._build(parser)
+            return parser
+
+        def get(self, name, default=None):
+            return self[name] if name in self else default
+
+        def values(self):
+            for parser in super().values():
+                self._build(parser)
+            return super().values()
+
+        def items(self):
+            for parser in super().values():
+                self._build(parser)
+            return super().items()
+
+    def __init__(self, *args, **kwargs):
+        """
+        Constructor
+        """
+        super().__init__(*args, **kwargs)
+        self._name_parser_map = self.ParserMap()
+        self.choices = self._name_parser_map
+
+    def add_parser(self,
+                   name: str,
+                   builder: Callable[[argparse.ArgumentParser], None]
+                   | None = None,
+                   **kwargs) -> argparse.ArgumentParser:
+        """
+        Add parser of a subcommand
+
+        Parameters
+        ----------
+        name (str): subcommand name
+        builder (Callable): function to build the parser when it is selected,
+            None to not build it
+        kwargs: keyword arguments passed to the parser
+
+        Returns
+        -------
+        argparse.ArgumentParser: parser of the subcommand, not built yet
+        """
+        parser = super().add_parser(name, **kwargs)
+        if builder is not None:
+            self._name_parser_map.builders[id(parser)] = builder
+
+        return parser
+
+
 class MetaCommand(Command):
     """
     Abstract class for meta commands
@@ -119,12 +201,13 @@ class MetaCommand(Command):
         self.build_meta_parser(parser)
         subparsers = parser.add_subparsers(dest="subcommand_" + self.name,
                                            title="commands",
-                                           metavar="COMMAND")
+                                           metavar="COMMAND",
+                                           action=LazySubParsersAction)
         for subcommand in self.subcommands:
-            subparser = subparsers.add_parser(subcommand.name,
-                                              description=subcommand.help,
-                                              help=subcommand.help)
-            subcommand.build_parser(subparser)
+            subparsers.add_parser(subcommand.name,
+                                  builder=subcommand.build_parser,
+                                  description=subcommand.help,
+                                  help=subcommand.help)
 
     def execute(self, args):
         subcommand = getattr(args, "subcommand_" + self.name)
@@ -164,8 +247,11 @@ class Application(Command):
                             action="version",
                             version="%(prog)s " + self.version)
         self.build_parser(parser)
-        # enable autocomplete
-        argcomplete.autocomplete(parser)
+        # enable autocomplete, argcomplete only does anything when invoked by
+        # shell completion, so only import it in that case
+        if "_ARGCOMPLETE" in os.environ:
+            import argcomplete
+            argcomplete.autocomplete(parser)
         args = parser.parse_args()
         self.execute(args)
 
@@ -176,42 +262,121 @@ class Container:
     Class for storing docker containers information
     """
 
-    docker_container = None
-    name = None
-    image = None
-    status = None
-    created = None
-    started = None
-    exited = None
+    __slots__ = ("id", "name", "image", "status", "status_text", "labels",
+                 "created", "started", "exited")
+
+    def __init__(self):
+        """
+        Constructor
+        """
+        self.id = None
+        self.name = None
+        self.image = None
+        self.status = None
+        self.status_text = None
+        self.labels = {}
+        self.created = None
+        self.started = None
+        self.exited = None
+
+    def from_summary(self, summary: dict) -> "Container":
+        """
+        Initialize from container summary returned by listing containers, which
+        does not require inspecting the container
+
+        Parameters
+        ----------
+        summary (dict): container summary
+        """
+        self.id = summary["Id"]
+        self.name = summary["Names"][0].lstrip("/")
+        self.image = summary["Image"]
+        self.status = summary["State"]
+        # human readable status like "Up 2 hours", precise to the daemon
+        self.status_text = summary["Status"]
+        self.labels = summary.get("Labels") or {}
+        self.created = parse_docker_time(summary["Created"])
+
+        return self
+
+    def from_event(self, event: dict) -> "Container":
+        """
+        Initialize from docker event of creating the container, whose
+        attributes are its labels with its name and image
+
+        Parameters
+        ----------
+        event (dict): docker event of creating the container
+
+        Returns
+        -------
+        Container: self
+        """
+        attributes = dict(event["Actor"]["Attributes"])
+        self.id = event["Actor"]["ID"]
+        self.name = attributes.pop("name")
+        self.image = attributes.pop("image")
+        self.status = "created"
+        self.status_text = "Created"
+        self.labels = attributes
+        self.created = parse_docker_time(event["time"])
+
+        return self
 
-    def from_docker_container(
-            self,
-            container: docker.models.containers.Container) -> "Container":
+    def from_dict(self, data: dict) -> "Container":
         """
-        Initialize from docker container
+        Initialize from dict converted by to_dict, e.g. served by "serve"
+        command
 
         Parameters
         ----------
-        container (docker.models.containers.Container): docker container
+        data (dict): dict of the container
+
+        Returns
+        -------
+        Container: self
+        """
+        for slot in self.__slots__:
+            setattr(self, slot, data[slot])
+        for slot in ["created", "started", "exited"]:
+            if data[slot] is not None:
+                setattr(self, slot,
+                        datetime.fromtimestamp(data[slot], timezone.utc))
+
+        return self
+
+    def to_dict(self) -> dict:
+        """
+        Convert to dict serializable to json, times are in unix timestamp
+
+        Returns
+        -------
+        dict: dict of the container
+        """
+        ret = {slot: getattr(self, slot) for slot in self.__slots__}
+        for slot in ["created", "started", "exited"]:
+            if ret[slot] is not None:
+                ret[slot] = ret[slot].timestamp()
+
+        return ret
+
+    def inspect(self) -> "Container":
         """
-        self.docker_container = container
-        self.name = container.name
-        self.image = container.image.attrs["RepoTags"][0]
-        self.status = container.status
+        Add time when the container started or exited by inspecting it, which
+        costs a round-trip to docker daemon
 
-        # format: 2000-01-01T00:00:00.000000000+00:00, remove nanoseconds
-        self.created = datetime.strptime(
-            re.sub(r"\.\d+", "", container.attrs["Created"]),
-            "%Y-%m-%dT%H:%M:%S%z")
+        Returns
+        -------
+        Container: self
+        """
+        if not self.id:
+            raise ValueError("container is not initialized")
 
+        attrs = docker_client().api.inspect_container(self.id)
         if self.status == "running":
-            self.started = datetime.strptime(
-                re.sub(r"\.\d+", "", container.attrs["State"]["StartedAt"]),
-                "%Y-%m-%dT%H:%M:%S%z")
+            self.started = parse_docker_time(attrs["State"]["StartedAt"])
         elif self.status == "exited":
-            self.exited = datetime.strptime(
-                re.sub(r"\.\d+", "", container.attrs["State"]["FinishedAt"]),
-                "%Y-%m-%dT%H:%M:%S%z")
+            self.exited = parse_docker_time(attrs["State"]["FinishedAt"])
 
         return self
 
@@ -230,45 +395,192 @@ class Container:
         created = timedelta_to_human(
             datetime.now(timezone.utc) - self.created) + " ago"
 
-        if self.status == "running":
+        if self.status == "running" and self.started:
             status = f"Up {timedelta_to_human(datetime.now(timezone.utc) - self.started)}"
-        elif self.status == "exited":
+        elif self.status == "exited" and self.exited:
             status = f"Exited {timedelta_to_human(datetime.now(timezone.utc) - self.exited)}"
         else:
-            status = self.status
+            status = self.status_text or self.status
 
         return [self.name, self.image, created, status]
 
 
-class Image:
+class ContainerStats:
     """
-    Class for storing docker images information
+    Class for computing resource usage of a container from samples of docker
+    stats stream, where rates are computed between consecutive samples
     """
 
-    docker_image = None
-    name = None
-    tag = None
-    created = None
-    size = None
+    # fields in csv and ndjson output
+    FIELDS = [
+        "time", "name", "cpu_percent", "memory_usage", "memory_limit",
+        "net_rx", "net_tx", "net_rx_rate", "net_tx_rate", "block_read",
+        "block_write", "block_read_rate", "block_write_rate", "pids"
+    ]
+
+    __slots__ = FIELDS + ["received"]
+
+    def __init__(self, name: str):
+        """
+        Constructor
+
+        Parameters
+        ----------
+        name (str): name of the container
+        """
+        for field in self.__slots__:
+            setattr(self, field, None)
+        self.name = name
 
-    def from_docker_image(self, image: docker.models.images.Image) -> "Image":
+    def feed(self, sample: dict) -> "ContainerStats":
         """
-        Initialize from docker image
+        Update with a sample of docker stats stream
 
         Parameters
         ----------
-        image (docker.models.images.Image): docker image
+        sample (dict): sample decoded from stats stream
+
+        Returns
+        -------
+        ContainerStats: self
+        """
+        received = time.monotonic()
+
+        # cpu usage is relative to the previous sample the daemon reports with
+        # it, and normalized to a single cpu like "docker stats"
+        cpu, precpu = sample["cpu_stats"], sample.get("precpu_stats", {})
+        cpu_delta = (cpu["cpu_usage"]["total_usage"] -
+                     precpu.get("cpu_usage", {}).get("total_usage", 0))
+        system_delta = (cpu.get("system_cpu_usage", 0) -
+                        precpu.get("system_cpu_usage", 0))
+        online_cpus = cpu.get("online_cpus") or len(
+            cpu["cpu_usage"].get("percpu_usage") or [None])
+        if precpu.get("system_cpu_usage") and system_delta > 0:
+            cpu_percent = cpu_delta / system_delta * online_cpus * 100
+        else:
+            cpu_percent = None
+
+        # page cache that can be reclaimed is not counted, cgroup v2 reports
+        # inactive_file and v1 total_inactive_file
+        memory = sample.get("memory_stats", {})
+        memory_stats = memory.get("stats", {})
+        memory_usage = memory.get("usage", 0) - memory_stats.get(
+            "inactive_file", memory_stats.get("total_inactive_file", 0))
+
+        networks = (sample.get("networks") or {}).values()
+        net_rx = sum(network["rx_bytes"] for network in networks)
+        net_tx = sum(network["tx_bytes"] for network in networks)
+
+        block_read = block_write = 0
+        for entry in (sample.get("blkio_stats",
+                                 {}).get("io_service_bytes_recursive") or []):
+            if entry["op"].lower() == "read":
+                block_read += entry["value"]
+            elif entry["op"].lower() == "write":
+                block_write += entry["value"]
+
+        if self.received is not None and received > self.received:
+            elapsed = received - self.received
+            self.net_rx_rate = max(0, net_rx - self.net_rx) / elapsed
+            self.net_tx_rate = max(0, net_tx - self.net_tx) / elapsed
+            self.block_read_rate = max(0,
+                                       block_read - self.block_read) / elapsed
+            self.block_write_rate = max(
+                0, block_write - self.block_write) / elapsed
+
+        self.received = received
+        self.time = sample.get("read")
+        self.cpu_percent = cpu_percent
+        self.memory_usage = max(0, memory_usage)
+        self.memory_limit = memory.get("limit")
+        self.net_rx, self.net_tx = net_rx, net_tx
+        self.block_read, self.block_write = block_read, block_write
+        self.pids = sample.get("pids_stats", {}).get("current")
+
+        return self
+
+    def to_dict(self) -> dict:
+        """
+        Convert to dict of FIELDS for csv and ndjson output
+
+        Returns
+        -------
+        dict: dict of fields
+        """
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+    def to_str_array(self) -> list[str]:
+        """
+        Convert to string array in [name, cpu, memory, memory percentage,
+        network io, network rate, block io, block rate, pids] format like
+        "docker stats" command
+
+        Returns
+        -------
+        list: string array
         """
-        self.docker_image = image
-        self.name = image.attrs["RepoTags"][0].split(":")[0]
-        self.tag = image.attrs["RepoTags"][0].split(":")[1]
+        if self.received is None:
+            return [self.name] + ["-"] * 8
 
-        # format: 2000-01-01T00:00:00.000000000+00:00, remove nanoseconds
-        self.created = datetime.strptime(
-            re.sub(r"\.\d+", "", image.attrs["Created"]),
-            "%Y-%m-%dT%H:%M:%S%z")
+        def rate(read: float | None, write: float | None) -> str:
+            if read is None:
+                return "-"
+            return f"{bytes_to_human(read)}/s / {bytes_to_human(write)}/s"
 
-        self.size = image.attrs["Size"]
+        if self.memory_limit:
+            memory_percent = f"{self.memory_usage / self.memory_limit * 100:.1f}%"
+        else:
+            memory_percent = "-"
+
+        return [
+            self.name,
+            "-" if self.cpu_percent is None else f"{self.cpu_percent:.1f}%",
+            f"{bytes_to_human(self.memory_usage)} / "
+            f"{bytes_to_human(self.memory_limit or 0)}",
+            memory_percent,
+            f"{bytes_to_human(self.net_rx)} / {bytes_to_human(self.net_tx)}",
+            rate(self.net_rx_rate, self.net_tx_rate),
+            f"{bytes_to_human(self.block_read)} / "
+            f"{bytes_to_human(self.block_write)}",
+            rate(self.block_read_rate, self.block_write_rate),
+            "-" if self.pids is None else str(self.pids),
+        ]
+
+
+class Image:
+    """
+    Class for storing docker images information
+    """
+
+    __slots__ = ("id", "name", "tag", "labels", "created", "size")
+
+    def __init__(self):
+        """
+        Constructor
+        """
+        self.id = None
+        self.name = None
+        self.tag = None
+        self.labels = {}
+        self.created = None
+        self.size = None
+
+    def from_summary(self, summary: dict, repo_tag: str) -> "Image":
+        """
+        Initialize from image summary returned by listing images, which does
+        not require inspecting the image
+
+        Parameters
+        ----------
+        summary (dict): image summary
+        repo_tag (str): one of the tags of the image in "name:tag" format
+        """
+        self.id = summary["Id"]
+        # name may contain ":" of registry port, tag never does
+        self.name, _, self.tag = repo_tag.rpartition(":")
+        self.labels = summary.get("Labels") or {}
+        self.created = parse_docker_time(summary["Created"])
+        self.size = summary["Size"]
 
         return self
 
@@ -317,218 +629,4436 @@ class Image:
     def __eq__(self, other: "Image") -> bool:
         return self.name == other.name and self.tag == other.tag
 
+    def __hash__(self) -> int:
+        return hash((self.name, self.tag))
 
-# constants ####################################################################
-NTURT_DOCKER_DIR = os.path.dirname(os.path.realpath(__file__))
-DOCKERFILE_DIR = os.path.join(NTURT_DOCKER_DIR, "Dockerfile")
-DOCKER_COMPOSE_DIR = os.path.join(NTURT_DOCKER_DIR, "docker-compose")
-PACKAGE_DIR = os.path.join(NTURT_DOCKER_DIR, "packages")
-
-DOCKER_CLIENT = docker.from_env()
 
-ROOT_COMPOSE_FILES = ["rpi"]
+class Inventory:
+    """
+    Snapshot of system containers and images with indexes for constant time
+    lookups, each part is listed from docker daemon at most once when it is
+    first accessed
+    """
 
-IMAGE_ENTRY = "nturacing"
-AVAILABLE_IMAGES = ["nturt_ros"]
+    __slots__ = ("_containers", "_containers_by_name", "_images",
+                 "_images_by_ref", "_images_by_id")
 
+    def __init__(self):
+        """
+        Constructor
+        """
+        self._containers = None
+        self._containers_by_name = None
+        self._images = None
+        self._images_by_ref = None
+        self._images_by_id = None
 
-# helper functions #############################################################
-def timedelta_to_human(time_delta: timedelta) -> str:
-    """
-    Convert timedelta to human readable format
+    def set_containers(self, containers: list[Container]) -> None:
+        """
+        Set containers of the snapshot and index them
 
-    Parameters
-    ----------
-    time_delta (datetime): timedelta
+        Parameters
+        ----------
+        containers (list): list of containers
+        """
+        self._containers = containers
+        self._containers_by_name = {
+            container.name: container
+            for container in containers
+        }
 
-    Returns
-    -------
-    str: human readable format
-    """
-    if time_delta.days > 0:
-        if time_delta.days >= 365:
-            return f"{time_delta.days // 365} years"
-        elif time_delta.days >= 30:
-            return f"{time_delta.days // 30} months"
-        elif time_delta.days >= 7:
-            return f"{time_delta.days // 7} weeks"
-        else:
-            return f"{time_delta.days} days"
-    elif time_delta.seconds >= 3600:
-        return f"{time_delta.seconds // 3600} hours"
-    elif time_delta.seconds >= 60:
-        return f"{time_delta.seconds // 60} minutes"
-    else:
-        return f"{time_delta.seconds} seconds"
+    def set_images(self, images: list[Image]) -> None:
+        """
+        Set images of the snapshot and index them
 
+        Parameters
+        ----------
+        images (list): list of images
+        """
+        self._images = images
+        self._images_by_ref = {
+            (image.name, image.tag): image
+            for image in images
+        }
+        self._images_by_id = {}
+        for image in images:
+            self._images_by_id.setdefault(image.id, []).append(image)
 
-def bytes_to_human(size: int) -> str:
-    """
-    Convert bytes to human readable format
+    @property
+    def containers(self) -> list[Container]:
+        """
+        System containers
 
-    Parameters
-    ----------
-    size (int): size in bytes
+        Returns
+        -------
+        list: list of system containers
+        """
+        if self._containers is None:
+            response = server_request("containers")
+            if response is not None:
+                self.set_containers([
+                    Container().from_dict(container)
+                    for container in response["containers"]
+                ])
+            else:
+                self.set_containers([
+                    Container().from_summary(summary)
+                    for summary in docker_client().api.containers(all=True)
+                ])
+        return self._containers
 
-    Returns
-    -------
-    str: human readable format
-    """
-    power_labels = {0: "B", 1: "KB", 2: "MB", 3: "GB", 4: "TB"}
+    @property
+    def images(self) -> list[Image]:
+        """
+        System images, an image with multiple tags appears once per tag and
+        images without tags are ignored
 
-    power = 1000  # same as docker
-    n = 0
-    while size >= power:
-        size /= power
-        n += 1
-    return f"{size:.2f}{power_labels[n]}"
+        Returns
+        -------
+        list: list of system images
+        """
+        if self._images is None:
+            response = server_request("images")
+            if response is not None:
+                summaries = response["images"]
+            else:
+                summaries = docker_client().api.images()
+            self.set_images([
+                Image().from_summary(summary, repo_tag)
+                for summary in summaries
+                for repo_tag in summary["RepoTags"] or []
+                if repo_tag != "<none>:<none>"
+            ])
+        return self._images
+
+    def container(self, name: str) -> Container | None:
+        """
+        Get container by name
 
+        Parameters
+        ----------
+        name (str): container name
 
-@lru_cache(maxsize=1)
-def list_sys_containers() -> list[Container]:
-    """
-    List system containers
+        Returns
+        -------
+        Container | None: container, None if not found
+        """
+        self.containers
+        return self._containers_by_name.get(name)
 
-    Returns
-    -------
-    list: list of system containers
-    """
-    ret = []
-    for container in DOCKER_CLIENT.containers.list(all=True):
-        ret.append(Container().from_docker_container(container))
+    def image(self, name: str, tag: str) -> Image | None:
+        """
+        Get image by name and tag
 
-    return ret
+        Parameters
+        ----------
+        name (str): image name
+        tag (str): image tag
 
+        Returns
+        -------
+        Image | None: image, None if not found
+        """
+        self.images
+        return self._images_by_ref.get((name, tag))
 
-@lru_cache(maxsize=1)
-def list_sys_images() -> list[Image]:
-    """
-    List system images, ignores images without tags
+    def images_of_id(self, image_id: str) -> list[Image]:
+        """
+        Get all tags of an image by its id
 
-    Returns
-    -------
-    list: list of system images
-    """
-    ret = []
-    for image in DOCKER_CLIENT.images.list():
-        if image.attrs["RepoTags"]:
-            ret.append(Image().from_docker_image(image))
+        Parameters
+        ----------
+        image_id (str): image id
 
-    return ret
+        Returns
+        -------
+        list: list of images with the id
+        """
+        self.images
+        return self._images_by_id.get(image_id, [])
 
 
-@lru_cache(maxsize=1)
-def list_nturt_compose_files() -> list[str]:
+class IteratorReader:
     """
-    List nturt docker-compose files
-
-    Returns
-    -------
-    list: list of nturt docker-compose files
+    Class for reading an iterator of bytes as a file object, e.g. to parse a
+    streamed tar archive by tarfile
     """
 
-    return os.listdir(DOCKER_COMPOSE_DIR)
+    def __init__(self, chunks: Iterable[bytes]):
+        """
+        Constructor
 
+        Parameters
+        ----------
+        chunks (Iterable): chunks of bytes
+        """
+        self.chunks = iter(chunks)
+        self.buffer = b""
 
-def list_nturt_images(image_names: list[str] | None = None) -> list[Image]:
-    """
-    List nturt images, add created and size information if the image is
-    available in system
+    def read(self, size: int = -1) -> bytes:
+        """
+        Read at most size bytes, all remaining bytes if size is negative
 
-    Parameters
-    ----------
-    image_names (list): list of image names, None to list all images
+        Parameters
+        ----------
+        size (int): maximum number of bytes to read
 
-    Returns
-    -------
-    list: list of nturt images
+        Returns
+        -------
+        bytes: bytes read, empty at the end of the iterator
+        """
+        while size < 0 or len(self.buffer) < size:
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                break
+            self.buffer += chunk
+        if size < 0:
+            size = len(self.buffer)
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+
+class ChunkedWriter:
+    """
+    Class for writing a stream to numbered chunk files of a fixed size, with
+    an index of their sizes and digests. An interrupted write is resumed by
+    writing the same stream again, where chunks completed before are verified
+    against the index instead of rewritten
     """
-    sys_images = list_sys_images()
+
+    def __init__(self, path: str, chunk_size: int, resume: bool = False):
+        """
+        Constructor
+
+        Parameters
+        ----------
+        path (str): path of the output, chunks are written to PATH.000,
+            PATH.001, ... and the index to PATH.json
+        chunk_size (int): size of every chunk except the last one
+        resume (bool): if chunks completed by a previous write are kept
+        """
+        self.path = path
+        self.index_path = path + ".json"
+        self.chunk_size = chunk_size
+        # chunks completed by the previous write
+        self.done = []
+        if resume and os.path.exists(self.index_path):
+            with open(self.index_path, "r") as f:
+                index = json.load(f)
+            if index["chunk_size"] != chunk_size:
+                raise ValueError(f"chunk size of the previous write is "
+                                 f"{bytes_to_human(index['chunk_size'])}, not "
+                                 f"{bytes_to_human(chunk_size)}")
+            self.done = index["chunks"]
+        self.chunks = []
+        self.file = None
+        self.hash = None
+        self.size = 0
+        self.reused = 0
+
+    def chunk_path(self, index: int) -> str:
+        return f"{self.path}.{index:03d}"
+
+    def write(self, data: bytes) -> None:
+        """
+        Write data
+
+        Parameters
+        ----------
+        data (bytes): data to write
+        """
+        import hashlib
+
+        while data:
+            if self.hash is None:
+                self.hash = hashlib.sha256()
+                if len(self.chunks) >= len(self.done):
+                    self.file = open(self.chunk_path(len(self.chunks)), "wb")
+
+            part = data[:self.chunk_size - self.size]
+            data = data[len(part):]
+            self.hash.update(part)
+            self.size += len(part)
+            if self.file is not None:
+                self.file.write(part)
+            if self.size == self.chunk_size:
+                self.finish_chunk()
+
+    def finish_chunk(self) -> None:
+        """
+        Finish the current chunk and record it in the index
+        """
+        number = len(self.chunks)
+        chunk = {
+            "name": os.path.basename(self.chunk_path(number)),
+            "size": self.size,
+            "sha256": self.hash.hexdigest(),
+        }
+        if self.file is None:
+            if chunk != self.done[number]:
+                raise RuntimeError(
+                    f"chunk {number} differs from the previous write, "
+                    "the stream has changed, write it again without resuming")
+            self.reused += 1
+        else:
+            self.file.close()
+            self.file = None
+        self.chunks.append(chunk)
+        self.hash = None
+        self.size = 0
+        self.write_index(complete=False)
+
+    def write_index(self, complete: bool) -> None:
+        """
+        Write the index atomically so that it always matches completed chunks
+
+        Parameters
+        ----------
+        complete (bool): if all chunks are written
+        """
+        chunks = self.chunks
+        if not complete:
+            # keep chunks of the previous write not reached yet for resuming
+            chunks = chunks + self.done[len(chunks):]
+        with open(self.index_path + ".tmp", "w") as f:
+            json.dump(
+                {
+                    "chunk_size": self.chunk_size,
+                    "complete": complete,
+                    "chunks": chunks
+                }, f)
+        os.replace(self.index_path + ".tmp", self.index_path)
+
+    def close(self) -> None:
+        """
+        Finish the last chunk and mark the index complete
+        """
+        if self.hash is not None:
+            self.finish_chunk()
+        # remove chunks of a longer previous write
+        number = len(self.chunks)
+        while os.path.exists(self.chunk_path(number)):
+            os.remove(self.chunk_path(number))
+            number += 1
+        self.write_index(complete=True)
+
+    @property
+    def written(self) -> int:
+        return sum(chunk["size"] for chunk in self.chunks) + self.size
+
+
+class BuildStep:
+    """
+    Class for storing timing of a step of building an image
+    """
+
+    __slots__ = ("name", "started", "elapsed", "cached", "error")
+
+    def __init__(self, name: str, started: float):
+        """
+        Constructor
+
+        Parameters
+        ----------
+        name (str): step name, e.g. "[final 2/5] RUN apt-get update"
+        started (float): unix time when the step started
+        """
+        self.name = name
+        self.started = started
+        self.elapsed = None
+        self.cached = False
+        self.error = None
+
+    def to_dict(self) -> dict:
+        """
+        Convert to dict for build trace
+
+        Returns
+        -------
+        dict: step as dict
+        """
+        return {slot: getattr(self, slot) for slot in self.__slots__}
+
+
+class BuildProgress:
+    """
+    Class for parsing progress output of BuildKit in plain format into build
+    steps, e.g.
+
+        #7 [final 2/5] RUN apt-get update
+        #7 0.345 Get:1 http://archive.ubuntu.com/ubuntu jammy InRelease
+        #7 DONE 45.6s
+    """
+
+    def __init__(self):
+        """
+        Constructor
+        """
+        self.steps = {}
+        self.started = time.time()
+        self.elapsed = None
+
+    def feed(self, line: str) -> None:
+        """
+        Parse a line of build output
+
+        Parameters
+        ----------
+        line (str): line of build output
+        """
+        words = line.rstrip("\n").split(" ", 1)
+        if len(words) < 2 or not words[0].startswith("#"):
+            return
+        try:
+            vertex = int(words[0][1:])
+        except ValueError:
+            return
+        text = words[1]
+
+        step = self.steps.get(vertex)
+        if step is None:
+            self.steps[vertex] = BuildStep(text, time.time())
+        elif text == "CACHED":
+            step.cached = True
+            step.elapsed = 0.0
+        elif text.startswith("DONE "):
+            step.elapsed = float(text[5:].rstrip("s"))
+        elif text.startswith("ERROR"):
+            step.error = text.partition(": ")[2] or text
+            step.elapsed = time.time() - step.started
+        elif text == "CANCELED":
+            step.error = "canceled"
+            step.elapsed = time.time() - step.started
+
+    def finish(self) -> None:
+        """
+        Mark the build as finished
+        """
+        self.elapsed = time.time() - self.started
+
+    def instruction_steps(self) -> list[BuildStep]:
+        """
+        Steps running Dockerfile instructions, without internal steps like
+        loading build context
+
+        Returns
+        -------
+        list: list of build steps in the order they started
+        """
+        return [
+            step for step in self.steps.values() if step.name.startswith("[")
+            and not step.name.startswith("[internal]")
+        ]
+
+    def to_dict(self) -> dict:
+        """
+        Convert to dict for build trace
+
+        Returns
+        -------
+        dict: build progress as dict
+        """
+        return {
+            "started": self.started,
+            "elapsed": self.elapsed,
+            "steps": [step.to_dict() for step in self.steps.values()],
+        }
+
+
+class PullProgress:
+    """
+    Class for aggregating progress of concurrent image pulls by layer, so that
+    layers shared between images are counted once
+    """
+
+    def __init__(self):
+        """
+        Constructor
+        """
+        self.lock = threading.Lock()
+        # layer id -> [downloaded bytes, total bytes, status]
+        self.layers = {}
+        # layer id -> images containing the layer
+        self.layer_images = {}
+        self.started = time.monotonic()
+
+    def feed(self, image: str, event: dict) -> None:
+        """
+        Update with a progress event of pulling an image, called from worker
+        threads
+
+        Parameters
+        ----------
+        image (str): image being pulled
+        event (dict): progress event decoded from pull stream
+        """
+        if "error" in event:
+            raise RuntimeError(event["error"])
+        # events without id are about the image rather than a layer
+        layer_id = event.get("id")
+        status = event.get("status", "")
+        if not layer_id or layer_id == image.split(":")[-1]:
+            return
+
+        with self.lock:
+            layer = self.layers.setdefault(layer_id, [0, 0, "waiting"])
+            self.layer_images.setdefault(layer_id, set()).add(image)
+
+            # a layer downloaded in this run exists to pulls reaching it later
+            if status == "Already exists":
+                if layer[2] == "waiting":
+                    layer[2] = "exists"
+            elif status == "Downloading":
+                detail = event.get("progressDetail", {})
+                # the same download is reported to every pull sharing it
+                layer[0] = max(layer[0], detail.get("current", 0))
+                layer[1] = max(layer[1], detail.get("total", 0))
+                layer[2] = "downloading"
+            elif status in ["Download complete", "Pull complete"]:
+                if layer[2] != "exists":
+                    layer[0] = layer[1] = max(layer[0], layer[1])
+                    layer[2] = "downloaded"
+
+    def summary(self) -> dict:
+        """
+        Aggregate progress of all layers
+
+        Returns
+        -------
+        dict: number of layers by status, shared layers, downloaded and total
+            bytes, elapsed seconds and throughput in bytes per second
+        """
+        with self.lock:
+            layers = list(self.layers.values())
+            shared = sum(
+                len(images) > 1 for images in self.layer_images.values())
+
+        downloaded = sum(layer[0] for layer in layers if layer[2] != "exists")
+        elapsed = time.monotonic() - self.started
+        return {
+            "layers": len(layers),
+            "downloaded_layers":
+            sum(layer[2] == "downloaded" for layer in layers),
+            "existing_layers": sum(layer[2] == "exists" for layer in layers),
+            "shared_layers": shared,
+            "downloaded": downloaded,
+            "total": sum(layer[1] for layer in layers if layer[2] != "exists"),
+            "elapsed": elapsed,
+            "throughput": downloaded / elapsed if elapsed > 0 else 0.0,
+        }
+
+
+# constants ####################################################################
+NTURT_DOCKER_DIR = os.path.dirname(os.path.realpath(__file__))
+DOCKERFILE_DIR = os.path.join(NTURT_DOCKER_DIR, "Dockerfile")
+DOCKER_COMPOSE_DIR = os.path.join(NTURT_DOCKER_DIR, "docker-compose")
+PROFILE_DIR = os.path.join(DOCKER_COMPOSE_DIR, "profiles")
+PACKAGE_DIR = os.path.join(NTURT_DOCKER_DIR, "packages")
+# generated dds profiles of shared memory transport groups
+DDS_DIR = os.path.join(NTURT_DOCKER_DIR, "dds")
+
+ROOT_COMPOSE_FILES = ["rpi"]
+
+# default number of concurrent jobs when operating on multiple objects
+DEFAULT_JOBS = 8
+
+IMAGE_ENTRY = "nturacing"
+AVAILABLE_IMAGES = ["nturt_ros"]
+
+# architectures images can be built for with their qemu binfmt_misc handlers
+PLATFORM_EMULATORS = {"amd64": "x86_64", "arm64": "aarch64", "arm": "arm"}
+
+# diff id of layers without any change, e.g. from WORKDIR of existing directory
+EMPTY_LAYER_DIFF_ID = "sha256:5f70bf18a086007016e948b04aed3b82103a36bea41755b6cddfaf10ace3c6ef"
+
+# label of nturt images storing the fingerprint of what they are built from
+FINGERPRINT_LABEL = "org.nturacing.nturt_docker.fingerprint"
+# label of containers storing the mode they are created with
+MODE_LABEL = "org.nturacing.nturt_docker.mode"
+# label of containers storing the performance profile they are created with
+PROFILE_LABEL = "org.nturacing.nturt_docker.profile"
+# label of containers storing the shared memory transport group they are in
+SHM_GROUP_LABEL = "org.nturacing.nturt_docker.shm_group"
+
+# where dds profiles are mounted in containers of shared memory transport groups
+DDS_MOUNT = "/etc/nturt_dds"
+# size of /dev/shm shared by a shared memory transport group if not specified
+SHM_TRANSPORT_SIZE = "1g"
+# size of shared memory segment of every fast dds participant
+FASTDDS_SEGMENT_SIZE = 64 * 1024 * 1024
+
+FASTDDS_PROFILE = """\
+<?xml version="1.0" encoding="UTF-8" ?>
+<!-- generated by nturt_docker for shared memory transport group {group} -->
+<profiles xmlns="http://www.eprosima.com/XMLSchemas/fastRTPS_Profiles">
+    <transport_descriptors>
+        <transport_descriptor>
+            <transport_id>nturt_shm</transport_id>
+            <type>SHM</type>
+            <segment_size>{segment_size}</segment_size>
+        </transport_descriptor>
+        <transport_descriptor>
+            <transport_id>nturt_udp</transport_id>
+            <type>UDPv4</type>
+        </transport_descriptor>
+    </transport_descriptors>
+    <participant profile_name="nturt_participant" is_default_profile="true">
+        <rtps>
+            <userTransports>
+                <transport_id>nturt_shm</transport_id>
+                <transport_id>nturt_udp</transport_id>
+            </userTransports>
+            <useBuiltinTransports>false</useBuiltinTransports>
+        </rtps>
+    </participant>
+    <data_writer profile_name="nturt_writer" is_default_profile="true">
+        <qos>
+            <data_sharing>
+                <kind>AUTOMATIC</kind>
+            </data_sharing>
+        </qos>
+        <historyMemoryPolicy>PREALLOCATED_WITH_REALLOC</historyMemoryPolicy>
+    </data_writer>
+    <data_reader profile_name="nturt_reader" is_default_profile="true">
+        <qos>
+            <data_sharing>
+                <kind>AUTOMATIC</kind>
+            </data_sharing>
+        </qos>
+        <historyMemoryPolicy>PREALLOCATED_WITH_REALLOC</historyMemoryPolicy>
+    </data_reader>
+</profiles>
+"""
+
+CYCLONEDDS_PROFILE = """\
+<?xml version="1.0" encoding="UTF-8" ?>
+<!-- generated by nturt_docker for shared memory transport group {group},
+     shared memory requires iox-roudi running in the group -->
+<CycloneDDS xmlns="https://cdds.io/config">
+    <Domain Id="any">
+        <SharedMemory>
+            <Enable>true</Enable>
+        </SharedMemory>
+    </Domain>
+</CycloneDDS>
+"""
+
+CACHE_DIR = os.path.join(
+    os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")),
+    "nturt_docker")
+COMPLETION_CACHE_FILE = os.path.join(CACHE_DIR, "completion.json")
+# seconds before completion cache is considered stale
+COMPLETION_CACHE_TTL = 60
+# unix socket of "serve" command, private to the user
+SERVER_SOCKET = os.path.join(os.environ.get("XDG_RUNTIME_DIR", CACHE_DIR),
+                             "nturt_docker.sock")
+# version of the protocol between the server and clients, bumped when changed
+SERVER_PROTOCOL = 1
+# seconds to wait for the server before falling back to docker daemon
+SERVER_TIMEOUT = 5
+# default directory of buildx local build cache, one sub-directory per image
+BUILD_CACHE_DIR = os.path.join(CACHE_DIR, "build")
+
+
+# helper functions #############################################################
+@lru_cache(maxsize=1)
+def docker_client() -> "docker.DockerClient":
+    """
+    Docker client shared by the whole process, created on first use so that
+    commands not talking to docker daemon never connect to it
+
+    Returns
+    -------
+    docker.DockerClient: docker client
+    """
+    import docker
+
+    return docker.from_env()
+
+
+def server_send(request: str) -> dict | None:
+    """
+    Send a request to the server of "serve" command, which only answers if it
+    serves the same docker daemon as this process would talk to
+
+    Parameters
+    ----------
+    request (str): request, one of "ping", "containers", "images" and
+        "invalidate"
+
+    Returns
+    -------
+    dict | None: response, None if the server is not running or not able to
+        answer
+    """
+    import socket
+
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(SERVER_TIMEOUT)
+            sock.connect(SERVER_SOCKET)
+            sock.sendall(
+                json.dumps({
+                    "protocol": SERVER_PROTOCOL,
+                    "docker_host": os.environ.get("DOCKER_HOST", ""),
+                    "request": request
+                }).encode() + b"\n")
+            with sock.makefile("rb") as f:
+                response = json.loads(f.read())
+    except (OSError, ValueError):
+        return None
+
+    if "error" in response:
+        return None
+    return response
+
+
+@lru_cache(maxsize=1)
+def server_available() -> bool:
+    """
+    Check if the server of "serve" command is running for the docker daemon of
+    this process, checked once per invocation
+
+    Returns
+    -------
+    bool: True if the server is available
+    """
+    return server_send("ping") is not None
+
+
+def server_request(request: str) -> dict | None:
+    """
+    Send a request to the server of "serve" command if it is available, so that
+    callers fall back to talking to docker daemon directly otherwise
+
+    Parameters
+    ----------
+    request (str): request, one of "containers", "images" and "invalidate"
+
+    Returns
+    -------
+    dict | None: response, None if the server is not available
+    """
+    if not server_available():
+        return None
+    return server_send(request)
+
+
+class LazyChoices:
+    """
+    Choices of an argument that are only evaluated when argparse validates the
+    argument or argcomplete completes it, so that building parsers does not
+    query docker daemon
+    """
+
+    def __init__(self, factory: Callable[[], Iterable[str]]):
+        """
+        Constructor
+
+        Parameters
+        ----------
+        factory (Callable): function returning the choices
+        """
+        self._factory = factory
+        self._choices = None
+
+    def _evaluate(self) -> list[str]:
+        if self._choices is None:
+            self._choices = list(self._factory())
+        return self._choices
+
+    def __contains__(self, item: str) -> bool:
+        return item in self._evaluate()
+
+    def __iter__(self):
+        return iter(self._evaluate())
+
+    def __len__(self) -> int:
+        return len(self._evaluate())
+
+    def __call__(self, **kwargs) -> list[str]:
+        # also serves as argcomplete completer
+        return self._evaluate()
+
+
+def timedelta_to_human(time_delta: timedelta) -> str:
+    """
+    Convert timedelta to human readable format
+
+    Parameters
+    ----------
+    time_delta (datetime): timedelta
+
+    Returns
+    -------
+    str: human readable format
+    """
+    if time_delta.days > 0:
+        if time_delta.days >= 365:
+            return f"{time_delta.days // 365} years"
+        elif time_delta.days >= 30:
+            return f"{time_delta.days // 30} months"
+        elif time_delta.days >= 7:
+            return f"{time_delta.days // 7} weeks"
+        else:
+            return f"{time_delta.days} days"
+    elif time_delta.seconds >= 3600:
+        return f"{time_delta.seconds // 3600} hours"
+    elif time_delta.seconds >= 60:
+        return f"{time_delta.seconds // 60} minutes"
+    else:
+        return f"{time_delta.seconds} seconds"
+
+
+def bytes_to_human(size: int) -> str:
+    """
+    Convert bytes to human readable format
+
+    Parameters
+    ----------
+    size (int): size in bytes
+
+    Returns
+    -------
+    str: human readable format
+    """
+    power_labels = {0: "B", 1: "KB", 2: "MB", 3: "GB", 4: "TB"}
+
+    power = 1000  # same as docker
+    n = 0
+    while size >= power:
+        size /= power
+        n += 1
+    return f"{size:.2f}{power_labels[n]}"
+
+
+def human_to_bytes(size: str) -> int:
+    """
+    Convert human readable size like "10GB" to bytes, in the same units as
+    bytes_to_human
+
+    Parameters
+    ----------
+    size (str): human readable size
+
+    Returns
+    -------
+    int: size in bytes
+    """
+    power_labels = {"B": 0, "KB": 1, "MB": 2, "GB": 3, "TB": 4}
+
+    size = size.strip().upper()
+    for label, n in sorted(power_labels.items(),
+                           key=lambda item: len(item[0]),
+                           reverse=True):
+        if size.endswith(label):
+            return int(float(size[:-len(label)]) * 1000**n)
+    return int(float(size))
+
+
+def available_memory() -> int | None:
+    """
+    Get memory available for new processes without swapping
+
+    Returns
+    -------
+    int | None: available memory in bytes, None if unknown
+    """
+    try:
+        with open("/proc/meminfo", "r") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def error_message(error: Exception) -> str:
+    """
+    Get concise message of an error, without the request details of docker
+    API errors
+
+    Parameters
+    ----------
+    error (Exception): error
+
+    Returns
+    -------
+    str: error message
+    """
+    return getattr(error, "explanation", None) or str(error)
+
+
+def run_concurrently(
+        function: Callable, items: Iterable,
+        jobs: int) -> Iterator[tuple[object, object, Exception | None, float]]:
+    """
+    Run function on items concurrently in a bounded worker pool
+
+    Parameters
+    ----------
+    function (Callable): function to run on every item
+    items (Iterable): items to run the function on
+    jobs (int): maximum number of concurrent workers
+
+    Returns
+    -------
+    Iterator: (item, result, error, elapsed seconds) of every item in the
+        order of completion, error is None if succeeded
+    """
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+
+    def timed(item):
+        start = time.monotonic()
+        try:
+            return function(item), None, time.monotonic() - start
+        except Exception as error:
+            return None, error, time.monotonic() - start
+
+    items = list(items)
+    if not items:
+        return
+
+    with ThreadPoolExecutor(
+            max_workers=max(1, min(jobs, len(items)))) as executor:
+        futures = {executor.submit(timed, item): item for item in items}
+        for future in as_completed(futures):
+            yield (futures[future], *future.result())
+
+
+def run_dag(
+        function: Callable, parents: dict[object, list],
+        jobs: int) -> Iterator[tuple[object, object, Exception | None, float]]:
+    """
+    Run function on nodes of a directed acyclic graph concurrently in a bounded
+    worker pool, a node only runs after all of its parents succeeded and is
+    cancelled if any of them failed or was cancelled
+
+    Parameters
+    ----------
+    function (Callable): function to run on every node
+    parents (dict): map from every node to its parents, parents not in the map
+        are treated as already succeeded
+    jobs (int): maximum number of concurrent workers
+
+    Returns
+    -------
+    Iterator: (node, result, error, elapsed seconds) of every node in the
+        order of completion, error is None if succeeded and
+        concurrent.futures.CancelledError if cancelled
+    """
+    from concurrent.futures import (CancelledError, FIRST_COMPLETED,
+                                    ThreadPoolExecutor, wait)
+
+    def timed(node):
+        start = time.monotonic()
+        try:
+            return function(node), None, time.monotonic() - start
+        except Exception as error:
+            return None, error, time.monotonic() - start
+
+    jobs = max(1, jobs)
+    pending = {
+        node: {parent
+               for parent in node_parents if parent in parents}
+        for node, node_parents in parents.items()
+    }
+    children = {node: [] for node in parents}
+    for node, node_parents in pending.items():
+        for parent in node_parents:
+            children[parent].append(node)
+
+    def cancel(node):
+        for child in children[node]:
+            if child in pending:
+                del pending[child]
+                yield child, None, CancelledError(
+                    f"{node} did not succeed"), 0.0
+                yield from cancel(child)
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        running = {}
+        while pending or running:
+            for node in [
+                    node for node, node_parents in pending.items()
+                    if not node_parents
+            ]:
+                if len(running) >= jobs:
+                    break
+                del pending[node]
+                running[executor.submit(timed, node)] = node
+            if not running:
+                raise ValueError(f"dependency cycle among {list(pending)}")
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                node = running.pop(future)
+                result, error, elapsed = future.result()
+                yield node, result, error, elapsed
+                if error:
+                    yield from cancel(node)
+                else:
+                    for child in children[node]:
+                        if child in pending:
+                            pending[child].discard(node)
+
+
+def parse_docker_time(value: str | int) -> datetime | None:
+    """
+    Parse time returned by docker daemon, which is either unix timestamp or
+    in 2000-01-01T00:00:00.000000000+00:00 format. Sub-second precision is
+    dropped and parsed by slicing since regex and strptime are slow when
+    parsing thousands of them
+
+    Parameters
+    ----------
+    value (str | int): time returned by docker daemon
+
+    Returns
+    -------
+    datetime | None: parsed time, None if it is zero time for never happened
+    """
+    if isinstance(value, int):
+        return datetime.fromtimestamp(value, timezone.utc)
+
+    if value.startswith("0001-"):
+        return None
+
+    if value.endswith("Z"):
+        tz = timezone.utc
+    else:
+        sign = -1 if value[-6] == "-" else 1
+        tz = timezone(
+            sign * timedelta(hours=int(value[-5:-3]), minutes=int(value[-2:])))
+
+    return datetime(int(value[0:4]),
+                    int(value[5:7]),
+                    int(value[8:10]),
+                    int(value[11:13]),
+                    int(value[14:16]),
+                    int(value[17:19]),
+                    tzinfo=tz)
+
+
+@lru_cache(maxsize=1)
+def inventory() -> Inventory:
+    """
+    Snapshot of system containers and images shared by the whole invocation
+
+    Returns
+    -------
+    Inventory: inventory snapshot
+    """
+    return Inventory()
+
+
+@lru_cache(maxsize=1)
+def list_nturt_compose_files() -> list[str]:
+    """
+    List nturt docker-compose files
+
+    Returns
+    -------
+    list: list of nturt docker-compose files
+    """
+
+    return [
+        mode for mode in os.listdir(DOCKER_COMPOSE_DIR) if os.path.isfile(
+            os.path.join(DOCKER_COMPOSE_DIR, mode, "docker-compose.yaml"))
+    ]
+
+
+def list_nturt_service_names() -> list[str]:
+    """
+    List names of services in nturt docker-compose files and of performance
+    profiles, suggested as names of containers to create
+
+    Returns
+    -------
+    list: list of service names
+    """
+    import yaml
+
+    names = set(list_nturt_profiles())
+    for mode in list_nturt_compose_files():
+        with open(
+                os.path.join(DOCKER_COMPOSE_DIR, mode, "docker-compose.yaml"),
+                "r") as f:
+            names.update(
+                yaml.load(f, Loader=yaml.FullLoader).get("services") or {})
+    return sorted(names)
+
+
+def write_dds_profiles(group: str) -> str:
+    """
+    Write fast dds and cyclone dds profiles enabling shared memory transport
+    for a shared memory transport group
+
+    Parameters
+    ----------
+    group (str): shared memory transport group
+
+    Returns
+    -------
+    str: directory of the profiles
+    """
+    directory = os.path.join(DDS_DIR, group)
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, "fastdds.xml"), "w") as f:
+        f.write(
+            FASTDDS_PROFILE.format(group=group,
+                                   segment_size=FASTDDS_SEGMENT_SIZE))
+    with open(os.path.join(directory, "cyclonedds.xml"), "w") as f:
+        f.write(CYCLONEDDS_PROFILE.format(group=group))
+    return directory
+
+
+def list_nturt_profiles() -> list[str]:
+    """
+    List performance profiles of containers
+
+    Returns
+    -------
+    list: list of profile names
+    """
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    return sorted(
+        file.removesuffix(".yaml") for file in os.listdir(PROFILE_DIR)
+        if file.endswith(".yaml"))
+
+
+def load_profile(profile: str) -> dict:
+    """
+    Load a performance profile of containers, which is a part of compose
+    service merged into the service of a mode
+
+    Parameters
+    ----------
+    profile (str): profile name
+
+    Returns
+    -------
+    dict: compose service keys of the profile
+    """
+    import yaml
+
+    with open(os.path.join(PROFILE_DIR, profile + ".yaml"), "r") as f:
+        return yaml.safe_load(f) or {}
+
+
+def merge_compose_service(service: dict, overrides: dict) -> dict:
+    """
+    Merge compose service keys into a compose service, lists are extended and
+    mappings are updated, other keys are replaced
+
+    Parameters
+    ----------
+    service (dict): compose service, not modified
+    overrides (dict): compose service keys to merge
+
+    Returns
+    -------
+    dict: merged compose service
+    """
+    merged = dict(service)
+    for key, value in overrides.items():
+        if isinstance(value, list) and isinstance(merged.get(key), list):
+            merged[key] = merged[key] + [
+                item for item in value if item not in merged[key]
+            ]
+        elif isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = dict(merged[key], **value)
+        else:
+            merged[key] = value
+    return merged
+
+
+@lru_cache(maxsize=None)
+def load_compose_service(mode: str) -> dict:
+    """
+    Load the container service of the docker-compose file of a mode
+
+    Parameters
+    ----------
+    mode (str): mode of containers
+
+    Returns
+    -------
+    dict: container service, should not be modified
+    """
+    import yaml
+
+    with open(os.path.join(DOCKER_COMPOSE_DIR, mode, "docker-compose.yaml"),
+              "r") as f:
+        return yaml.load(f, Loader=yaml.FullLoader)["services"]["container"]
+
+
+def workspace_dir(mode: str) -> str:
+    """
+    Get directory of ros workspace in containers of a mode
+
+    Parameters
+    ----------
+    mode (str): mode of containers
+
+    Returns
+    -------
+    str: directory of ros workspace
+    """
+    if mode in ROOT_COMPOSE_FILES:
+        return "/root/ws"
+    return "/home/docker/ws"
+
+
+def workspace_volumes(name: str, image: str, mode: str) -> dict[str, str]:
+    """
+    Get named volumes persisting workspace builds of a container, which are
+    only used for devel images. Build and install are kept per container and
+    image so that recreating the container does not rebuild from scratch,
+    while compiler cache is shared by all containers of the image
+
+    Parameters
+    ----------
+    name (str): name of the container
+    image (str): image of the container
+    mode (str): mode of the container
+
+    Returns
+    -------
+    dict: volume name -> mount point, empty if the image is not a devel one
+    """
+    tag = image.rpartition(":")[2]
+    if not tag.endswith("devel"):
+        return {}
+
+    ws = workspace_dir(mode)
+    return {
+        f"nturt_build-{name}-{tag}": f"{ws}/build",
+        f"nturt_install-{name}-{tag}": f"{ws}/install",
+        f"nturt_ccache-{tag}": f"{os.path.dirname(ws)}/.ccache",
+    }
+
+
+def expand_compose_variables(value: str) -> str:
+    """
+    Expand "${VAR}" and "$VAR" in a docker-compose file with environment
+    variables, which are empty if not set like docker compose does
+
+    Parameters
+    ----------
+    value (str): value in docker-compose file
+
+    Returns
+    -------
+    str: expanded value
+    """
+    import collections
+    import string
+
+    return string.Template(value).substitute(
+        collections.defaultdict(str, os.environ))
+
+
+def list_nturt_image_tags() -> list[str]:
+    """
+    List tags of all nturt images in "name:tag" format from Dockerfile
+    directory, without querying docker daemon
+
+    Returns
+    -------
+    list: list of nturt image tags
+    """
+    ret = []
+    for name in AVAILABLE_IMAGES:
+        image_dir = os.path.join(DOCKERFILE_DIR, name)
+        for target in os.listdir(image_dir):
+            for distro in os.listdir(os.path.join(image_dir, target)):
+                ret.append(f"{IMAGE_ENTRY}/{name}:{target}-{distro}")
+
+    return ret
+
+
+@lru_cache(maxsize=1)
+def list_nturt_targets() -> list[str]:
+    """
+    List targets of nturt images from Dockerfile directory
+
+    Returns
+    -------
+    list: list of targets
+    """
+    return sorted({
+        target
+        for name in AVAILABLE_IMAGES
+        for target in os.listdir(os.path.join(DOCKERFILE_DIR, name))
+    })
+
+
+def nturt_image_dir(image: str) -> str:
+    """
+    Get the directory of Dockerfile of a nturt image, which is also its build
+    context
+
+    Parameters
+    ----------
+    image (str): nturt image in "name:tag" format
+
+    Returns
+    -------
+    str: directory of the Dockerfile
+    """
+    entry_name, tag = image.split(":")
+    _, name = entry_name.split("/")
+    target, distro = tag.split("-")
+
+    return os.path.join(DOCKERFILE_DIR, name, target, distro)
+
+
+def nturt_image_subdir(directory: str, image: str) -> str:
+    """
+    Get the sub-directory of a nturt image in a directory holding one per
+    image, e.g. build cache or OCI layout directories
+
+    Parameters
+    ----------
+    directory (str): directory
+    image (str): nturt image in "name:tag" format
+
+    Returns
+    -------
+    str: sub-directory of the image
+    """
+    return os.path.join(directory, image.split("/")[-1].replace(":", "-"))
+
+
+def directory_size(directory: str) -> int:
+    """
+    Get total size of files in a directory
+
+    Parameters
+    ----------
+    directory (str): directory
+
+    Returns
+    -------
+    int: size in bytes
+    """
+    size = 0
+    for root, _, files in os.walk(directory):
+        for file in files:
+            size += os.lstat(os.path.join(root, file)).st_size
+    return size
+
+
+def list_build_caches(cache_dir: str) -> list[tuple[str, int, float]]:
+    """
+    List build caches of images in a build cache directory, least recently
+    used first
+
+    Parameters
+    ----------
+    cache_dir (str): build cache directory
+
+    Returns
+    -------
+    list: list of (directory, size in bytes, last used timestamp)
+    """
+    if not os.path.isdir(cache_dir):
+        return []
+
+    caches = []
+    for entry in os.scandir(cache_dir):
+        if entry.is_dir(follow_symlinks=False):
+            caches.append((entry.path, directory_size(entry.path),
+                           entry.stat().st_mtime))
+    return sorted(caches, key=lambda cache: cache[2])
+
+
+def parse_dockerfile_bases(dockerfile: str) -> list[str]:
+    """
+    Parse base images of a Dockerfile from its FROM instructions, ignoring
+    references to its own build stages
+
+    Parameters
+    ----------
+    dockerfile (str): path to Dockerfile
+
+    Returns
+    -------
+    list: list of base images
+    """
+    stages = set()
+    bases = []
+    with open(dockerfile, "r") as f:
+        for line in f:
+            words = line.split()
+            if not words or words[0].upper() != "FROM":
+                continue
+            words = [word for word in words[1:] if not word.startswith("--")]
+            if len(words) >= 3 and words[1].upper() == "AS":
+                stages.add(words[2])
+            # stages selected by build arguments are always our own stages
+            if words[0] not in stages and "$" not in words[0] and (
+                    words[0] not in bases):
+                bases.append(words[0])
+
+    return bases
+
+
+def resolve_image_id(image: str) -> str:
+    """
+    Resolve image id of a locally available image
+
+    Parameters
+    ----------
+    image (str): image in "name:tag" format
+
+    Returns
+    -------
+    str: image id, or the image itself if it is not available locally
+    """
+    import docker
+
+    try:
+        return docker_client().api.inspect_image(image)["Id"]
+    except docker.errors.ImageNotFound:
+        return image
+
+
+def parse_platforms(platforms: str) -> list[str]:
+    """
+    Parse comma separated platforms like "amd64,linux/arm64"
+
+    Parameters
+    ----------
+    platforms (str): comma separated platforms, "linux/" may be omitted
+
+    Returns
+    -------
+    list: list of platforms in "linux/arch" format
+    """
+    parsed = []
+    for platform in platforms.split(","):
+        arch = platform.strip().removeprefix("linux/")
+        if arch not in PLATFORM_EMULATORS:
+            raise argparse.ArgumentTypeError(
+                f"unsupported platform {platform}, "
+                f"choose from {', '.join(PLATFORM_EMULATORS)}")
+        if "linux/" + arch not in parsed:
+            parsed.append("linux/" + arch)
+    return parsed
+
+
+def native_platform() -> str:
+    """
+    Get platform of this machine
+
+    Returns
+    -------
+    str: platform in "linux/arch" format
+    """
+    machine = os.uname().machine
+    for arch, emulator in PLATFORM_EMULATORS.items():
+        if machine == emulator:
+            return "linux/" + arch
+    return "linux/" + machine
+
+
+def missing_emulators(platforms: list[str]) -> list[str]:
+    """
+    Find platforms that can not be emulated since their qemu binfmt_misc
+    handlers are not registered
+
+    Parameters
+    ----------
+    platforms (list): platforms in "linux/arch" format
+
+    Returns
+    -------
+    list: platforms without emulator
+    """
+    return [
+        platform for platform in platforms if platform != native_platform()
+        and not os.path.exists("/proc/sys/fs/binfmt_misc/qemu-" +
+                               PLATFORM_EMULATORS[platform.split("/")[1]])
+    ]
+
+
+def platform_image_tag(image: str, platform: str) -> str:
+    """
+    Get the tag of a nturt image built for a platform other than the default
+
+    Parameters
+    ----------
+    image (str): nturt image in "name:tag" format
+    platform (str): platform in "linux/arch" format
+
+    Returns
+    -------
+    str: image in "name:tag-arch" format
+    """
+    return f"{image}-{platform.split('/')[1]}"
+
+
+def nturt_image_fingerprint(image: str, platform: str | None = None) -> str:
+    """
+    Fingerprint of what a nturt image is built from, i.e. its build context
+    including the Dockerfile and the ids of its base images. Images with the
+    same fingerprint are built the same way and need not be rebuilt
+
+    Parameters
+    ----------
+    image (str): nturt image in "name:tag" format
+    platform (str): platform the image is built for, None for the default
+
+    Returns
+    -------
+    str: fingerprint in hex
+    """
+    import hashlib
+
+    image_dir = nturt_image_dir(image)
+    fingerprint = hashlib.sha256()
+    for root, dirs, files in os.walk(image_dir):
+        dirs.sort()
+        for file in sorted(files):
+            path = os.path.join(root, file)
+            # only executable bit of the mode is preserved by docker
+            fingerprint.update(f"{os.path.relpath(path, image_dir)}:"
+                               f"{os.stat(path).st_mode & 0o111}:".encode())
+            with open(path, "rb") as f:
+                fingerprint.update(hashlib.sha256(f.read()).digest())
+
+    if platform:
+        fingerprint.update(f"platform={platform}".encode())
+    for base in parse_dockerfile_bases(os.path.join(image_dir, "Dockerfile")):
+        # nturt base images built for the platform are tagged by it
+        if platform and base in nturt_image_graph():
+            ref = platform_image_tag(base, platform)
+        else:
+            ref = base
+        fingerprint.update(f"{base}={resolve_image_id(ref)}".encode())
+
+    return fingerprint.hexdigest()
+
+
+@lru_cache(maxsize=1)
+def nturt_image_graph() -> dict[str, list[str]]:
+    """
+    Dependency graph of nturt images from FROM instructions of their
+    Dockerfiles
+
+    Returns
+    -------
+    dict: map from every nturt image to the nturt images it is built from
+    """
+    images = list_nturt_image_tags()
+    return {
+        image: [
+            base for base in parse_dockerfile_bases(
+                os.path.join(nturt_image_dir(image), "Dockerfile"))
+            if base in images
+        ]
+        for image in images
+    }
+
+
+def list_nturt_images(image_names: list[str] | None = None) -> list[Image]:
+    """
+    List nturt images, add created and size information if the image is
+    available in system
+
+    Parameters
+    ----------
+    image_names (list): list of image names, None to list all images
+
+    Returns
+    -------
+    list: list of nturt images
+    """
+    sys_inventory = inventory()
 
     ret = []
     if not image_names:
         image_names = AVAILABLE_IMAGES
 
-    for name in image_names:
-        image_dir = os.path.join(DOCKERFILE_DIR, name)
-        for target in os.listdir(image_dir):
-            target_dir = os.path.join(image_dir, target)
-            for distro in os.listdir(target_dir):
-                image = Image().from_name_tag(IMAGE_ENTRY + "/" + name,
-                                              target + "-" + distro)
-                if image in sys_images:
-                    matched = sys_images[sys_images.index(image)]
-                    image.created = matched.created
-                    image.size = matched.size
-                ret.append(image)
-    return ret
+    for name in image_names:
+        image_dir = os.path.join(DOCKERFILE_DIR, name)
+        for target in os.listdir(image_dir):
+            target_dir = os.path.join(image_dir, target)
+            for distro in os.listdir(target_dir):
+                image = Image().from_name_tag(IMAGE_ENTRY + "/" + name,
+                                              target + "-" + distro)
+                matched = sys_inventory.image(image.name, image.tag)
+                if matched:
+                    image.id = matched.id
+                    image.created = matched.created
+                    image.size = matched.size
+                ret.append(image)
+    return ret
+
+
+def chain_ids(diff_ids: list[str]) -> list[str]:
+    """
+    Compute chain ids of layers from their diff ids, where a chain id
+    identifies a layer together with all layers below it, as docker stores
+    layers on disk
+
+    Parameters
+    ----------
+    diff_ids (list): diff ids of layers from the bottom one
+
+    Returns
+    -------
+    list: chain ids of the layers
+    """
+    import hashlib
+
+    ids = []
+    for diff_id in diff_ids:
+        if not ids:
+            ids.append(diff_id)
+        else:
+            ids.append(
+                "sha256:" +
+                hashlib.sha256(f"{ids[-1]} {diff_id}".encode()).hexdigest())
+    return ids
+
+
+def image_layers(image_id: str) -> list[tuple[str, int | None, str | None]]:
+    """
+    Get layers of an image with their sizes and the instructions creating
+    them, from its layer digests and history
+
+    Parameters
+    ----------
+    image_id (str): image id
+
+    Returns
+    -------
+    list: list of (chain id, size in bytes, instruction) from the bottom
+        layer, chain id identifies a layer stored on disk and is the same for
+        images sharing the layer, size and instruction are None if unknown
+    """
+    api = docker_client().api
+    diff_ids = api.inspect_image(image_id)["RootFS"]["Layers"]
+    # history is newest first, and its entries not creating a layer, e.g.
+    # ENV, have zero size like empty layers, which are skipped as well
+    history = [
+        entry for entry in reversed(api.history(image_id)) if entry["Size"]
+    ]
+    layers = [(diff_id, chain_id)
+              for diff_id, chain_id in zip(diff_ids, chain_ids(diff_ids))
+              if diff_id != EMPTY_LAYER_DIFF_ID]
+
+    # a layer reported with zero size, e.g. only removing files, has no sized
+    # history entry, so that entries can not be paired with layers in order
+    if len(history) != len(layers):
+        return [(chain_id, None, None) for _, chain_id in layers]
+    return [(chain_id, entry["Size"], entry["CreatedBy"])
+            for (_, chain_id), entry in zip(layers, history)]
+
+
+def is_completing() -> bool:
+    """
+    Check if invoked by shell completion
+
+    Returns
+    -------
+    bool: True if invoked by shell completion
+    """
+    return "_ARGCOMPLETE" in os.environ
+
+
+def build_completion_cache() -> dict:
+    """
+    Build completion cache by querying docker daemon
+
+    Returns
+    -------
+    dict: completion cache
+    """
+    containers = {}
+    for container in inventory().containers:
+        containers.setdefault(container.status, []).append(container.name)
+
+    return {"containers": containers}
+
+
+def write_completion_cache(cache: dict) -> None:
+    """
+    Write completion cache atomically so that concurrent completions never
+    read a partially written file
+
+    Parameters
+    ----------
+    cache (dict): completion cache
+    """
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    fd, tmp_file = tempfile.mkstemp(dir=CACHE_DIR, suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        json.dump(cache, f)
+    os.replace(tmp_file, COMPLETION_CACHE_FILE)
+
+
+def read_completion_cache() -> dict | None:
+    """
+    Read completion cache, its modification time is used as the time of last
+    refresh
+
+    Returns
+    -------
+    dict | None: completion cache, None if it does not exist or is stale
+    """
+    try:
+        if time.time() - os.path.getmtime(
+                COMPLETION_CACHE_FILE) > COMPLETION_CACHE_TTL:
+            return None
+        with open(COMPLETION_CACHE_FILE, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def invalidate_completion_cache() -> None:
+    """
+    Invalidate completion cache, should be called by commands that change the
+    state of containers or images
+    """
+    try:
+        os.remove(COMPLETION_CACHE_FILE)
+    except FileNotFoundError:
+        pass
+    # events of the change may not have reached the server yet
+    server_request("invalidate")
+
+
+@lru_cache(maxsize=1)
+def completion_cache() -> dict:
+    """
+    Get completion cache, rebuild it if it does not exist or is stale
+
+    Returns
+    -------
+    dict: completion cache
+    """
+    cache = read_completion_cache()
+    if cache is None:
+        cache = build_completion_cache()
+        write_completion_cache(cache)
+
+    return cache
+
+
+def redraw(output: str, printed_lines: int) -> int:
+    """
+    Print output in place of the previously printed one if stdout is a
+    terminal, otherwise print it after that
+
+    Parameters
+    ----------
+    output (str): output to print
+    printed_lines (int): number of lines previously printed, 0 if none
+
+    Returns
+    -------
+    int: number of lines printed
+    """
+    if sys.stdout.isatty() and printed_lines:
+        # move to the first line of the previous output and clear below
+        print(f"\033[{printed_lines}F\033[J", end="")
+    print(output, flush=True)
+    return output.count("\n") + 1
+
+
+def list_container_names(status: str | None = None) -> list[str]:
+    """
+    List names of system containers, served from completion cache when invoked
+    by shell completion
+
+    Parameters
+    ----------
+    status (str): only list containers with this status, None to list all
+
+    Returns
+    -------
+    list: list of container names
+    """
+    # the server is kept up to date by docker events, fresher than the cache
+    if is_completing() and not server_available():
+        containers = completion_cache()["containers"]
+        if status:
+            return containers.get(status, [])
+        return [name for names in containers.values() for name in names]
+
+    return [
+        container.name for container in inventory().containers
+        if not status or container.status == status
+    ]
+
+
+def apply_container_event(containers: dict[str, Container],
+                          event: dict) -> bool:
+    """
+    Apply a docker event to containers, so that they are kept up to date
+    without listing them again
+
+    Parameters
+    ----------
+    containers (dict): container id -> container
+    event (dict): docker event
+
+    Returns
+    -------
+    bool: True if containers are changed
+    """
+    action = event["Action"]
+    container_id = event["Actor"]["ID"]
+    if action == "create":
+        containers[container_id] = Container().from_event(event)
+        return True
+
+    container = containers.get(container_id)
+    if container is None:
+        return False
+    if action == "destroy":
+        del containers[container_id]
+    elif action == "rename":
+        container.name = event["Actor"]["Attributes"]["name"]
+    elif action in ["start", "unpause"]:
+        container.status = "running"
+        # shown if the start time is unknown without --detail
+        container.status_text = "Up"
+        if action == "start":
+            container.started = parse_docker_time(event["time"])
+    elif action == "die":
+        container.status = "exited"
+        container.exited = parse_docker_time(event["time"])
+    elif action == "pause":
+        container.status = "paused"
+        container.status_text = "Paused"
+    return True
+
+
+def watch_events(events: Iterator[dict],
+                 subscribe: Callable[[], Iterator[dict]],
+                 apply: Callable[[dict], None],
+                 resync: Callable[[], None],
+                 disconnected: Callable[[], None] | None = None) -> None:
+    """
+    Apply docker events forever, subscribing again when the stream ends, e.g.
+    when docker daemon restarts, run in its own thread by long-lived commands
+
+    Parameters
+    ----------
+    events (Iterator): docker events stream subscribed before the state was
+        listed
+    subscribe (Callable): function subscribing to docker events
+    apply (Callable): function applying an event to the state
+    resync (Callable): function listing the state again after subscribing
+        again, since events are missed while not subscribed
+    disconnected (Callable): function called when the stream ends
+    """
+    while True:
+        try:
+            for event in events:
+                apply(event)
+        except Exception:
+            pass
+
+        if disconnected is not None:
+            disconnected()
+        while True:
+            time.sleep(1)
+            try:
+                events = subscribe()
+            except Exception:
+                continue
+            try:
+                # after subscribing so that no event is missed
+                resync()
+                break
+            except Exception:
+                events.close()
+
+
+def container_stats_samples(container_id: str,
+                            count: int | None = None) -> Iterator[dict]:
+    """
+    Get samples of docker stats stream of a container until it stops
+
+    Parameters
+    ----------
+    container_id (str): id or name of the container
+    count (int): number of samples to get, None to get until it stops
+
+    Returns
+    -------
+    Iterator: samples decoded from stats stream
+    """
+    samples = docker_client().api.stats(container_id, decode=True)
+    try:
+        for index, sample in enumerate(samples):
+            # stats of stopped containers are reported as empty samples
+            if sample.get("read", "0001-").startswith("0001-"):
+                return
+            yield sample
+            if count is not None and index + 1 >= count:
+                return
+    finally:
+        samples.close()
+
+
+# commands #####################################################################
+# contianer commands ###########################################################
+class NturtDockerContainerBuild(Command):
+    """
+    Command to build ros workspace of a container with compiler cache
+    """
+
+    # maximum size of compiler cache shared by containers of an image
+    CCACHE_MAX_SIZE = "5G"
+
+    @property
+    def name(self):
+        return "build"
+
+    @property
+    def help(self):
+        return "build ros workspace of a container with compiler cache"
+
+    def build_parser(self, parser):
+        parser.add_argument("container",
+                            help="container to build workspace of",
+                            metavar="CONTAINER",
+                            choices=LazyChoices(list_container_names))
+        parser.add_argument("-p",
+                            "--packages-select",
+                            help="only build PACKAGES",
+                            metavar="PACKAGES",
+                            nargs="+")
+        parser.add_argument(
+            "-j",
+            "--jobs",
+            help=
+            "number of parallel build jobs, default to cpu limit of the container",
+            type=int)
+        parser.add_argument(
+            "--clean",
+            help="remove previous build and install before building",
+            action="store_true")
+
+    def cpu_limit(self, host_config: dict) -> int:
+        """
+        Get number of cpus a container can use from its cpu quota and cpuset
+
+        Parameters
+        ----------
+        host_config (dict): host config of the container
+
+        Returns
+        -------
+        int: number of cpus
+        """
+        limits = [os.cpu_count() or 1]
+        if host_config.get("NanoCpus"):
+            limits.append(math.ceil(host_config["NanoCpus"] / 1e9))
+        if host_config.get("CpuQuota", 0) > 0:
+            limits.append(
+                math.ceil(host_config["CpuQuota"] /
+                          (host_config.get("CpuPeriod") or 100000)))
+        if host_config.get("CpusetCpus"):
+            cpus = 0
+            for cpu_range in host_config["CpusetCpus"].split(","):
+                first, _, last = cpu_range.partition("-")
+                cpus += int(last or first) - int(first) + 1
+            limits.append(cpus)
+        return max(1, min(limits))
+
+    def run(self,
+            container_id: str,
+            command: list[str],
+            user: str = "",
+            environment: dict | None = None,
+            output: bool = False) -> tuple[int, str]:
+        """
+        Run a command in a container
+
+        Parameters
+        ----------
+        container_id (str): id of the container
+        command (list): command to run
+        user (str): user to run as, default to user of the container
+        environment (dict | None): environment variables
+        output (bool): if output is printed as it comes instead of returned
+
+        Returns
+        -------
+        tuple: exit code and output of the command
+        """
+        api = docker_client().api
+        exec_id = api.exec_create(container_id,
+                                  command,
+                                  user=user,
+                                  environment=environment)["Id"]
+        chunks = []
+        for chunk in api.exec_start(exec_id, stream=True):
+            if output:
+                sys.stdout.write(chunk.decode(errors="replace"))
+                sys.stdout.flush()
+            else:
+                chunks.append(chunk)
+        return (api.exec_inspect(exec_id)["ExitCode"],
+                b"".join(chunks).decode(errors="replace"))
+
+    def ccache_stats(self, container_id: str,
+                     environment: dict) -> dict[str, int]:
+        """
+        Get statistics of compiler cache of a container
+
+        Parameters
+        ----------
+        container_id (str): id of the container
+        environment (dict): environment variables locating compiler cache
+
+        Returns
+        -------
+        dict: statistics by name, e.g. "direct_cache_hit", "cache_miss"
+        """
+        exit_code, output = self.run(container_id, ["ccache", "--print-stats"],
+                                     environment=environment)
+        if exit_code != 0:
+            return {}
+        stats = {}
+        for line in output.splitlines():
+            key, _, value = line.partition("\t")
+            if value.strip().isdigit():
+                stats[key] = int(value)
+        return stats
+
+    def execute(self, args):
+        api = docker_client().api
+        attrs = api.inspect_container(args.container)
+        if not attrs["State"]["Running"]:
+            print("Container is not running, starting it...")
+            api.start(attrs["Id"])
+            invalidate_completion_cache()
+
+        mode = (attrs["Config"].get("Labels") or {}).get(MODE_LABEL)
+        if mode is None:
+            # containers created before mode label by user of the container
+            user = attrs["Config"].get("User", "")
+            mode = "host" if user.startswith("docker") else "rpi"
+        ws = workspace_dir(mode)
+        mounts = {mount["Destination"] for mount in attrs.get("Mounts", [])}
+        if f"{ws}/build" not in mounts:
+            print(f"WARNING: build of container \"{args.container}\" is not "
+                  "persisted, recreate it from a devel image to keep build, "
+                  "install and compiler cache in volumes")
+
+        jobs = args.jobs or self.cpu_limit(attrs["HostConfig"])
+        environment = {
+            "CCACHE_DIR": f"{os.path.dirname(ws)}/.ccache",
+            "CCACHE_BASEDIR": ws,
+            "CCACHE_MAXSIZE": self.CCACHE_MAX_SIZE,
+            # colcon builds packages in parallel, so make is limited by load
+            # rather than jobs alone to not oversubscribe cpus
+            "MAKEFLAGS": f"-j{jobs} -l{jobs}",
+        }
+
+        use_ccache = self.run(attrs["Id"], ["ccache", "-z"],
+                              environment=environment)[0] == 0
+        if use_ccache:
+            # volumes are created by root, mounted over a missing directory
+            user = attrs["Config"].get("User", "")
+            if user and not user.startswith("root"):
+                self.run(attrs["Id"],
+                         ["chown", user, environment["CCACHE_DIR"]],
+                         user="root")
+        else:
+            print("WARNING: ccache is not installed in the container, "
+                  "building without compiler cache")
+
+        colcon = [
+            "colcon", "build", "--symlink-install", "--parallel-workers",
+            str(jobs)
+        ]
+        if args.packages_select:
+            colcon += ["--packages-select"] + args.packages_select
+        if use_ccache:
+            colcon += [
+                "--cmake-args", "-DCMAKE_C_COMPILER_LAUNCHER=ccache",
+                "-DCMAKE_CXX_COMPILER_LAUNCHER=ccache"
+            ]
+        script = [
+            ". /opt/ros/$ROS_DISTRO/setup.sh", f"cd {ws}", " ".join(colcon)
+        ]
+        if args.clean:
+            # contents only since build and install may be mount points
+            script.insert(1, f"rm -rf {ws}/build/* {ws}/install/*")
+
+        print(f"Building workspace of container {args.container} "
+              f"with {jobs} jobs...")
+        start = time.monotonic()
+        exit_code, _ = self.run(attrs["Id"],
+                                ["bash", "-c", " && ".join(script)],
+                                environment=environment,
+                                output=True)
+        elapsed = time.monotonic() - start
+
+        if use_ccache:
+            stats = self.ccache_stats(attrs["Id"], environment)
+            hits = (stats.get("direct_cache_hit", 0) +
+                    stats.get("preprocessed_cache_hit", 0))
+            misses = stats.get("cache_miss", 0)
+            if hits + misses:
+                print(f"ccache: {hits} hits, {misses} misses, "
+                      f"{hits / (hits + misses) * 100:.1f}% hit rate")
+        if exit_code != 0:
+            print(f"ERROR: build failed with exit code {exit_code} "
+                  f"after {elapsed:.1f}s")
+            exit(1)
+        print(f"Built in {elapsed:.1f}s")
+
+
+class NturtDockerContainerCreate(Command):
+    """
+    Command to create containers
+    """
+
+    @property
+    def name(self):
+        return "create"
+
+    @property
+    def help(self):
+        return "create containers"
+
+    # keys of compose service translated to docker api
+    SUPPORTED_KEYS = [
+        "cap_add", "container_name", "cpuset", "environment", "group_add",
+        "hostname", "image", "ipc", "labels", "mem_limit", "network_mode",
+        "privileged", "runtime", "shm_size", "stdin_open", "tmpfs", "tty",
+        "ulimits", "user", "volumes"
+    ]
+
+    def build_parser(self, parser):
+        parser.add_argument(
+            "names",
+            help="names of the containers to create",
+            metavar="NAME",
+            nargs="+").completer = LazyChoices(list_nturt_service_names)
+        parser.add_argument("image",
+                            help="image to use",
+                            metavar="IMAGE",
+                            choices=LazyChoices(list_nturt_image_tags))
+        parser.add_argument("mode",
+                            help="mode of the container to create",
+                            metavar="MODE",
+                            choices=LazyChoices(list_nturt_compose_files))
+        parser.add_argument(
+            "-j",
+            "--jobs",
+            help=
+            f"number of containers to create concurrently, default to {DEFAULT_JOBS}",
+            type=int,
+            default=DEFAULT_JOBS)
+        parser.add_argument(
+            "--compose",
+            help="create containers by docker compose as before, slower",
+            action="store_true")
+        profile_group = parser.add_argument_group(
+            "performance profile",
+            f"settings merged into the mode, presets are in {PROFILE_DIR}")
+        profile_group.add_argument("-p",
+                                   "--profile",
+                                   help="preset profile to use",
+                                   metavar="PROFILE",
+                                   choices=LazyChoices(list_nturt_profiles))
+        profile_group.add_argument("--cpuset",
+                                   help="cpus to run on, e.g. 2-3",
+                                   metavar="CPUS")
+        profile_group.add_argument(
+            "--rt",
+            help=
+            "allow real-time scheduling and locking memory, i.e. the rt profile",
+            action="store_true")
+        profile_group.add_argument("--memory",
+                                   help="memory limit, e.g. 2g",
+                                   metavar="SIZE")
+        profile_group.add_argument("--shm-size",
+                                   help="size of /dev/shm, e.g. 512m",
+                                   metavar="SIZE")
+        profile_group.add_argument(
+            "--save-profile",
+            help="save the settings as preset PROFILE for later use",
+            metavar="PROFILE")
+        parser.add_argument(
+            "--shm-transport",
+            help=
+            "join shared memory transport GROUP, default to \"default\", containers in a group share ipc, /dev/shm and network of the first one, with dds profiles for shared memory transport",
+            metavar="GROUP",
+            nargs="?",
+            const="default")
+
+    def shm_transport_owner(self, group: str) -> str | None:
+        """
+        Find the container owning ipc and network namespaces of a shared
+        memory transport group, i.e. the first one created in the group
+
+        Parameters
+        ----------
+        group (str): shared memory transport group
+
+        Returns
+        -------
+        str | None: name of the owner, None if the group has no container
+        """
+        members = [
+            container for container in inventory().containers
+            if container.labels.get(SHM_GROUP_LABEL) == group
+        ]
+        if not members:
+            return None
+        return min(members, key=lambda container: container.created).name
+
+    def shm_transport_service(self, name: str, service: dict) -> dict:
+        """
+        Compose service keys joining a container to its shared memory
+        transport group
+
+        Parameters
+        ----------
+        name (str): name of the container
+        service (dict): compose service of the container
+
+        Returns
+        -------
+        dict: compose service keys to merge
+        """
+        group = self.shm_group
+        settings = {
+            "labels": {
+                SHM_GROUP_LABEL: group
+            },
+            "volumes": [f"{self.dds_dir}:{DDS_MOUNT}:ro"],
+            "environment": {
+                "FASTRTPS_DEFAULT_PROFILES_FILE": f"{DDS_MOUNT}/fastdds.xml",
+                "RMW_FASTRTPS_USE_QOS_FROM_XML": 1,
+                "CYCLONEDDS_URI": f"file://{DDS_MOUNT}/cyclonedds.xml",
+            },
+        }
+        if name == self.shm_owner:
+            settings["ipc"] = "shareable"
+            settings["shm_size"] = service.get("shm_size", SHM_TRANSPORT_SIZE)
+        else:
+            # /dev/shm is shared with ipc namespace of the owner, and fast dds
+            # only uses shared memory with participants of the same host
+            settings["ipc"] = f"container:{self.shm_owner}"
+            if service.get("network_mode") != "host":
+                settings["network_mode"] = f"container:{self.shm_owner}"
+        return settings
+
+    def resolve_profile(self, args: argparse.Namespace) -> tuple[str, dict]:
+        """
+        Resolve performance profile from preset and options, options take
+        precedence over the preset
+
+        Parameters
+        ----------
+        args (argparse.Namespace): arguments
+
+        Returns
+        -------
+        tuple: profile description for the label, empty if none, and compose
+            service keys of the profile
+        """
+        description = []
+        profile = {}
+        if args.profile:
+            description.append(args.profile)
+            profile = load_profile(args.profile)
+        if args.rt:
+            if "rt" not in list_nturt_profiles():
+                print(f"ERROR: rt profile not found in {PROFILE_DIR}")
+                exit(1)
+            description.append("rt")
+            profile = merge_compose_service(profile, load_profile("rt"))
+        for key, value, option in [("cpuset", args.cpuset, "cpuset"),
+                                   ("mem_limit", args.memory, "memory"),
+                                   ("shm_size", args.shm_size, "shm")]:
+            if value:
+                description.append(f"{option}={value}")
+                profile[key] = value
+
+        if args.save_profile:
+            import yaml
+
+            with open(os.path.join(PROFILE_DIR, args.save_profile + ".yaml"),
+                      "w") as f:
+                yaml.safe_dump(profile, f)
+            description = [args.save_profile]
+
+        return "+".join(description), profile
+
+    def compose_service(self, name: str, image: str, mode: str) -> dict:
+        """
+        Fill compose service of a mode for a container, with the performance
+        profile merged
+
+        Parameters
+        ----------
+        name (str): name of the container
+        image (str): image to use
+        mode (str): mode of the container
+
+        Returns
+        -------
+        dict: compose service of the container
+        """
+        service = merge_compose_service(load_compose_service(mode),
+                                        self.profile)
+        service["image"] = image
+        service["hostname"] = image.split(":")[1]
+        service["container_name"] = name
+        service["labels"] = {MODE_LABEL: mode}
+        if self.profile_description:
+            service["labels"][PROFILE_LABEL] = self.profile_description
+
+        src = os.path.join(PACKAGE_DIR,
+                           name) + ":" + workspace_dir(mode) + "/src"
+        volumes = workspace_volumes(name, image, mode)
+        service["volumes"] = service["volumes"][:-1] + [src] + [
+            f"{volume}:{path}" for volume, path in volumes.items()
+        ]
+        if volumes:
+            service.setdefault("environment",
+                               {})["CCACHE_DIR"] = list(volumes.values())[-1]
+
+        if self.shm_group:
+            service = merge_compose_service(
+                service, self.shm_transport_service(name, service))
+            if name != self.shm_owner:
+                service.pop("shm_size", None)
+            # hostname can not be set when joining network of another one
+            if service.get("network_mode", "").startswith("container:"):
+                service.pop("hostname")
+
+        return service
+
+    def create(self, name: str,
+               args: argparse.Namespace) -> tuple[float, float]:
+        """
+        Create and start a container by docker api with the settings of its
+        compose service, called concurrently from worker threads
+
+        Parameters
+        ----------
+        name (str): name of the container
+        args (argparse.Namespace): arguments
+
+        Returns
+        -------
+        tuple: seconds to create and to start the container
+        """
+        import docker
+
+        service = self.compose_service(name, args.image, args.mode)
+
+        os.makedirs(os.path.join(PACKAGE_DIR, name), exist_ok=True)
+
+        api = docker_client().api
+        host_config = api.create_host_config(
+            binds=service.get("volumes"),
+            tmpfs={path: ""
+                   for path in service.get("tmpfs", [])},
+            group_add=service.get("group_add"),
+            privileged=service.get("privileged", False),
+            runtime=service.get("runtime"),
+            network_mode=service.get("network_mode"),
+            ipc_mode=service.get("ipc"),
+            cap_add=service.get("cap_add"),
+            cpuset_cpus=service.get("cpuset"),
+            mem_limit=service.get("mem_limit"),
+            shm_size=service.get("shm_size"),
+            ulimits=[
+                docker.types.Ulimit(name=ulimit, soft=limit, hard=limit)
+                if isinstance(limit, int) else docker.types.Ulimit(
+                    name=ulimit, soft=limit["soft"], hard=limit["hard"])
+                for ulimit, limit in service.get("ulimits", {}).items()
+            ] or None)
+
+        config = api.create_container_config(
+            service["image"],
+            None,
+            hostname=service.get("hostname"),
+            user=service.get("user"),
+            environment={
+                key: expand_compose_variables(str(value))
+                for key, value in service.get("environment", {}).items()
+            },
+            volumes=[volume.split(":")[1] for volume in service["volumes"]],
+            tty=service.get("tty", False),
+            stdin_open=service.get("stdin_open", False),
+            labels=service["labels"],
+            host_config=host_config)
+        # docker-py closes stdin after the first attach like "docker run -i",
+        # which ends the shell of the container, while compose keeps it open
+        config.update(StdinOnce=False, AttachStdin=False)
+
+        start = time.monotonic()
+        container = api.create_container_from_config(config, name)
+        created = time.monotonic()
+        api.start(container["Id"])
+
+        return created - start, time.monotonic() - created
+
+    def compose_up(self, name: str, args: argparse.Namespace) -> None:
+        """
+        Create and start a container by docker compose
+
+        Parameters
+        ----------
+        name (str): name of the container
+        args (argparse.Namespace): arguments
+        """
+        import yaml
+
+        os.makedirs(os.path.join(PACKAGE_DIR, name), exist_ok=True)
+
+        # create a temporary directory to store compose file
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            with open(os.path.join(tmp_dir, "docker-compose.yaml"), "w") as f:
+                yaml.dump(
+                    {
+                        "services": {
+                            "container":
+                            self.compose_service(name, args.image, args.mode)
+                        },
+                        # named without project prefix to be shared with
+                        # containers created by docker api
+                        "volumes": {
+                            volume: {
+                                "name": volume
+                            }
+                            for volume in workspace_volumes(
+                                name, args.image, args.mode)
+                        },
+                    },
+                    f)
+            if subprocess.run(["docker", "compose", "up", "-d"],
+                              cwd=tmp_dir).returncode != 0:
+                raise RuntimeError("docker compose up failed")
+
+    def execute(self, args):
+        self.profile_description, self.profile = self.resolve_profile(args)
+
+        # the owner of a new shared memory transport group is created first so
+        # that others can join it
+        self.shm_group = args.shm_transport
+        batches = [args.names]
+        if self.shm_group:
+            self.dds_dir = write_dds_profiles(self.shm_group)
+            self.shm_owner = self.shm_transport_owner(self.shm_group)
+            if self.shm_owner is None:
+                self.shm_owner = args.names[0]
+                batches = [args.names[:1], args.names[1:]]
+            elif inventory().container(self.shm_owner).status != "running":
+                print(f"ERROR: Container \"{self.shm_owner}\" owning "
+                      f"shared memory transport group \"{self.shm_group}\" "
+                      f"is not running, start it first")
+                exit(1)
+
+        unsupported = set(
+            merge_compose_service(load_compose_service(args.mode),
+                                  self.profile)) - set(self.SUPPORTED_KEYS)
+        if not args.compose and unsupported:
+            print(f"ERROR: {', '.join(sorted(unsupported))} of mode "
+                  f"{args.mode} not supported, use --compose instead")
+            exit(1)
+
+        if args.compose:
+            function = lambda name: self.compose_up(name, args)
+            jobs = 1
+        else:
+            function = lambda name: self.create(name, args)
+            jobs = args.jobs
+
+        start = time.monotonic()
+        errors = []
+        latencies = []
+        for name, latency, error, elapsed in (
+                result for batch in batches
+                for result in run_concurrently(function, batch, jobs)):
+            if error:
+                errors.append(f"failed to create {name}: "
+                              f"{error_message(error)}")
+                print(f"Creating container {name}... failed")
+            elif latency:
+                latencies.append(latency)
+                print(f"Creating container {name}... done in {elapsed:.2f}s "
+                      f"(create {latency[0] * 1000:.0f}ms, "
+                      f"start {latency[1] * 1000:.0f}ms)")
+            else:
+                print(f"Creating container {name}... done in {elapsed:.2f}s")
+        invalidate_completion_cache()
+
+        if len(args.names) > 1:
+            print(f"{len(args.names) - len(errors)} created, "
+                  f"{len(errors)} failed in {time.monotonic() - start:.2f}s")
+        if len(latencies) > 1:
+            create = sum(latency[0] for latency in latencies) / len(latencies)
+            started = sum(latency[1] for latency in latencies) / len(latencies)
+            print(f"average latency: create {create * 1000:.0f}ms, "
+                  f"start {started * 1000:.0f}ms")
+
+        for error in errors:
+            print(f"ERROR: {error}")
+        if errors:
+            exit(1)
+
+
+class NturtDockerContainerList(Command):
+    """
+    Command to list containers
+    """
+
+    HEADER = ["name", "image", "created", "status", "profile"]
+
+    @property
+    def name(self):
+        return "list"
+
+    @property
+    def help(self):
+        return "list containers"
+
+    # docker events that change the table
+    EVENTS = [
+        "create", "destroy", "die", "pause", "rename", "start", "unpause"
+    ]
+
+    def build_parser(self, parser):
+        parser.add_argument(
+            "-d",
+            "--detail",
+            help=
+            "inspect every container for precise start and exit time, slower",
+            action="store_true")
+        parser.add_argument(
+            "-w",
+            "--watch",
+            help="keep the table up to date by docker events until interrupted",
+            action="store_true")
+
+    def table(self, containers: Iterable[Container]) -> str:
+        """
+        Format containers as a table
+
+        Parameters
+        ----------
+        containers (Iterable): containers
+
+        Returns
+        -------
+        str: table
+        """
+        import prettytable
+
+        table = prettytable.PrettyTable()
+        table.field_names = self.HEADER
+        for container in containers:
+            table.add_row(container.to_str_array() +
+                          [container.labels.get(PROFILE_LABEL, "")])
+        return table.get_string()
+
+    def execute(self, args):
+        if args.watch:
+            # subscribe before listing so that no event is missed
+            events = docker_client().events(decode=True,
+                                            filters={
+                                                "type": "container",
+                                                "event": self.EVENTS
+                                            })
+
+        containers = {}
+        for container in inventory().containers:
+            if args.detail:
+                container.inspect()
+            containers[container.id] = container
+
+        if not args.watch:
+            print(self.table(containers.values()))
+            return
+
+        # the table is only redrawn on change, so the load on docker daemon does
+        # not depend on how often containers are looked at
+        printed_lines = redraw(self.table(containers.values()), 0)
+        try:
+            for event in events:
+                if apply_container_event(containers, event):
+                    printed_lines = redraw(self.table(containers.values()),
+                                           printed_lines)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            events.close()
+
+
+class ContainerSelectCommand(Command):
+    """
+    Abstract class for commands selecting containers by names, --all or
+    --label
+    """
+
+    # status of containers selected by --all, None for all containers
+    SELECT_STATUS = None
+
+    def selectable(self, container: Container,
+                   args: argparse.Namespace) -> bool:
+        """
+        Check if a container is selected by --all or --label
+
+        Parameters
+        ----------
+        container (Container): container to check
+        args (argparse.Namespace): arguments
+
+        Returns
+        -------
+        bool: True if the container is selected
+        """
+        return (self.SELECT_STATUS is None
+                or container.status == self.SELECT_STATUS)
+
+    def build_containers_argument(self,
+                                  parser: argparse.ArgumentParser) -> None:
+        """
+        Add positional argument of container names to parser
+
+        Parameters
+        ----------
+        parser (argparse.ArgumentParser): parser to add to
+        """
+        parser.add_argument(
+            "containers",
+            help=f"containers to {self.name}",
+            metavar="CONTAINERS",
+            nargs="*").completer = LazyChoices(
+                lambda: list_container_names(self.SELECT_STATUS))
+
+    def build_parser(self, parser):
+        self.build_containers_argument(parser)
+        parser.add_argument("-a",
+                            "--all",
+                            help=f"{self.name} all applicable containers",
+                            action="store_true")
+        parser.add_argument(
+            "-l",
+            "--label",
+            help=
+            "only select containers with label KEY or KEY=VALUE, can be repeated",
+            metavar="KEY[=VALUE]",
+            action="append")
+
+    def select(self,
+               args: argparse.Namespace) -> tuple[list[Container], list[str]]:
+        """
+        Select containers from names, --all and --label
+
+        Parameters
+        ----------
+        args (argparse.Namespace): arguments
+
+        Returns
+        -------
+        tuple: list of selected containers and list of names not found
+        """
+        sys_inventory = inventory()
+        if args.containers:
+            containers = [
+                sys_inventory.container(name) for name in args.containers
+            ]
+            missing = [
+                name for name, container in zip(args.containers, containers)
+                if container is None
+            ]
+            containers = [
+                container for container in containers if container is not None
+            ]
+        elif args.all or args.label:
+            containers = [
+                container for container in sys_inventory.containers
+                if self.selectable(container, args)
+            ]
+            missing = []
+        else:
+            print("ERROR: no container specified, "
+                  "use CONTAINERS, --all or --label to select containers")
+            exit(1)
+
+        for label in args.label or []:
+            key, _, value = label.partition("=")
+            containers = [
+                container for container in containers
+                if key in container.labels and (
+                    not value or container.labels[key] == value)
+            ]
+
+        return containers, missing
+
+
+class ContainerBulkCommand(ContainerSelectCommand):
+    """
+    Abstract class for commands operating on multiple containers concurrently
+    """
+
+    @property
+    @abstractmethod
+    def progress(self) -> str:
+        """
+        Progress message of operating on a container, e.g. "Stopping"
+
+        Returns
+        -------
+        str: progress message
+        """
+        pass
+
+    @abstractmethod
+    def operate(self, container: Container, args: argparse.Namespace) -> None:
+        """
+        Operate on a container, called concurrently from worker threads
+
+        Parameters
+        ----------
+        container (Container): container to operate on
+        args (argparse.Namespace): arguments
+        """
+        pass
+
+    def build_parser(self, parser):
+        super().build_parser(parser)
+        parser.add_argument(
+            "-j",
+            "--jobs",
+            help=
+            f"number of containers to operate on concurrently, default to {DEFAULT_JOBS}",
+            type=int,
+            default=DEFAULT_JOBS)
+
+    def execute(self, args):
+        containers, missing = self.select(args)
+        errors = {name: "no such container" for name in missing}
+
+        succeeded = 0
+        for container, _, error, elapsed in run_concurrently(
+                lambda container: self.operate(container, args), containers,
+                args.jobs):
+            if error:
+                errors[container.name] = error_message(error)
+                print(f"{self.progress} container {container.name}... "
+                      f"failed after {elapsed:.1f}s")
+            else:
+                succeeded += 1
+                print(f"{self.progress} container {container.name}... "
+                      f"done in {elapsed:.1f}s")
+        if containers:
+            invalidate_completion_cache()
+
+        print(f"{succeeded} succeeded, {len(errors)} failed")
+        for name, error in errors.items():
+            print(f"ERROR: container {name}: {error}")
+        if errors:
+            exit(1)
+
+
+class NturtDockerContainerRemove(ContainerBulkCommand):
+    """
+    Command to remove containers
+    """
+
+    @property
+    def name(self):
+        return "remove"
+
+    @property
+    def help(self):
+        return "remove containers"
+
+    @property
+    def progress(self):
+        return "Removing"
+
+    def build_parser(self, parser):
+        super().build_parser(parser)
+        parser.add_argument(
+            "-f",
+            "--force",
+            help="force remove containers even if it's running",
+            action="store_true")
+
+    def selectable(self, container, args):
+        # running containers are only selected by --all when forced
+        return args.force or container.status != "running"
+
+    def operate(self, container, args):
+        if container.status == "running" and not args.force:
+            raise RuntimeError("container is running, use --force to remove")
+        docker_client().api.remove_container(container.id, force=args.force)
+
+
+class NturtDockerContainerRestart(ContainerBulkCommand):
+    """
+    Command to restart containers
+    """
+
+    SELECT_STATUS = "running"
+
+    @property
+    def name(self):
+        return "restart"
+
+    @property
+    def help(self):
+        return "restart containers"
+
+    @property
+    def progress(self):
+        return "Restarting"
+
+    def operate(self, container, args):
+        docker_client().api.restart(container.id)
+
+
+class SplitCommandAction(argparse.Action):
+    """
+    Action splitting "CONTAINERS -- COMMAND" into containers and command,
+    since a positional of any number of containers would take the command
+    """
+
+    def __call__(self, parser, namespace, values, option_string=None):
+        if "--" not in values:
+            parser.error("command to run must be given after \"--\"")
+        index = values.index("--")
+        namespace.containers = values[:index]
+        namespace.command = values[index + 1:]
+        # options after the first container are taken by the remainder too
+        for value in namespace.containers:
+            if value.startswith("-"):
+                parser.error(f"option \"{value}\" must be given before "
+                             "containers, e.g. \"exec -j 2 c0 -- ls\"")
+        if not namespace.command:
+            parser.error("no command given after \"--\"")
+
+
+class NturtDockerContainerExec(ContainerSelectCommand):
+    """
+    Command to run a command in containers concurrently
+    """
+
+    SELECT_STATUS = "running"
+
+    HEADER = ["name", "exit code", "time", "note"]
+
+    @property
+    def name(self):
+        return "exec"
+
+    @property
+    def help(self):
+        return "run a command in containers concurrently"
+
+    def build_containers_argument(self, parser):
+        parser.add_argument(
+            "containers",
+            help=
+            "containers to run the command in, followed by \"--\" and the command, stopped containers given by name are started",
+            metavar="CONTAINERS -- COMMAND",
+            nargs=argparse.REMAINDER,
+            action=SplitCommandAction).completer = LazyChoices(
+                lambda: list_container_names())
+
+    def build_parser(self, parser):
+        super().build_parser(parser)
+        parser.add_argument(
+            "-j",
+            "--jobs",
+            help=
+            f"number of containers to run the command in concurrently, default to {DEFAULT_JOBS}",
+            type=int,
+            default=DEFAULT_JOBS)
+        parser.add_argument("-u",
+                            "--user",
+                            help="user to run the command as",
+                            default="")
+        parser.add_argument("-w",
+                            "--workdir",
+                            help="working directory to run the command in")
+
+    def print_lines(self, name: str, data: bytes, buffer: bytearray,
+                    is_stderr: bool) -> None:
+        """
+        Print complete lines of output of a container prefixed by its name
+
+        Parameters
+        ----------
+        name (str): name of the container
+        data (bytes): output received, empty to flush incomplete line
+        buffer (bytearray): incomplete line of the stream
+        is_stderr (bool): if the output is from stderr
+        """
+        buffer += data
+        if data:
+            end = buffer.rfind(b"\n") + 1
+        else:
+            end = len(buffer)
+        if not end:
+            return
+
+        lines = buffer[:end].decode(errors="replace").splitlines()
+        del buffer[:end]
+        separator = "!" if is_stderr else "|"
+        with self.print_lock:
+            for line in lines:
+                print(f"{name:<{self.width}} {separator} {line}",
+                      file=sys.stderr if is_stderr else sys.stdout)
+            (sys.stderr if is_stderr else sys.stdout).flush()
+
+    def run(self, container: Container, args: argparse.Namespace) -> int:
+        """
+        Run the command in a container and stream its output, called
+        concurrently from worker threads
+
+        Parameters
+        ----------
+        container (Container): container to run in
+        args (argparse.Namespace): arguments
+
+        Returns
+        -------
+        int: exit code of the command
+        """
+        api = docker_client().api
+        if container.status != "running":
+            api.start(container.id)
+            self.started.append(container.name)
+
+        exec_id = api.exec_create(container.id,
+                                  args.command,
+                                  user=args.user,
+                                  workdir=args.workdir)["Id"]
+        buffers = (bytearray(), bytearray())
+        for chunks in api.exec_start(exec_id, stream=True, demux=True):
+            for is_stderr, chunk in enumerate(chunks):
+                if chunk:
+                    self.print_lines(container.name, chunk, buffers[is_stderr],
+                                     bool(is_stderr))
+        for is_stderr, buffer in enumerate(buffers):
+            self.print_lines(container.name, b"", buffer, bool(is_stderr))
+
+        return api.exec_inspect(exec_id)["ExitCode"]
+
+    def execute(self, args):
+        import prettytable
+
+        containers, missing = self.select(args)
+        self.print_lock = threading.Lock()
+        self.started = []
+        self.width = max([len(name) for name in args.containers] +
+                         [len(container.name)
+                          for container in containers] + [0])
+
+        table = prettytable.PrettyTable()
+        table.field_names = self.HEADER
+        table.align["name"] = "l"
+        failed = len(missing)
+        for name in missing:
+            table.add_row([name, "-", "-", "no such container"])
+
+        for container, exit_code, error, elapsed in run_concurrently(
+                lambda container: self.run(container, args), containers,
+                args.jobs):
+            note = "started" if container.name in self.started else ""
+            if error:
+                failed += 1
+                table.add_row([
+                    container.name, "-", f"{elapsed:.1f}s",
+                    error_message(error)
+                ])
+            else:
+                failed += exit_code != 0
+                table.add_row(
+                    [container.name, exit_code, f"{elapsed:.1f}s", note])
+        if self.started:
+            invalidate_completion_cache()
+
+        table.sortby = "name"
+        print(table)
+        print(f"{len(containers) + len(missing) - failed} succeeded, "
+              f"{failed} failed")
+        if failed:
+            exit(1)
+
+
+class NturtDockerContainerShell(Command):
+    """
+    Command to attach shell into container
+    """
+
+    @property
+    def name(self):
+        return "shell"
+
+    @property
+    def help(self):
+        return "attach shell into container"
+
+    def build_parser(self, parser):
+        parser.add_argument("container",
+                            help="container to shell into",
+                            metavar="CONTAINER",
+                            choices=LazyChoices(list_container_names))
+        parser.add_argument("-s",
+                            "--shell",
+                            help="shell to use, defualt to bash",
+                            default="bash")
+
+    def execute(self, args):
+        container = docker_client().containers.get(args.container)
+        if container.status != "running":
+            print("Container is not running, starting it...")
+            container.start()
+            invalidate_completion_cache()
+        subprocess.run(["docker", "exec", "-it", args.container, args.shell])
+
+
+class NturtDockerContainerStart(ContainerBulkCommand):
+    """
+    Command to start containers
+    """
+
+    SELECT_STATUS = "exited"
+
+    @property
+    def name(self):
+        return "start"
+
+    @property
+    def help(self):
+        return "start containers"
+
+    @property
+    def progress(self):
+        return "Starting"
+
+    def operate(self, container, args):
+        docker_client().api.start(container.id)
+
+
+class NturtDockerContainerStats(ContainerSelectCommand):
+    """
+    Command to show live resource usage of containers
+    """
+
+    SELECT_STATUS = "running"
+
+    HEADER = [
+        "name", "cpu", "memory", "memory %", "net rx/tx", "net rate",
+        "block read/write", "block rate", "pids"
+    ]
+
+    @property
+    def name(self):
+        return "stats"
+
+    @property
+    def help(self):
+        return "show live resource usage of containers"
+
+    def build_parser(self, parser):
+        super().build_parser(parser)
+        parser.add_argument(
+            "--once",
+            help=
+            "show a single snapshot instead of streaming, rates are measured between its first two samples",
+            action="store_true")
+        parser.add_argument(
+            "-f",
+            "--format",
+            help=
+            "output format, csv and ndjson output every sample for post-run analysis, default to table",
+            choices=["table", "csv", "ndjson"],
+            default="table")
+        parser.add_argument(
+            "-i",
+            "--interval",
+            help="seconds between redrawing the table, default to 1",
+            type=float,
+            default=1.0)
+
+    def output(self, stats: ContainerStats) -> None:
+        """
+        Output a sample in csv or ndjson format, called from stream threads
+
+        Parameters
+        ----------
+        stats (ContainerStats): stats updated by the sample
+        """
+        with self.lock:
+            if self.writer is not None:
+                self.writer.writerow(stats.to_dict())
+            else:
+                print(json.dumps(stats.to_dict()))
+            sys.stdout.flush()
+
+    def stream(self, container: Container, args: argparse.Namespace) -> None:
+        """
+        Stream stats of a container until it stops, run in its own thread
+
+        Parameters
+        ----------
+        container (Container): container to stream stats of
+        args (argparse.Namespace): arguments
+        """
+        stats = self.stats[container.name]
+        try:
+            # rates are deltas between samples, so a snapshot takes two
+            for index, sample in enumerate(
+                    container_stats_samples(container.id,
+                                            2 if args.once else None)):
+                with self.lock:
+                    stats.feed(sample)
+                if args.format != "table" and not (args.once and index == 0):
+                    self.output(stats)
+        except Exception as error:
+            with self.lock:
+                self.errors[container.name] = error_message(error)
+
+    def print_table(self) -> None:
+        """
+        Print the table of stats, redrawn in place if stdout is a terminal
+        """
+        import prettytable
+
+        table = prettytable.PrettyTable()
+        table.field_names = self.HEADER
+        table.align = "r"
+        table.align["name"] = "l"
+        with self.lock:
+            for stats in self.stats.values():
+                table.add_row(stats.to_str_array())
+
+        self.printed_lines = redraw(table.get_string(), self.printed_lines)
+
+    def execute(self, args):
+        containers, missing = self.select(args)
+        self.errors = {name: "no such container" for name in missing}
+        for container in containers:
+            if container.status != "running":
+                self.errors[container.name] = "container is not running"
+        containers = [
+            container for container in containers
+            if container.name not in self.errors
+        ]
+
+        self.lock = threading.Lock()
+        self.stats = {
+            container.name: ContainerStats(container.name)
+            for container in containers
+        }
+        self.printed_lines = 0
+        self.writer = None
+        if args.format == "csv":
+            import csv
+
+            self.writer = csv.DictWriter(sys.stdout,
+                                         fieldnames=ContainerStats.FIELDS)
+            self.writer.writeheader()
+
+        # every stream is long-lived, so each container has its own thread
+        threads = [
+            threading.Thread(target=self.stream,
+                             args=(container, args),
+                             daemon=True) for container in containers
+        ]
+        for thread in threads:
+            thread.start()
+        try:
+            while any(thread.is_alive() for thread in threads):
+                if args.format == "table" and not args.once:
+                    self.print_table()
+                deadline = time.monotonic() + args.interval
+                for thread in threads:
+                    thread.join(max(0, deadline - time.monotonic()))
+        except KeyboardInterrupt:
+            pass
+        if args.format == "table" and (args.once or not containers):
+            self.print_table()
+
+        for name, error in self.errors.items():
+            # keep csv and ndjson output parsable
+            print(f"ERROR: container {name}: {error}",
+                  file=sys.stdout if args.format == "table" else sys.stderr)
+        if self.errors:
+            exit(1)
+
+
+class NturtDockerContainerStop(ContainerBulkCommand):
+    """
+    Command to stop containers
+    """
+
+    SELECT_STATUS = "running"
+
+    @property
+    def name(self):
+        return "stop"
+
+    @property
+    def help(self):
+        return "stop containers"
+
+    @property
+    def progress(self):
+        return "Stopping"
+
+    def operate(self, container, args):
+        docker_client().api.stop(container.id)
+
+
+class NturtDockerContainer(MetaCommand):
+    """
+    Meta command for container related sub-commands
+    """
+
+    @property
+    def name(self):
+        return "container"
+
+    @property
+    def help(self):
+        return "Various container related sub-commands"
+
+    @property
+    def subcommands(self):
+        return [
+            NturtDockerContainerBuild(),
+            NturtDockerContainerCreate(),
+            NturtDockerContainerExec(),
+            NturtDockerContainerList(),
+            NturtDockerContainerRemove(),
+            NturtDockerContainerRestart(),
+            NturtDockerContainerShell(),
+            NturtDockerContainerStart(),
+            NturtDockerContainerStats(),
+            NturtDockerContainerStop()
+        ]
+
+
+# image commands ###############################################################
+class ImageSelectCommand(Command):
+    """
+    Abstract class for commands operating on nturt images selected by IMAGES,
+    --all or --target
+    """
+
+    def build_parser(self, parser):
+        parser.add_argument(
+            "images",
+            help=f"images to {self.name}",
+            metavar="IMAGES",
+            nargs="*").completer = LazyChoices(list_nturt_image_tags)
+        parser.add_argument("-a",
+                            "--all",
+                            help=f"{self.name} all nturt images",
+                            action="store_true")
+        parser.add_argument("-t",
+                            "--target",
+                            help=f"{self.name} all nturt images of targets",
+                            metavar="TARGET",
+                            choices=LazyChoices(list_nturt_targets),
+                            action="append")
+
+    def select(self, args: argparse.Namespace) -> list[str]:
+        """
+        Select images to operate on by IMAGES, --all and --target
+
+        Parameters
+        ----------
+        args (argparse.Namespace): arguments
+
+        Returns
+        -------
+        list: list of selected images
+        """
+        images = list_nturt_image_tags()
+        selected = [
+            image for image in images if args.all or image in args.images or
+            (args.target and image.split(":")[1].split("-")[0] in args.target)
+        ]
+
+        for image in args.images:
+            if image not in images:
+                print(f"ERROR: {image} is not a nturt image")
+                exit(1)
+        if not selected:
+            print("ERROR: no image specified, "
+                  "use IMAGES, --all or --target to select images")
+            exit(1)
+
+        return selected
+
+
+class NturtDockerImageBuild(ImageSelectCommand):
+    """
+    Command to build nturt images, built after the images they depend on
+    """
+
+    @property
+    def name(self):
+        return "build"
+
+    @property
+    def help(self):
+        return "build nturt images natively"
+
+    def build_parser(self, parser):
+        super().build_parser(parser)
+        parser.add_argument("--no-cache",
+                            help="do not use cache when building images",
+                            action="store_true")
+        parser.add_argument(
+            "-f",
+            "--force",
+            help=
+            "build images even if they are up to date with their build context and base images",
+            action="store_true")
+        parser.add_argument(
+            "--pull",
+            help="pull new versions of external base images before building",
+            action="store_true")
+        # deprecated, cache is used and base images are not pulled by default
+        parser.add_argument("--cache",
+                            help=argparse.SUPPRESS,
+                            action="store_true")
+        parser.add_argument("--not-pull",
+                            help=argparse.SUPPRESS,
+                            action="store_true")
+        parser.add_argument(
+            "-j",
+            "--jobs",
+            help="number of images to build concurrently, default to 2",
+            type=int,
+            default=2)
+        parser.add_argument(
+            "--build-memory",
+            help=
+            "memory reserved for every concurrent build, limits concurrent builds to available memory, default to 4GB",
+            metavar="SIZE",
+            type=human_to_bytes,
+            default="4GB")
+        parser.add_argument(
+            "--trace",
+            help="write timing of every build step to FILE in JSON format",
+            metavar="FILE")
+        parser.add_argument(
+            "--platform",
+            help=
+            "build images for comma separated PLATFORMS concurrently with buildx and qemu emulation, e.g. amd64,arm64, tagged with the architecture appended",
+            metavar="PLATFORMS",
+            type=parse_platforms)
+        parser.add_argument(
+            "--oci",
+            help=
+            "write images built for --platform to OCI layout directories in DIR instead of loading them",
+            metavar="DIR")
+        parser.add_argument(
+            "--cache-from",
+            help=
+            f"use build cache from DIR exported by --cache-to, default to {BUILD_CACHE_DIR}",
+            metavar="DIR",
+            nargs="?",
+            const=BUILD_CACHE_DIR)
+        parser.add_argument(
+            "--cache-to",
+            help=
+            f"export build cache to DIR with buildx, which can be copied or shared to other machines, default to {BUILD_CACHE_DIR}",
+            metavar="DIR",
+            nargs="?",
+            const=BUILD_CACHE_DIR)
+
+    def build(self,
+              image: str,
+              args: argparse.Namespace,
+              platform: str | None = None) -> bool:
+        """
+        Build an image unless it is up to date, called concurrently from worker
+        threads after the images it is built from
+
+        Parameters
+        ----------
+        image (str): image to build
+        args (argparse.Namespace): arguments
+        platform (str): platform to build for, None for the default
+
+        Returns
+        -------
+        bool: True if built, False if up to date
+        """
+        tag = platform_image_tag(image, platform) if platform else image
 
+        # base images are resolved now since they may be built in this run,
+        # images in OCI layout directories are not checked and always built
+        fingerprint = nturt_image_fingerprint(image, platform)
+        existing = inventory().image(*tag.split(":"))
+        if not args.force and not args.oci and existing and existing.labels.get(
+                FINGERPRINT_LABEL) == fingerprint:
+            return False
 
-# commands #####################################################################
-# contianer commands ###########################################################
-class NturtDockerContainerCreate(Command):
+        # our Dockerfiles select stages by TARGETARCH, which requires BuildKit,
+        # and its plain progress output is parsed for per-step timing
+        cmd = ["docker", "build", "--progress", "plain"]
+
+        if args.no_cache:
+            cmd.append("--no-cache")
+
+        # build cache of every image is kept in its own directory so that it
+        # can be trimmed by image, and is exported to a new directory that
+        # replaces the old one after the build, as exporting to where the cache
+        # is imported from keeps every old layer
+        if args.cache_from or args.cache_to or platform:
+            cmd = ["docker", "buildx", "build"] + cmd[2:]
+        if args.cache_from:
+            cache_from = nturt_image_subdir(args.cache_from, tag)
+            if os.path.isfile(os.path.join(cache_from, "index.json")):
+                cmd.extend(["--cache-from", f"type=local,src={cache_from}"])
+                # modification time of the directory records when it is used
+                os.utime(cache_from)
+        if args.cache_to:
+            cache_to = nturt_image_subdir(args.cache_to, tag)
+            cmd.extend(
+                ["--cache-to", f"type=local,dest={cache_to}.new,mode=max"])
+
+        if platform:
+            cmd.extend(["--platform", platform])
+            # nturt base images are replaced by the ones built for the platform
+            for base in nturt_image_graph()[image]:
+                base_tag = platform_image_tag(base, platform)
+                if args.oci:
+                    source = "oci-layout://" + nturt_image_subdir(
+                        os.path.abspath(args.oci),
+                        base_tag) + ":" + base_tag.split(":")[1]
+                else:
+                    source = "docker-image://" + base_tag
+                cmd.extend(["--build-context", f"{base}={source}"])
+        if platform and args.oci:
+            cmd.extend([
+                "--output", "type=oci,tar=false,dest=" +
+                nturt_image_subdir(os.path.abspath(args.oci), tag)
+            ])
+        elif cmd[1] == "buildx":
+            cmd.append("--load")
+
+        cmd.extend([
+            "--label", f"{FINGERPRINT_LABEL}={fingerprint}", "--tag", tag, "."
+        ])
+
+        progress = BuildProgress()
+        self.progresses[tag] = progress
+
+        # prefix output by image since builds run concurrently
+        prefix = f"[{tag.split(':')[1]}] "
+        process = subprocess.Popen(cmd,
+                                   cwd=nturt_image_dir(image),
+                                   env=dict(os.environ, DOCKER_BUILDKIT="1"),
+                                   stdout=subprocess.PIPE,
+                                   stderr=subprocess.STDOUT,
+                                   text=True)
+        for line in process.stdout:
+            progress.feed(line)
+            print(prefix + line, end="")
+        progress.finish()
+        if process.wait() != 0:
+            raise RuntimeError(
+                f"docker build exited with {process.returncode}")
+
+        if args.cache_to:
+            import shutil
+
+            shutil.rmtree(cache_to, ignore_errors=True)
+            os.replace(cache_to + ".new", cache_to)
+        return True
+
+    def print_steps(self) -> None:
+        """
+        Print wall time and cache hit of every build step
+        """
+        import prettytable
+
+        if not self.progresses:
+            return
+
+        table = prettytable.PrettyTable()
+        table.field_names = ["image", "step", "time", "cache"]
+        table.align["step"] = "l"
+        table.align["time"] = "r"
+        for image, progress in self.progresses.items():
+            steps = progress.instruction_steps()
+            for step in steps:
+                if step.error:
+                    cache = "error"
+                elif step.cached:
+                    cache = "hit"
+                else:
+                    cache = "miss"
+                if step.elapsed is None:
+                    elapsed = "N/A"
+                else:
+                    elapsed = f"{step.elapsed:.1f}s"
+                table.add_row(
+                    [image.split(":")[1], step.name[:60], elapsed, cache])
+            hits = sum(step.cached for step in steps)
+            print(f"{image}: {hits}/{len(steps)} steps cached, "
+                  f"{progress.elapsed:.1f}s")
+        print(table)
+
+    def execute(self, args):
+        from concurrent.futures import CancelledError
+
+        graph = nturt_image_graph()
+        selected = self.select(args)
+
+        # images are built for every platform separately, so that platforms
+        # are built concurrently and an image is built after its bases built
+        # for the same platform
+        if args.oci and not args.platform:
+            print("ERROR: --oci requires --platform")
+            exit(1)
+        if args.platform:
+            missing = missing_emulators(args.platform)
+            if missing:
+                print(f"ERROR: no qemu emulator registered for "
+                      f"{', '.join(missing)}, register them by running:\n"
+                      f"docker run --privileged --rm tonistiigi/binfmt "
+                      f"--install all")
+                exit(1)
+            targets = {
+                platform_image_tag(image, platform): (image, platform)
+                for platform in args.platform
+                for image in selected
+            }
+            to_build = {
+                tag: [
+                    platform_image_tag(parent, platform)
+                    for parent in graph[image]
+                ]
+                for tag, (image, platform) in targets.items()
+            }
+        else:
+            targets = {image: (image, None) for image in selected}
+            to_build = {image: graph[image] for image in selected}
+
+        # pull external base images up front so that fingerprints are computed
+        # from the pulled ones, nturt base images must not be pulled, or images
+        # built in this run would be replaced by the published ones
+        if args.pull:
+            for base in sorted({
+                    base
+                    for image in selected
+                    for base in parse_dockerfile_bases(
+                        os.path.join(nturt_image_dir(image), "Dockerfile"))
+                    if base not in graph
+            }):
+                print(f"Pulling base image {base}...")
+                docker_client().api.pull(*base.rsplit(":", 1))
+
+        jobs = args.jobs
+        memory = available_memory()
+        if memory:
+            jobs = max(1, min(jobs, memory // args.build_memory))
+
+        self.progresses = {}
+        results = {}
+        for image, built, error, elapsed in run_dag(
+                lambda tag: self.build(targets[tag][0], args, targets[tag][1]),
+                to_build, jobs):
+            if isinstance(error, CancelledError):
+                results[image] = (f"cancelled, {error}", elapsed)
+            elif error:
+                results[image] = (f"failed: {error_message(error)}", elapsed)
+            elif built:
+                results[image] = ("built", elapsed)
+            else:
+                results[image] = ("up to date", elapsed)
+        if self.progresses:
+            invalidate_completion_cache()
+
+        self.print_steps()
+        print("Build summary:")
+        for image in targets:
+            result, elapsed = results[image]
+            print(f"  {image}: {result} ({elapsed:.1f}s)")
+        for platform in args.platform or []:
+            elapsed = sum(results[tag][1]
+                          for tag, (_, tag_platform) in targets.items()
+                          if tag_platform == platform)
+            print(f"  {platform}: {elapsed:.1f}s of build time")
+
+        if args.trace:
+            with open(args.trace, "w") as f:
+                json.dump(
+                    {
+                        image: dict(progress.to_dict(),
+                                    result=results[image][0])
+                        for image, progress in self.progresses.items()
+                    },
+                    f,
+                    indent=2)
+        if any(
+                result.startswith(("failed", "cancelled"))
+                for result, _ in results.values()):
+            exit(1)
+
+
+class NturtDockerImagePull(ImageSelectCommand):
     """
-    Command to create containers
+    Command to pull nturt images concurrently
     """
 
     @property
     def name(self):
-        return "create"
+        return "pull"
 
     @property
     def help(self):
-        return "create containers"
+        return "pull nturt images concurrently"
 
     def build_parser(self, parser):
-        parser.add_argument("name",
-                            help="name of the container to create",
-                            metavar="NAME")
-        parser.add_argument("image",
-                            help="image to use",
-                            metavar="IMAGE",
-                            choices=[
-                                f"{image.name}:{image.tag}"
-                                for image in list_nturt_images()
-                            ])
-        parser.add_argument("mode",
-                            help="mode of the container to create",
-                            metavar="MODE",
-                            choices=list_nturt_compose_files())
+        super().build_parser(parser)
+        parser.add_argument(
+            "-j",
+            "--jobs",
+            help=
+            f"number of images to pull concurrently, default to {DEFAULT_JOBS}",
+            type=int,
+            default=DEFAULT_JOBS)
+        parser.add_argument(
+            "--registry",
+            help=
+            "pull from registry HOST[:PORT] instead of docker hub, e.g. a local mirror, and tag images as from docker hub",
+            metavar="HOST")
+
+    def pull(self, image: str, args: argparse.Namespace) -> None:
+        """
+        Pull an image, called concurrently from worker threads
+
+        Parameters
+        ----------
+        image (str): image to pull
+        args (argparse.Namespace): arguments
+        """
+        repository, tag = image.split(":")
+        if args.registry:
+            repository = f"{args.registry}/{repository}"
+
+        api = docker_client().api
+        for event in api.pull(repository, tag, stream=True, decode=True):
+            self.progress.feed(image, event)
+            self.print_progress()
+
+        if args.registry:
+            api.tag(f"{repository}:{tag}", image.split(":")[0], tag)
+            # only removes the tag since the image is still tagged
+            api.remove_image(f"{repository}:{tag}")
+
+    def print_progress(self, final: bool = False) -> None:
+        """
+        Print aggregate progress of all pulls in place, at most every 0.1s
+        unless final
+
+        Parameters
+        ----------
+        final (bool): if the progress is the final one
+        """
+        if not sys.stdout.isatty() and not final:
+            return
+        now = time.monotonic()
+        with self.print_lock:
+            if not final and now - self.printed < 0.1:
+                return
+            self.printed = now
+
+            summary = self.progress.summary()
+            line = (
+                f"{self.done}/{self.total} images, "
+                f"{summary['downloaded_layers']}/"
+                f"{summary['layers'] - summary['existing_layers']} layers, "
+                f"{bytes_to_human(summary['downloaded'])}/"
+                f"{bytes_to_human(summary['total'])}, "
+                f"{bytes_to_human(summary['throughput'])}/s")
+            if sys.stdout.isatty():
+                print("\r\033[K" + line,
+                      end="" if not final else "\n",
+                      flush=True)
+            else:
+                print(line)
+
+    def execute(self, args):
+        selected = self.select(args)
+
+        self.progress = PullProgress()
+        self.print_lock = threading.Lock()
+        self.printed = 0.0
+        self.done = 0
+        self.total = len(selected)
+
+        # the daemon downloads a layer shared by concurrent pulls only once
+        errors = []
+        for image, _, error, elapsed in run_concurrently(
+                lambda image: self.pull(image, args), selected, args.jobs):
+            self.done += 1
+            with self.print_lock:
+                if sys.stdout.isatty():
+                    print("\r\033[K", end="")
+                if error:
+                    errors.append(f"failed to pull {image}: "
+                                  f"{error_message(error)}")
+                    print(f"Pulling {image}... failed in {elapsed:.1f}s")
+                else:
+                    print(f"Pulling {image}... done in {elapsed:.1f}s")
+            self.print_progress()
+        self.print_progress(final=True)
+        invalidate_completion_cache()
+
+        summary = self.progress.summary()
+        print(f"{self.total - len(errors)} pulled, {len(errors)} failed, "
+              f"{summary['downloaded_layers']} layers downloaded, "
+              f"{summary['existing_layers']} already existed, "
+              f"{summary['shared_layers']} shared between images")
+        print(f"{bytes_to_human(summary['downloaded'])} in "
+              f"{summary['elapsed']:.1f}s, "
+              f"{bytes_to_human(summary['throughput'])}/s")
+
+        for error in errors:
+            print(f"ERROR: {error}")
+        if errors:
+            exit(1)
+
+
+class NturtDockerImageAnalyze(Command):
+    """
+    Command to analyze layers shared between nturt images
+    """
+
+    @property
+    def name(self):
+        return "analyze"
+
+    @property
+    def help(self):
+        return "analyze disk usage of nturt images by their shared layers"
+
+    def build_parser(self, parser):
+        parser.add_argument("-i",
+                            "--images",
+                            help="analyze distros of specified image",
+                            metavar="IMAGES",
+                            choices=AVAILABLE_IMAGES,
+                            nargs="+")
+        parser.add_argument(
+            "-n",
+            "--top",
+            help="number of biggest layers to show, default to 10",
+            type=int,
+            default=10)
+
+    @staticmethod
+    def format_instruction(instruction: str) -> str:
+        """
+        Shorten instruction in image history for display
+
+        Parameters
+        ----------
+        instruction (str): instruction in image history
+
+        Returns
+        -------
+        str: shortened instruction
+        """
+        instruction = instruction.removesuffix("# buildkit")
+        for prefix in ["/bin/sh -c #(nop) ", "/bin/sh -c ", "|"]:
+            instruction = instruction.replace(prefix, "")
+        instruction = " ".join(instruction.split())
+        if len(instruction) > 70:
+            instruction = instruction[:67] + "..."
+        return instruction
+
+    def execute(self, args):
+        import prettytable
+
+        images = [
+            image for image in list_nturt_images(args.images) if image.id
+        ]
+        if not images:
+            print("ERROR: no nturt image available to analyze")
+            exit(1)
+
+        # chain id -> [size, instruction, tags of images having the layer]
+        layers = {}
+        image_layers_of = {}
+        for image, result, error, _ in run_concurrently(
+                lambda image: image_layers(image.id), images, DEFAULT_JOBS):
+            if error:
+                print(f"ERROR: failed to analyze {image.name}:{image.tag}: "
+                      f"{error_message(error)}")
+                exit(1)
+            image_layers_of[image] = result
+            if result and result[0][1] is None:
+                print(f"WARNING: sizes of layers of {image.name}:{image.tag} "
+                      "are unknown since its history does not match its "
+                      "layers")
+            for chain_id, size, instruction in result:
+                layer = layers.setdefault(chain_id, [size, instruction, set()])
+                # the size may be known from another image having the layer
+                if layer[0] is None:
+                    layer[0], layer[1] = size, instruction
+                layer[2].add(image.tag)
+
+        table = prettytable.PrettyTable()
+        table.field_names = ["image", "layers", "size", "unique", "shared"]
+        for column in table.field_names[1:]:
+            table.align[column] = "r"
+        for image in images:
+            result = [layers[layer[0]] for layer in image_layers_of[image]]
+            size = sum(layer[0] or 0 for layer in result)
+            unique = sum(layer[0] or 0 for layer in result
+                         if len(layer[2]) == 1)
+            # sums of layers of unknown sizes are only lower bounds
+            prefix = ">=" if any(layer[0] is None for layer in result) else ""
+            table.add_row([
+                image.tag,
+                len(result), prefix + bytes_to_human(size),
+                prefix + bytes_to_human(unique),
+                prefix + bytes_to_human(size - unique)
+            ])
+        print(table)
+
+        total = sum(
+            (layer[0] or 0) * len(layer[2]) for layer in layers.values())
+        disk = sum(layer[0] or 0 for layer in layers.values())
+        prefix = (">=" if any(layer[0] is None
+                              for layer in layers.values()) else "")
+        print(f"Total: {prefix}{bytes_to_human(total)} summing image sizes, "
+              f"{prefix}{bytes_to_human(disk)} on disk, "
+              f"{prefix}{bytes_to_human(total - disk)} shared")
+
+        table = prettytable.PrettyTable()
+        table.field_names = ["size", "images", "instruction"]
+        table.align["size"] = "r"
+        table.align["images"] = "l"
+        table.align["instruction"] = "l"
+        # layers of unknown sizes are the last
+        for size, instruction, tags in sorted(layers.values(),
+                                              key=lambda layer: layer[0] or -1,
+                                              reverse=True)[:args.top]:
+            if len(tags) > 3:
+                shared_by = f"{len(tags)} images"
+            else:
+                shared_by = ", ".join(sorted(tags))
+            table.add_row([
+                "unknown" if size is None else bytes_to_human(size), shared_by,
+                "unknown" if instruction is None else
+                self.format_instruction(instruction)
+            ])
+        print(f"Biggest {min(args.top, len(layers))} layers:")
+        print(table)
+
+
+class NturtDockerImageCacheList(Command):
+    """
+    Command to list build caches
+    """
+
+    HEADER = ["image", "last used", "size"]
+
+    @property
+    def name(self):
+        return "list"
+
+    @property
+    def help(self):
+        return "list build caches of images and their sizes"
+
+    def build_parser(self, parser):
+        parser.add_argument(
+            "-d",
+            "--dir",
+            help=f"build cache directory, default to {BUILD_CACHE_DIR}",
+            metavar="DIR",
+            default=BUILD_CACHE_DIR)
+
+    def execute(self, args):
+        import prettytable
+
+        table = prettytable.PrettyTable()
+        table.field_names = self.HEADER
+        table.align["size"] = "r"
+
+        caches = list_build_caches(args.dir)
+        now = datetime.now()
+        for directory, size, last_used in reversed(caches):
+            table.add_row([
+                os.path.basename(directory),
+                timedelta_to_human(now - datetime.fromtimestamp(last_used)) +
+                " ago",
+                bytes_to_human(size)
+            ])
+        print(table)
+        print(f"Total: {bytes_to_human(sum(cache[1] for cache in caches))} "
+              f"in {args.dir}")
+
+
+class NturtDockerImageCacheTrim(Command):
+    """
+    Command to trim build cache directory to a size budget
+    """
+
+    @property
+    def name(self):
+        return "trim"
+
+    @property
+    def help(self):
+        return "remove least recently used build caches to fit a size budget"
+
+    def build_parser(self, parser):
+        parser.add_argument("budget",
+                            help="size budget of build caches, e.g. 10GB",
+                            metavar="SIZE",
+                            type=human_to_bytes)
+        parser.add_argument(
+            "-d",
+            "--dir",
+            help=f"build cache directory, default to {BUILD_CACHE_DIR}",
+            metavar="DIR",
+            default=BUILD_CACHE_DIR)
+        parser.add_argument("-n",
+                            "--dry-run",
+                            help="only print build caches to remove",
+                            action="store_true")
+
+    def execute(self, args):
+        import shutil
+
+        caches = list_build_caches(args.dir)
+        total = sum(cache[1] for cache in caches)
+        freed = 0
+        for directory, size, _ in caches:
+            if total - freed <= args.budget:
+                break
+            print(f"{'Would remove' if args.dry_run else 'Removing'} "
+                  f"{os.path.basename(directory)} ({bytes_to_human(size)})")
+            if not args.dry_run:
+                shutil.rmtree(directory)
+            freed += size
+
+        print(f"{bytes_to_human(freed)} "
+              f"{'would be freed' if args.dry_run else 'freed'}, "
+              f"{bytes_to_human(total - freed)} of "
+              f"{bytes_to_human(args.budget)} budget used")
+
+
+class NturtDockerImageCache(MetaCommand):
+    """
+    Meta command for build cache related sub-commands
+    """
+
+    @property
+    def name(self):
+        return "cache"
+
+    @property
+    def help(self):
+        return "manage build cache exported by image build --cache-to"
+
+    @property
+    def subcommands(self):
+        return [NturtDockerImageCacheList(), NturtDockerImageCacheTrim()]
+
+
+class NturtDockerImageExport(ImageSelectCommand):
+    """
+    Command to export nturt images as a zstd compressed archive, optionally
+    a delta bundle of layers missing on the target
+    """
+
+    # size of blocks read from streams
+    BLOCK_SIZE = 1024 * 1024
+    # files of archives saved by docker listing the images in them
+    INDEX_FILES = ["index.json", "manifest.json", "oci-layout", "repositories"]
+
+    @property
+    def name(self):
+        return "export"
+
+    @property
+    def help(self):
+        return "export nturt images as a zstd compressed archive"
+
+    def build_parser(self, parser):
+        super().build_parser(parser)
+        parser.add_argument(
+            "-o",
+            "--output",
+            help="path to write the archive to, \"-\" for stdout",
+            metavar="PATH",
+            required=True)
+        parser.add_argument(
+            "--chunk-size",
+            help=
+            "split the archive into chunks of SIZE, e.g. 1GB, written to PATH.000, PATH.001, ... with an index PATH.json",
+            metavar="SIZE",
+            type=human_to_bytes)
+        parser.add_argument(
+            "--resume",
+            help=
+            "resume an interrupted chunked export, chunks written before are verified instead of rewritten",
+            action="store_true")
+        parser.add_argument(
+            "--have",
+            help=
+            "manifest of layers the target already has, written by \"image manifest\" on it, to only export missing layers",
+            metavar="MANIFEST")
+        parser.add_argument("-l",
+                            "--level",
+                            help="zstd compression level, default to 3",
+                            type=int,
+                            default=3)
+
+    def skipped_layers(self, images: list[str], manifest: str) -> set[str]:
+        """
+        Find layers of images the target already has
+
+        Parameters
+        ----------
+        images (list): images to export
+        manifest (str): path to manifest of layers the target has
+
+        Returns
+        -------
+        set: diff ids of layers not to export
+        """
+        with open(manifest, "r") as f:
+            have = set(json.load(f)["layers"])
+
+        # a layer is only loaded from the archive if the target does not have
+        # it on top of the same layers, so chain ids are compared
+        layers, needed = set(), set()
+        for image in images:
+            diff_ids = docker_client().api.inspect_image(
+                image)["RootFS"]["Layers"]
+            for diff_id, chain_id in zip(diff_ids, chain_ids(diff_ids)):
+                layers.add(diff_id)
+                if chain_id not in have:
+                    needed.add(diff_id)
+        return layers - needed
+
+    def merge_index(self, name: str, contents: list):
+        """
+        Merge an index file of archives of single images into the one of an
+        archive of all of them
+
+        Parameters
+        ----------
+        name (str): name of the index file, one of INDEX_FILES
+        contents (list): contents of the index file of every archive
+
+        Returns
+        -------
+        list | dict: merged content
+        """
+        if name == "manifest.json":
+            return sum(contents, [])
+        if name == "index.json":
+            return dict(contents[0],
+                        manifests=sum((content.get("manifests", [])
+                                       for content in contents), []))
+        if name == "repositories":
+            # images of one repository, e.g. all nturt images, are in every
+            # archive with their own tags
+            merged = {}
+            for content in contents:
+                for repository, tags in content.items():
+                    merged.setdefault(repository, {}).update(tags)
+            return merged
+        return contents[0]
+
+    def merge_archive(self, chunks: Iterator[bytes], bundle, written: set[str],
+                      indexes: dict[str, list], skipped: set[str]) -> None:
+        """
+        Merge an archive of a single image into the archive being exported
+
+        Parameters
+        ----------
+        chunks (Iterator): chunks of the archive of the image
+        bundle (tarfile.TarFile): archive being exported
+        written (set): names of members already in the archive being exported
+        indexes (dict): name of index file -> contents of it in every archive
+        skipped (set): diff ids of layers to leave out
+        """
+        import tarfile
+
+        with tarfile.open(fileobj=IteratorReader(chunks), mode="r|") as source:
+            for member in source:
+                if skipped and member.name.endswith("/layer.tar"):
+                    raise RuntimeError("delta bundles need docker 25 or newer "
+                                       "saving images in oci layout")
+                if member.name in self.INDEX_FILES:
+                    indexes.setdefault(member.name, []).append(
+                        json.load(source.extractfile(member)))
+                    continue
+                if member.name in written:
+                    continue
+                written.add(member.name)
+                digest = "sha256:" + member.name.rpartition("/")[2]
+                if member.name.startswith(
+                        "blobs/sha256/") and digest in skipped:
+                    self.skipped_size += member.size
+                    continue
+                bundle.addfile(
+                    member,
+                    source.extractfile(member) if member.isfile() else None)
+
+    def save(self, images: list[str], skipped: set[str], output) -> None:
+        """
+        Save images from docker daemon to output, leaving out skipped layers,
+        run in its own thread
+
+        Parameters
+        ----------
+        images (list): images to save
+        skipped (set): diff ids of layers to leave out
+        output (BinaryIO): stream to write the archive to
+        """
+        import io
+        import tarfile
+
+        api = docker_client().api
+        try:
+            if len(images) == 1 and not skipped:
+                for chunk in api.get_image(images[0], self.BLOCK_SIZE):
+                    output.write(chunk)
+                return
+
+            # docker-py saves a single image per archive, so archives of the
+            # images are merged, storing layers they share once. Images are
+            # saved in oci layout where layers are blobs named by their diff
+            # ids, and docker load skips layers it already has before looking
+            # for them in the archive.
+            written = set()
+            indexes = {}
+            with tarfile.open(fileobj=output, mode="w|") as bundle:
+                for image in images:
+                    chunks = api.get_image(image, self.BLOCK_SIZE)
+                    self.merge_archive(chunks, bundle, written, indexes,
+                                       skipped)
+                    # tar ends before the padding of the archive
+                    for _ in chunks:
+                        pass
+
+                for name, contents in indexes.items():
+                    data = json.dumps(self.merge_index(name,
+                                                       contents)).encode()
+                    info = tarfile.TarInfo(name)
+                    info.size = len(data)
+                    info.mtime = int(time.time())
+                    bundle.addfile(info, io.BytesIO(data))
+        except Exception as error:
+            self.error = error
+        finally:
+            try:
+                output.close()
+            except BrokenPipeError:
+                pass
 
     def execute(self, args):
-        compose_file = yaml.load(open(
-            os.path.join(DOCKER_COMPOSE_DIR, args.mode, "docker-compose.yaml"),
-            "r"),
-                                 Loader=yaml.FullLoader)
-        compose_file["services"]["container"]["image"] = args.image
-        compose_file["services"]["container"]["hostname"] = args.image.split(
-            ":")[1]
-        compose_file["services"]["container"]["container_name"] = args.name
-
-        if args.mode in ROOT_COMPOSE_FILES:
-            compose_file["services"]["container"]["volumes"][
-                -1] = os.path.join(PACKAGE_DIR, args.name) + ":/root/ws/src"
+        import shutil
+
+        selected = self.select(args)
+        # progress goes to stderr when the archive is written to stdout
+        log = sys.stderr if args.output == "-" else sys.stdout
+        if shutil.which("zstd") is None:
+            print("ERROR: zstd is not installed", file=log)
+            exit(1)
+        if args.resume and not args.chunk_size:
+            print("ERROR: only chunked exports can be resumed", file=log)
+            exit(1)
+        missing = [
+            image for image in selected if resolve_image_id(image) == image
+        ]
+        if missing:
+            print(f"ERROR: images not available locally: {', '.join(missing)}",
+                  file=log)
+            exit(1)
+
+        skipped = set()
+        if args.have:
+            skipped = self.skipped_layers(selected, args.have)
+
+        if args.output == "-":
+            writer = sys.stdout.buffer
+        elif args.chunk_size:
+            try:
+                writer = ChunkedWriter(args.output, args.chunk_size,
+                                       args.resume)
+            except ValueError as error:
+                print(f"ERROR: {error_message(error)}", file=log)
+                exit(1)
+        else:
+            writer = open(args.output, "wb")
+
+        print(f"Exporting {', '.join(selected)}...", file=log, flush=True)
+        start = time.monotonic()
+        self.error = None
+        self.skipped_size = 0
+        zstd = subprocess.Popen(["zstd", "-q", f"-{args.level}", "-T0", "-c"],
+                                stdin=subprocess.PIPE,
+                                stdout=subprocess.PIPE)
+        saver = threading.Thread(target=self.save,
+                                 args=(selected, skipped, zstd.stdin))
+        saver.start()
+        written = 0
+        try:
+            for block in iter(lambda: zstd.stdout.read(self.BLOCK_SIZE), b""):
+                writer.write(block)
+                written += len(block)
+        except Exception as error:
+            zstd.kill()
+            self.error = self.error or error
+        saver.join()
+        zstd.wait()
+        if self.error is None and zstd.returncode != 0:
+            self.error = RuntimeError("zstd failed")
+        if self.error is not None:
+            print(f"ERROR: failed to export: {error_message(self.error)}",
+                  file=log)
+            exit(1)
+        if writer is sys.stdout.buffer:
+            writer.flush()
         else:
-            compose_file["services"][
-                "container"]["volumes"][-1] = os.path.join(
-                    PACKAGE_DIR, args.name) + ":/home/docker/ws/src"
+            writer.close()
+        elapsed = time.monotonic() - start
+
+        summary = f"Exported {bytes_to_human(written)} in {elapsed:.1f}s"
+        if skipped:
+            summary += (f", {bytes_to_human(self.skipped_size)} of layers "
+                        "the target has left out")
+        print(summary, file=log)
+        if isinstance(writer, ChunkedWriter):
+            summary = f"{len(writer.chunks)} chunks written to {args.output}.*"
+            if writer.reused:
+                summary += f", {writer.reused} verified from previous export"
+            print(summary, file=log)
+
+
+class NturtDockerImageImport(Command):
+    """
+    Command to import images exported by image export
+    """
 
-        if not os.path.exists(os.path.join(PACKAGE_DIR, args.name)):
-            os.makedirs(os.path.join(PACKAGE_DIR, args.name))
+    @property
+    def name(self):
+        return "import"
 
-        # create a temporary directory to store compose file
-        with tempfile.TemporaryDirectory() as tmp_dir:
-            with open(os.path.join(tmp_dir, "docker-compose.yaml"), "w") as f:
-                yaml.dump(compose_file, f)
-            subprocess.run(["docker", "compose", "up", "-d"], cwd=tmp_dir)
+    @property
+    def help(self):
+        return "import images exported by image export"
 
+    def build_parser(self, parser):
+        parser.add_argument(
+            "path",
+            help=
+            "path to the archive, or PATH of a chunked export, \"-\" for stdin",
+            metavar="PATH")
 
-class NturtDockerContainerList(Command):
+    def read(self, path: str) -> Iterator[bytes]:
+        """
+        Read blocks of an exported archive, chunked or not
+
+        Parameters
+        ----------
+        path (str): path to the archive
+
+        Returns
+        -------
+        Iterator: blocks of the archive
+        """
+        block_size = NturtDockerImageExport.BLOCK_SIZE
+        if path == "-":
+            yield from iter(lambda: sys.stdin.buffer.read(block_size), b"")
+        elif os.path.isfile(path):
+            with open(path, "rb") as f:
+                yield from iter(lambda: f.read(block_size), b"")
+        else:
+            for chunk in self.chunks:
+                with open(os.path.join(os.path.dirname(path), chunk["name"]),
+                          "rb") as f:
+                    yield from iter(lambda: f.read(block_size), b"")
+
+    def verify(self, path: str) -> list[dict]:
+        """
+        Verify chunks of a chunked export against its index before loading,
+        since docker load can not be undone halfway
+
+        Parameters
+        ----------
+        path (str): PATH of the chunked export
+
+        Returns
+        -------
+        list: chunks in the index
+        """
+        import hashlib
+
+        with open(path + ".json", "r") as f:
+            index = json.load(f)
+        if not index["complete"]:
+            print(f"ERROR: export to {path} is incomplete, "
+                  "resume it by \"image export --resume\"")
+            exit(1)
+
+        for chunk in index["chunks"]:
+            chunk_path = os.path.join(os.path.dirname(path), chunk["name"])
+            if not os.path.exists(chunk_path):
+                print(f"ERROR: chunk {chunk['name']} is missing")
+                exit(1)
+            digest = hashlib.sha256()
+            with open(chunk_path, "rb") as f:
+                for block in iter(lambda: f.read(1024 * 1024), b""):
+                    digest.update(block)
+            if digest.hexdigest() != chunk["sha256"]:
+                print(f"ERROR: chunk {chunk['name']} is corrupted")
+                exit(1)
+        return index["chunks"]
+
+    def feed(self, path: str, output) -> None:
+        """
+        Feed the archive to output, run in its own thread
+
+        Parameters
+        ----------
+        path (str): path to the archive
+        output (BinaryIO): stream to write the archive to
+        """
+        try:
+            for block in self.read(path):
+                output.write(block)
+        except Exception as error:
+            self.error = error
+        finally:
+            try:
+                output.close()
+            except BrokenPipeError:
+                pass
+
+    def execute(self, args):
+        import shutil
+
+        if shutil.which("zstd") is None:
+            print("ERROR: zstd is not installed")
+            exit(1)
+        if (args.path != "-" and not os.path.isfile(args.path)
+                and not os.path.isfile(args.path + ".json")):
+            print(f"ERROR: {args.path} does not exist")
+            exit(1)
+        if args.path != "-" and not os.path.isfile(args.path):
+            self.chunks = self.verify(args.path)
+
+        start = time.monotonic()
+        self.error = None
+        zstd = subprocess.Popen(["zstd", "-q", "-d", "-c"],
+                                stdin=subprocess.PIPE,
+                                stdout=subprocess.PIPE)
+        feeder = threading.Thread(target=self.feed,
+                                  args=(args.path, zstd.stdin))
+        feeder.start()
+
+        # the decompressed archive is streamed to docker daemon as it comes
+        block_size = NturtDockerImageExport.BLOCK_SIZE
+        errors = []
+        try:
+            for message in docker_client().api.load_image(
+                    iter(lambda: zstd.stdout.read(block_size), b"")):
+                if "error" in message:
+                    errors.append(message["error"])
+                elif message.get("stream", "").strip():
+                    print(message["stream"].strip())
+        except Exception as error:
+            zstd.kill()
+            errors.append(error_message(error))
+        feeder.join()
+        zstd.wait()
+        if self.error is not None:
+            errors.append(error_message(self.error))
+        elif zstd.returncode != 0 and not errors:
+            errors.append("zstd failed to decompress the archive")
+        invalidate_completion_cache()
+
+        for error in errors:
+            print(f"ERROR: failed to import: {error}")
+        if errors:
+            exit(1)
+        print(f"Imported in {time.monotonic() - start:.1f}s")
+
+
+class NturtDockerImageManifest(Command):
+    """
+    Command to write manifest of layers of local images
+    """
+
+    @property
+    def name(self):
+        return "manifest"
+
+    @property
+    def help(self):
+        return "write manifest of layers of local images for image export --have"
+
+    def build_parser(self, parser):
+        parser.add_argument(
+            "-o",
+            "--output",
+            help="path to write the manifest to, default to stdout",
+            metavar="PATH",
+            default="-")
+
+    def execute(self, args):
+        api = docker_client().api
+        layers = set()
+        for _, diff_ids, error, _ in run_concurrently(
+                lambda image_id: api.inspect_image(image_id)["RootFS"]
+            ["Layers"], [image["Id"] for image in api.images()], DEFAULT_JOBS):
+            # images removed meanwhile are left out
+            if error is None:
+                layers.update(chain_ids(diff_ids))
+
+        manifest = json.dumps({"layers": sorted(layers)}, indent=2)
+        if args.output == "-":
+            print(manifest)
+        else:
+            with open(args.output, "w") as f:
+                f.write(manifest + "\n")
+
+
+class NturtDockerImageList(Command):
     """
-    Command to list containers
+    Command to list nturt images
     """
 
-    HEADER = ["name", "image", "created", "status"]
+    HEADER = ["name", "tag", "created", "size"]
 
     @property
     def name(self):
@@ -536,24 +5066,50 @@ class NturtDockerContainerList(Command):
 
     @property
     def help(self):
-        return "list containers"
+        return "list availiable nturt images"
 
     def build_parser(self, parser):
-        pass
+        murex_group = parser.add_mutually_exclusive_group()
+        murex_group.add_argument("-i",
+                                 "--images",
+                                 help="list distros of specified image",
+                                 metavar="IMAGES",
+                                 choices=AVAILABLE_IMAGES,
+                                 nargs="+")
+        murex_group.add_argument("-s",
+                                 "--system",
+                                 help="list system images",
+                                 action="store_true")
 
     def execute(self, args):
+        import prettytable
+
         table = prettytable.PrettyTable()
         table.field_names = self.HEADER
 
-        contains = list_sys_containers()
-        for container in contains:
-            table.add_row(container.to_str_array())
+        # list system images
+        if args.system:
+            for image in inventory().images:
+                table.add_row(image.to_str_array())
+            print(table)
+            exit(0)
+
+        if args.images:
+            image_names = args.images
+        else:
+            image_names = AVAILABLE_IMAGES
+
+        nturt_images = list_nturt_images(image_names)
+
+        # list nturt images
+        for image in nturt_images:
+            table.add_row(image.to_str_array())
         print(table)
 
 
-class NturtDockerContainerRemove(Command):
+class NturtDockerImageRemove(Command):
     """
-    Command to remove containers
+    Command to remove nturt images
     """
 
     @property
@@ -562,314 +5118,924 @@ class NturtDockerContainerRemove(Command):
 
     @property
     def help(self):
-        return "remove containers"
+        return "remove nturt images"
 
     def build_parser(self, parser):
-        containers = list_sys_containers()
-        parser.add_argument(
-            "containers",
-            help="containers to remove",
-            metavar="CONTAINERS",
-            choices=[container.name for container in containers],
-            nargs="+")
-        parser.add_argument(
-            "-f",
-            "--force",
-            help="force remove containers even if it's running",
-            action="store_true")
+        parser.add_argument("images",
+                            help="images to remove",
+                            metavar="IMAGES",
+                            choices=LazyChoices(list_nturt_image_tags),
+                            nargs="+")
 
     def execute(self, args):
-        if not args.force:
-            for container in args.containers:
-                if DOCKER_CLIENT.containers.get(container).status == "running":
-                    print(f"ERROR: container {container} is running")
-                    exit(1)
-        for container in args.containers:
-            print(f"Removing container {container}...")
-            DOCKER_CLIENT.containers.get(container).remove(force=args.force)
+        for image in args.images:
+            docker_client().images.remove(image=image, force=True)
+        invalidate_completion_cache()
 
 
-class NturtDockerContainerShell(Command):
+class NturtDockerImage(MetaCommand):
     """
-    Command to attach shell into container
+    Meta command for image related sub-commands
     """
 
     @property
     def name(self):
-        return "shell"
+        return "image"
 
     @property
     def help(self):
-        return "attach shell into container"
-
-    def build_parser(self, parser):
-        containers = list_sys_containers()
-        parser.add_argument(
-            "container",
-            help="container to shell into",
-            metavar="CONTAINER",
-            choices=[container.name for container in containers])
-        parser.add_argument("-s",
-                            "--shell",
-                            help="shell to use, defualt to bash",
-                            default="bash")
+        return "Various image related sub-commands"
 
-    def execute(self, args):
-        container = DOCKER_CLIENT.containers.get(args.container)
-        if container.status != "running":
-            print("Container is not running, starting it...")
-            container.start()
-        subprocess.run(["docker", "exec", "-it", args.container, args.shell])
+    @property
+    def subcommands(self):
+        return [
+            NturtDockerImageAnalyze(),
+            NturtDockerImageBuild(),
+            NturtDockerImageCache(),
+            NturtDockerImageExport(),
+            NturtDockerImageImport(),
+            NturtDockerImageList(),
+            NturtDockerImageManifest(),
+            NturtDockerImagePull(),
+            NturtDockerImageRemove()
+        ]
 
 
-class NturtDockerContainerStart(Command):
+# cache commands ###############################################################
+class NturtDockerCacheClear(Command):
     """
-    Command to start containers
+    Command to clear completion cache
     """
 
     @property
     def name(self):
-        return "start"
+        return "clear"
 
     @property
     def help(self):
-        return "start containers"
+        return "clear completion cache"
 
     def build_parser(self, parser):
-        containers = list_sys_containers()
-        parser.add_argument("containers",
-                            help="container to start",
-                            metavar="CONTAINERS",
-                            choices=[
-                                container.name for container in containers
-                                if container.status == "exited"
-                            ],
-                            nargs="+")
+        pass
 
     def execute(self, args):
-        for container in args.containers:
-            print(f"Starting container {container}...")
-            DOCKER_CLIENT.containers.get(container).start()
+        invalidate_completion_cache()
 
 
-class NturtDockerContainerStop(Command):
+class NturtDockerCacheRefresh(Command):
     """
-    Command to stop containers
+    Command to refresh completion cache
     """
 
+    # docker events that change the completion cache
+    EVENTS = [
+        "create", "destroy", "die", "pause", "rename", "restart", "start",
+        "stop", "unpause"
+    ]
+
     @property
     def name(self):
-        return "stop"
+        return "refresh"
 
     @property
     def help(self):
-        return "stop containers"
+        return "refresh completion cache"
 
     def build_parser(self, parser):
-        containers = list_sys_containers()
-        parser.add_argument("containers",
-                            help="container to shell into",
-                            metavar="CONTAINERs",
-                            choices=[
-                                container.name for container in containers
-                                if container.status == "running"
-                            ],
-                            nargs="+")
+        parser.add_argument(
+            "-w",
+            "--watch",
+            help=
+            "keep completion cache warm by refreshing it on docker events until interrupted",
+            action="store_true")
 
-    def execute(self, args):
-        for container in args.containers:
-            print(f"Stopping container {container}...")
-            DOCKER_CLIENT.containers.get(container).stop()
+    def __init__(self):
+        """
+        Constructor
+        """
+        # refreshed by both events and keep alive threads with --watch
+        self.lock = threading.Lock()
 
+    def refresh(self) -> None:
+        """
+        Rebuild completion cache from docker daemon
+        """
+        with self.lock:
+            inventory.cache_clear()
+            write_completion_cache(build_completion_cache())
 
-class NturtDockerContainer(MetaCommand):
+    def keep_alive(self) -> None:
+        """
+        Touch completion cache periodically so that it does not go stale while
+        nothing changes
+        """
+        while True:
+            time.sleep(COMPLETION_CACHE_TTL / 2)
+            try:
+                os.utime(COMPLETION_CACHE_FILE)
+            except FileNotFoundError:
+                # removed by commands changing containers
+                self.refresh()
+
+    def execute(self, args):
+        if not args.watch:
+            self.refresh()
+            return
+
+        # subscribe before the initial refresh so that no event is missed
+        events = docker_client().events(decode=True,
+                                        filters={
+                                            "type": "container",
+                                            "event": self.EVENTS
+                                        })
+        self.refresh()
+        threading.Thread(target=self.keep_alive, daemon=True).start()
+        try:
+            for _ in events:
+                self.refresh()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            events.close()
+
+
+class NturtDockerCache(MetaCommand):
     """
-    Meta command for container related sub-commands
+    Meta command for completion cache related sub-commands
     """
 
     @property
     def name(self):
-        return "container"
+        return "cache"
 
     @property
     def help(self):
-        return "Various container related sub-commands"
+        return "Various completion cache related sub-commands"
 
     @property
     def subcommands(self):
-        return [
-            NturtDockerContainerCreate(),
-            NturtDockerContainerList(),
-            NturtDockerContainerRemove(),
-            NturtDockerContainerShell(),
-            NturtDockerContainerStart(),
-            NturtDockerContainerStop()
-        ]
+        return [NturtDockerCacheClear(), NturtDockerCacheRefresh()]
 
 
-# image commands ###############################################################
-class NturtDockerImageBuild(Command):
+# gc commands ##################################################################
+class NturtDockerGc(Command):
     """
-    Command to build nturt images
+    Command to remove least recently used nturt containers, images and build
+    cache until docker disk usage fits a budget
     """
 
+    # statuses of containers that can be removed
+    REMOVABLE_STATUS = ["created", "exited", "dead"]
+
+    # printed when the budget can not be met
+    OVER_BUDGET_WARNING = (
+        "WARNING: nothing more can be removed without removing running "
+        "containers, images in use or non-nturt images")
+
     @property
     def name(self):
-        return "build"
+        return "gc"
 
     @property
     def help(self):
-        return "build nturt images natively"
+        return "remove least recently used nturt containers, images and build cache to fit a disk budget"
 
     def build_parser(self, parser):
-        images = list_nturt_images()
-        parser.add_argument(
-            "image",
-            help="image to build",
-            metavar="IMAGE",
-            choices=[f"{image.name}:{image.tag}" for image in images])
-        parser.add_argument(
-            "--cache",
-            help="use cache when building image, default to not use cache",
-            action="store_true")
-        parser.add_argument(
-            "-f",
-            "--force",
-            help="force build if image already exists and remove it",
-            action="store_true")
+        parser.add_argument("-b",
+                            "--budget",
+                            help="disk usage budget of docker, e.g. 10GB",
+                            metavar="SIZE",
+                            type=human_to_bytes,
+                            required=True)
+        parser.add_argument("-n",
+                            "--dry-run",
+                            help="only print what would be removed",
+                            action="store_true")
         parser.add_argument(
-            "--not-pull",
+            "-j",
+            "--jobs",
             help=
-            "do not attempt to pull new base image if any, default to attempt to pull new base image",
-            action="store_true")
-
-    def execute(self, args):
-        for image in list_sys_images():
-            if image.name == args.image.split(
-                    ":")[0] and image.tag == args.image.split(":")[1]:
-                if args.force:
-                    DOCKER_CLIENT.images.remove(
-                        image=f"{image.name}:{image.tag}", force=True)
-                else:
-                    print(
-                        f"ERROR: image {image.name}:{image.tag} already exists"
-                    )
-                    exit(1)
-
-        cmd = ["docker", "build"]
+            f"number of objects to remove concurrently, default to {DEFAULT_JOBS}",
+            type=int,
+            default=DEFAULT_JOBS)
 
-        if not args.cache:
-            cmd.append("--no-cache")
-        if not args.not_pull:
-            cmd.append("--pull")
+    def plan(self, df: dict,
+             excess: int) -> list[tuple[str, str, str, datetime, int]]:
+        """
+        Plan removal of least recently used nturt containers and images, i.e.
+        containers of nturt images that are not running, and nturt or
+        dangling images not used by running containers
 
-        cmd.extend(["--tag", args.image, "."])
+        Parameters
+        ----------
+        df (dict): disk usage returned by docker daemon
+        excess (int): bytes to free
 
-        entry_name, tag = args.image.split(":")
-        _, name = entry_name.split("/")
-        target, distro = tag.split("-")
+        Returns
+        -------
+        list: list of (kind, id, name, last used, size in bytes) to remove in
+            the order of removal
+        """
+        images = {}
+        for summary in df["Images"]:
+            tags = [
+                tag for tag in summary.get("RepoTags") or []
+                if tag != "<none>:<none>"
+            ]
+            if not tags or any(
+                    tag.startswith(IMAGE_ENTRY + "/") for tag in tags):
+                images[summary["Id"]] = (summary, tags)
+
+        # containers by their image, containers of other images are left alone
+        image_containers = {}
+        for summary in df["Containers"]:
+            if summary["ImageID"] in images:
+                image_containers.setdefault(summary["ImageID"],
+                                            []).append(summary)
+
+        # exited containers are used last when they exited
+        containers = {}
+        sizes = {}
+        for summary in sum(image_containers.values(), []):
+            if summary["State"] in self.REMOVABLE_STATUS:
+                containers[summary["Id"]] = Container().from_summary(summary)
+                sizes[summary["Id"]] = summary.get("SizeRw") or 0
+        for container, _, error, _ in run_concurrently(
+                lambda container: container.inspect(), containers.values(),
+                DEFAULT_JOBS):
+            if error:
+                print(f"ERROR: failed to inspect {container.name}: "
+                      f"{error_message(error)}")
+                exit(1)
+
+        # id -> (kind, id, name, last used, size), and ids of containers of
+        # images that must be removed before them
+        candidates = {}
+        users = {}
+        for container in containers.values():
+            candidates[container.id] = ("container", container.id,
+                                        container.name, container.exited
+                                        or container.created,
+                                        sizes[container.id])
+        for image_id, (summary, tags) in images.items():
+            image_users = [
+                user["Id"] for user in image_containers.get(image_id, [])
+            ]
+            # images of running containers are in use
+            if any(user not in containers for user in image_users):
+                continue
+            size = summary["Size"]
+            if summary.get("SharedSize", -1) > 0:
+                size -= summary["SharedSize"]
+            if not size:
+                continue
+            candidates[image_id] = ("image", image_id, ", ".join(tags)
+                                    or image_id[7:19],
+                                    parse_docker_time(summary["Created"]),
+                                    size)
+            users[image_id] = image_users
+            self.image_tags[image_id] = tags
+
+        # an image is removed with its containers even if they are used later
+        planned = {}
+        freed = 0
+        for id in sorted(candidates, key=lambda id: candidates[id][3]):
+            if freed >= excess:
+                break
+            for planning in users.get(id, []) + [id]:
+                if planning not in planned:
+                    planned[planning] = candidates[planning]
+                    freed += candidates[planning][4]
+
+        # containers go first so that their images can be removed
+        return sorted(planned.values(),
+                      key=lambda item: item[0] != "container")
+
+    def remove(self, item: tuple[str, str, str, datetime, int]) -> None:
+        """
+        Remove a planned container or image, called concurrently from worker
+        threads
 
-        image_dir = os.path.join(DOCKERFILE_DIR, name, target, distro)
-        subprocess.run(cmd, cwd=image_dir)
+        Parameters
+        ----------
+        item (tuple): (kind, id, name, last used, size in bytes)
+        """
+        kind, id, _, _, _ = item
+        api = docker_client().api
+        if kind == "container":
+            api.remove_container(id)
+        elif self.image_tags[id]:
+            # removing the last tag removes the image
+            for tag in self.image_tags[id]:
+                api.remove_image(tag)
+        else:
+            api.remove_image(id)
 
+    def execute(self, args):
+        import prettytable
+
+        # images sharing all their layers free nothing until the images they
+        # share with are removed, so removal is planned again until the budget
+        # is met or nothing more can be removed
+        errors = []
+        initial_usage = None
+        previous_usage = None
+        while True:
+            df = docker_client().api.df()
+            build_cache = sum(record["Size"]
+                              for record in df.get("BuildCache") or []
+                              if not record.get("Shared"))
+            usage = (df["LayersSize"] + sum(
+                summary.get("SizeRw") or 0
+                for summary in df["Containers"]) + build_cache)
+            excess = usage - args.budget
+            print(f"Docker disk usage: {bytes_to_human(usage)} of "
+                  f"{bytes_to_human(args.budget)} budget")
+            if initial_usage is None:
+                initial_usage = usage
+            if excess <= 0 or errors:
+                break
+            # e.g. build cache records in use are not pruned
+            if previous_usage is not None and usage >= previous_usage:
+                print(self.OVER_BUDGET_WARNING)
+                break
+            previous_usage = usage
+
+            self.image_tags = {}
+            planned = self.plan(df, excess)
+            freed = sum(item[4] for item in planned)
+            # build cache is pruned by the daemon in least recently used order
+            prune_cache = min(build_cache, max(0, excess - freed))
+            if not planned and not prune_cache:
+                print(self.OVER_BUDGET_WARNING)
+                break
+
+            table = prettytable.PrettyTable()
+            table.field_names = ["kind", "name", "last used", "size"]
+            table.align["name"] = "l"
+            table.align["size"] = "r"
+            now = datetime.now(timezone.utc)
+            for kind, _, name, last_used, size in sorted(
+                    planned, key=lambda item: item[3]):
+                table.add_row([
+                    kind, name,
+                    timedelta_to_human(now - last_used) + " ago",
+                    bytes_to_human(size)
+                ])
+            if prune_cache:
+                table.add_row(
+                    ["build cache", "", "",
+                     bytes_to_human(prune_cache)])
+            print(table)
 
-class NturtDockerImageList(Command):
+            if args.dry_run:
+                print(f"{bytes_to_human(freed + prune_cache)} would be freed, "
+                      f"more may be freed after removing them")
+                if freed + prune_cache < excess:
+                    print(self.OVER_BUDGET_WARNING)
+                return
+
+            for kind in ["container", "image"]:
+                for item, _, error, _ in run_concurrently(
+                        self.remove,
+                    [item for item in planned if item[0] == kind], args.jobs):
+                    if error:
+                        errors.append(f"failed to remove {item[0]} {item[2]}: "
+                                      f"{error_message(error)}")
+            if prune_cache:
+                docker_client().api.prune_builds(keep_storage=build_cache -
+                                                 prune_cache)
+            invalidate_completion_cache()
+
+        # measured instead of summing the plans, as not everything planned is
+        # always freed, e.g. build cache in use
+        print(f"{bytes_to_human(initial_usage - usage)} freed")
+        for error in errors:
+            print(f"ERROR: {error}")
+        if errors:
+            exit(1)
+
+
+# monitor commands #############################################################
+class NturtDockerMonitor(Command):
     """
-    Command to list nturt images
+    Command to serve container and image metrics in prometheus format
     """
 
-    HEADER = ["name", "tag", "created", "size"]
+    # docker events that change containers
+    EVENTS = [
+        "create", "destroy", "die", "pause", "rename", "restart", "start",
+        "stop", "unpause"
+    ]
+    # docker events that change images
+    IMAGE_EVENTS = ["delete", "import", "load", "pull", "tag", "untag"]
+
+    # (name, type, help, function of container state and now returning value
+    # or None if not available)
+    CONTAINER_METRICS = [
+        ("nturt_container_up", "gauge", "1 if the container is running",
+         lambda container, now: int(container["state"] == "running")),
+        ("nturt_container_uptime_seconds", "gauge",
+         "seconds since the container started", lambda container, now:
+         (now - container["started"]).total_seconds()
+         if container["started"] else None),
+        ("nturt_container_restart_count", "gauge",
+         "times the container is restarted by its restart policy",
+         lambda container, now: container["restarts"]),
+        ("nturt_container_cpu_percent", "gauge",
+         "cpu usage of the container in percentage of a single cpu",
+         lambda container, now: container["stats"].cpu_percent),
+        ("nturt_container_memory_usage_bytes", "gauge",
+         "memory usage of the container without reclaimable page cache",
+         lambda container, now: container["stats"].memory_usage),
+        ("nturt_container_memory_limit_bytes", "gauge",
+         "memory limit of the container",
+         lambda container, now: container["stats"].memory_limit),
+        ("nturt_container_network_receive_bytes_total", "counter",
+         "bytes received by the container",
+         lambda container, now: container["stats"].net_rx),
+        ("nturt_container_network_transmit_bytes_total", "counter",
+         "bytes transmitted by the container",
+         lambda container, now: container["stats"].net_tx),
+        ("nturt_container_block_read_bytes_total", "counter",
+         "bytes read from block devices by the container",
+         lambda container, now: container["stats"].block_read),
+        ("nturt_container_block_write_bytes_total", "counter",
+         "bytes written to block devices by the container",
+         lambda container, now: container["stats"].block_write),
+    ]
 
     @property
     def name(self):
-        return "list"
+        return "monitor"
 
     @property
     def help(self):
-        return "list availiable nturt images"
+        return "serve container and image metrics in prometheus format"
 
     def build_parser(self, parser):
-        murex_group = parser.add_mutually_exclusive_group()
-        murex_group.add_argument("-i",
-                                 "--images",
-                                 help="list distros of specified image",
-                                 metavar="IMAGES",
-                                 choices=AVAILABLE_IMAGES,
-                                 nargs="+")
-        murex_group.add_argument("-s",
-                                 "--system",
-                                 help="list system images",
-                                 action="store_true")
+        parser.add_argument(
+            "-l",
+            "--listen",
+            help="address to serve metrics on, default to 127.0.0.1:9324",
+            metavar="HOST:PORT",
+            default="127.0.0.1:9324")
 
-    def execute(self, args):
-        table = prettytable.PrettyTable()
-        table.field_names = self.HEADER
+    def track(self, container_id: str) -> None:
+        """
+        Update state of a container by inspecting it, and stream its stats if
+        it is running, called on startup and on its events
 
-        sys_images = list_sys_images()
+        Parameters
+        ----------
+        container_id (str): id of the container
+        """
+        try:
+            attrs = docker_client().api.inspect_container(container_id)
+        except Exception:
+            # removed before being inspected, its destroy event follows
+            return
+
+        with self.lock:
+            name = attrs["Name"].lstrip("/")
+            container = self.containers.setdefault(
+                container_id, {
+                    "stats": ContainerStats(name),
+                    "streaming": False
+                })
+            container["name"] = name
+            container["image"] = attrs["Config"]["Image"]
+            container["state"] = attrs["State"]["Status"]
+            container["restarts"] = attrs["RestartCount"]
+            running = container["state"] == "running"
+            if running:
+                container["started"] = parse_docker_time(
+                    attrs["State"]["StartedAt"])
+            else:
+                container["started"] = None
+            # stats restart from scratch every time the container starts
+            start_streaming = running and not container["streaming"]
+            if start_streaming or not running:
+                container["stats"] = ContainerStats(name)
+            if start_streaming:
+                container["streaming"] = True
+
+        if start_streaming:
+            threading.Thread(target=self.stream,
+                             args=(container_id, ),
+                             daemon=True).start()
+
+    def stream(self, container_id: str) -> None:
+        """
+        Stream stats of a container until it stops, run in its own thread
 
-        # list system images
-        if args.system:
-            for image in sys_images:
-                table.add_row(image.to_str_array())
-            print(table)
-            exit(0)
+        Parameters
+        ----------
+        container_id (str): id of the container
+        """
+        try:
+            for sample in container_stats_samples(container_id):
+                with self.lock:
+                    container = self.containers.get(container_id)
+                    if container is None:
+                        return
+                    container["stats"].feed(sample)
+        except Exception:
+            pass
+        finally:
+            with self.lock:
+                if container_id in self.containers:
+                    self.containers[container_id]["streaming"] = False
+
+    def refresh_images(self) -> None:
+        """
+        Update disk usage of images, called on startup and on image events
+        """
+        images = [(repo_tag, summary["Id"], summary["Size"])
+                  for summary in docker_client().api.images()
+                  for repo_tag in summary.get("RepoTags") or []
+                  if repo_tag != "<none>:<none>"]
+        with self.lock:
+            self.images = images
+
+    def subscribe(self) -> Iterator[dict]:
+        """
+        Subscribe to docker events that change containers or images
 
-        if args.images:
-            image_names = args.images
+        Returns
+        -------
+        Iterator: docker events stream
+        """
+        return docker_client().events(decode=True,
+                                      filters={
+                                          "type": ["container", "image"],
+                                          "event":
+                                          self.EVENTS + self.IMAGE_EVENTS
+                                      })
+
+    def sync(self) -> None:
+        """
+        List containers and images and track them, called on startup and when
+        events are subscribed again
+        """
+        self.refresh_images()
+        container_ids = [
+            summary["Id"]
+            for summary in docker_client().api.containers(all=True)
+        ]
+        with self.lock:
+            for container_id in set(self.containers) - set(container_ids):
+                del self.containers[container_id]
+        for _ in run_concurrently(self.track, container_ids, DEFAULT_JOBS):
+            pass
+        with self.lock:
+            self.connected = True
+
+    def disconnected(self) -> None:
+        """
+        Report that metrics are not kept up to date until subscribed again
+        """
+        with self.lock:
+            self.connected = False
+
+    def apply(self, event: dict) -> None:
+        """
+        Apply a docker event to the state
+
+        Parameters
+        ----------
+        event (dict): docker event
+        """
+        with self.lock:
+            self.events += 1
+        if event.get("Type") == "image":
+            self.refresh_images()
+        elif event["Action"] == "destroy":
+            with self.lock:
+                self.containers.pop(event["Actor"]["ID"], None)
         else:
-            image_names = AVAILABLE_IMAGES
+            self.track(event["Actor"]["ID"])
 
-        nturt_images = list_nturt_images(image_names)
+    def render(self) -> str:
+        """
+        Render metrics in prometheus text format from the state in memory, so
+        that scraping costs the same however many containers exist
 
-        # list nturt images
-        for image in nturt_images:
-            table.add_row(image.to_str_array())
-        print(table)
+        Returns
+        -------
+        str: metrics
+        """
 
+        def escape(value: str) -> str:
+            value = value.replace("\\", "\\\\").replace('"', '\\"')
+            return value.replace("\n", "\\n")
+
+        now = datetime.now(timezone.utc)
+        lines = []
+        with self.lock:
+            containers = [
+                dict(container) for container in self.containers.values()
+                if "name" in container
+            ]
+            images = list(self.images)
+            events = self.events
+            connected = self.connected
+
+        for name, type_, help_, value in self.CONTAINER_METRICS:
+            lines += [f"# HELP {name} {help_}", f"# TYPE {name} {type_}"]
+            for container in containers:
+                sample = value(container, now)
+                if sample is not None:
+                    lines.append(f'{name}{{name="{escape(container["name"])}",'
+                                 f'image="{escape(container["image"])}"}} '
+                                 f"{sample}")
+
+        lines += [
+            "# HELP nturt_image_size_bytes disk usage of the image including "
+            "layers shared with other images",
+            "# TYPE nturt_image_size_bytes gauge"
+        ]
+        for repo_tag, image_id, size in images:
+            lines.append(f'nturt_image_size_bytes{{image="{escape(repo_tag)}",'
+                         f'id="{image_id}"}} {size}')
+
+        lines += [
+            "# HELP nturt_monitor_events_total docker events applied",
+            "# TYPE nturt_monitor_events_total counter",
+            f"nturt_monitor_events_total {events}",
+            "# HELP nturt_monitor_connected 1 if metrics are kept up to date "
+            "by docker events, 0 while subscribing again",
+            "# TYPE nturt_monitor_connected gauge",
+            f"nturt_monitor_connected {int(connected)}",
+        ]
+        return "\n".join(lines) + "\n"
 
-class NturtDockerImageRemove(Command):
+    def execute(self, args):
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        host, _, port = args.listen.rpartition(":")
+        if not port.isdigit():
+            print(f"ERROR: invalid address \"{args.listen}\", "
+                  "expected HOST:PORT")
+            exit(1)
+
+        self.lock = threading.Lock()
+        self.containers = {}
+        self.images = []
+        self.events = 0
+        self.connected = False
+
+        # subscribe before listing so that no event is missed
+        events = self.subscribe()
+        self.sync()
+        threading.Thread(target=watch_events,
+                         args=(events, self.subscribe, self.apply, self.sync,
+                               self.disconnected),
+                         daemon=True).start()
+
+        monitor = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = monitor.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type",
+                                 "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        try:
+            server = ThreadingHTTPServer((host or "0.0.0.0", int(port)),
+                                         Handler)
+        except OSError as error:
+            print(f"ERROR: failed to listen on {args.listen}: "
+                  f"{error_message(error)}")
+            exit(1)
+
+        print(f"Serving metrics on http://{args.listen}/metrics")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            events.close()
+
+
+# serve commands ###############################################################
+class NturtDockerServe(Command):
     """
-    Command to remove nturt images
+    Command to serve containers and images kept up to date by docker events
+    to other invocations on a unix socket
     """
 
+    # docker events that change containers
+    EVENTS = [
+        "create", "destroy", "die", "pause", "rename", "start", "unpause"
+    ]
+    # docker events that change images
+    IMAGE_EVENTS = ["delete", "import", "load", "pull", "tag", "untag"]
+
     @property
     def name(self):
-        return "remove"
+        return "serve"
 
     @property
     def help(self):
-        return "remove nturt images"
+        return "serve containers and images to other commands to make them faster"
 
     def build_parser(self, parser):
-        images = list_nturt_images()
-        parser.add_argument(
-            "images",
-            help="images to remove",
-            metavar="IMAGES",
-            choices=[f"{image.name}:{image.tag}" for image in images],
-            nargs="+")
+        pass
 
-    def execute(self, args):
-        for image in args.images:
-            DOCKER_CLIENT.images.remove(image=image, force=True)
+    def subscribe(self) -> Iterator[dict]:
+        """
+        Subscribe to docker events that change containers or images
+
+        Returns
+        -------
+        Iterator: docker events stream
+        """
+        return docker_client().events(decode=True,
+                                      filters={
+                                          "type": ["container", "image"],
+                                          "event":
+                                          self.EVENTS + self.IMAGE_EVENTS
+                                      })
+
+    def sync(self) -> None:
+        """
+        List containers and images again, only containers that are new or
+        changed since last sync are inspected for their start and exit time.
+        Called with the lock held.
+        """
+        containers = {}
+        for summary in docker_client().api.containers(all=True):
+            container = Container().from_summary(summary)
+            known = self.containers.get(container.id)
+            if known is not None and known.status == container.status:
+                container.started = known.started
+                container.exited = known.exited
+            containers[container.id] = container
+
+        # status text like "Up 2 hours" of summaries goes stale while served
+        uninspected = [
+            container for container in containers.values()
+            if container.status in ["running", "exited"]
+            and not (container.started or container.exited)
+        ]
+        for _ in run_concurrently(lambda container: container.inspect(),
+                                  uninspected, DEFAULT_JOBS):
+            pass
 
+        self.containers = containers
+        self.images = docker_client().api.images()
+        self.responses = {}
+        self.stale = False
 
-class NturtDockerImage(MetaCommand):
-    """
-    Meta command for image related sub-commands
-    """
+    def apply(self, event: dict) -> None:
+        """
+        Apply a docker event to containers and images
 
-    @property
-    def name(self):
-        return "image"
+        Parameters
+        ----------
+        event (dict): docker event
+        """
+        with self.lock:
+            if event.get("Type") == "image":
+                self.images = docker_client().api.images()
+                self.responses.pop("images", None)
+            elif apply_container_event(self.containers, event):
+                self.responses.pop("containers", None)
+
+    def invalidate(self) -> None:
+        """
+        Sync on next request, called when events may have been missed, e.g.
+        when docker daemon restarts
+        """
+        with self.lock:
+            self.stale = True
 
-    @property
-    def help(self):
-        return "Various image related sub-commands"
+    def respond(self, request: dict) -> bytes:
+        """
+        Respond to a request from another invocation, responses are encoded
+        once until containers or images change
 
-    @property
-    def subcommands(self):
-        return [NturtDockerImageBuild(), NturtDockerImageList()]
+        Parameters
+        ----------
+        request (dict): request
+
+        Returns
+        -------
+        bytes: encoded response
+        """
+        if request.get("protocol") != SERVER_PROTOCOL:
+            return b'{"error": "protocol mismatch"}'
+        if request.get("docker_host") != os.environ.get("DOCKER_HOST", ""):
+            return b'{"error": "docker host mismatch"}'
+
+        name = request.get("request")
+        if name == "ping":
+            return b'{}'
+        with self.lock:
+            if name == "invalidate":
+                self.stale = True
+                return b'{}'
+            if name not in ["containers", "images"]:
+                return b'{"error": "unknown request"}'
+
+            if self.stale:
+                try:
+                    self.sync()
+                except Exception as error:
+                    return json.dumps({"error": error_message(error)}).encode()
+            if name not in self.responses:
+                if name == "containers":
+                    value = [
+                        container.to_dict()
+                        for container in self.containers.values()
+                    ]
+                else:
+                    value = self.images
+                response = json.dumps({name: value}, separators=(",", ":"))
+                self.responses[name] = response.encode()
+            return self.responses[name]
+
+    def execute(self, args):
+        import signal
+        import socket
+        import socketserver
+
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            try:
+                sock.connect(SERVER_SOCKET)
+                print(f"ERROR: server is already running on {SERVER_SOCKET}")
+                exit(1)
+            except FileNotFoundError:
+                pass
+            except ConnectionRefusedError:
+                # left by a server that did not exit cleanly
+                os.remove(SERVER_SOCKET)
+
+        self.lock = threading.Lock()
+        self.containers = {}
+        self.images = []
+        self.responses = {}
+        self.stale = True
+
+        # subscribe before listing so that no event is missed
+        events = self.subscribe()
+        self.sync()
+        threading.Thread(target=watch_events,
+                         args=(events, self.subscribe, self.apply,
+                               self.invalidate, self.invalidate),
+                         daemon=True).start()
+
+        serve = self
+
+        class Handler(socketserver.StreamRequestHandler):
+
+            def handle(self):
+                try:
+                    request = json.loads(self.rfile.readline())
+                except ValueError:
+                    return
+                self.wfile.write(serve.respond(request))
+
+        os.makedirs(os.path.dirname(SERVER_SOCKET), exist_ok=True)
+        # only the user may connect
+        umask = os.umask(0o077)
+        try:
+            server = socketserver.ThreadingUnixStreamServer(
+                SERVER_SOCKET, Handler)
+        finally:
+            os.umask(umask)
+        server.daemon_threads = True
+
+        print(
+            f"Serving {len(self.containers)} containers and "
+            f"{len(self.images)} images on {SERVER_SOCKET}",
+            flush=True)
+
+        # remove the socket also when stopped by e.g. systemd
+        def stop(signum, frame):
+            raise KeyboardInterrupt
+
+        signal.signal(signal.SIGTERM, stop)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            os.remove(SERVER_SOCKET)
 
 
 # pwd commands #################################################################
@@ -932,7 +6098,15 @@ class NturtDocker(Application, MetaCommand):
 
     @property
     def subcommands(self):
-        return [NturtDockerContainer(), NturtDockerImage(), NturtDockerPWD()]
+        return [
+            NturtDockerCache(),
+            NturtDockerContainer(),
+            NturtDockerGc(),
+            NturtDockerImage(),
+            NturtDockerMonitor(),
+            NturtDockerPWD(),
+            NturtDockerServe()
+        ]
 
 
 if __name__ == "__main__":